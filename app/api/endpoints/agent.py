@@ -1,18 +1,79 @@
+import asyncio
+import json
 from fastapi import APIRouter, HTTPException
+from app.core import admission, metrics
+from app.core.config import settings
+from app.db import vector_db
 from app.schemas.agent import ChatRequest, ChatResponse
-from app.services import agent_service
+from app.services import agent_service, semantic_cache
 
 router = APIRouter()
 
+_DEADLINE_DETAIL = f"The answer took longer than {settings.CHAT_TIMEOUT_SECONDS:g} seconds. Please try again."
+
 @router.post("/chat", response_model=ChatResponse)
-def chat_with_agent(request: ChatRequest):
+async def chat_with_agent(request: ChatRequest):
     """
     This endpoint receives a user query and returns the agent's response.
     """
     if not request.query or not request.session_id:
         raise HTTPException(status_code=400, detail="Query and session_id are required.")
 
-    # Call our agent service to get a response
-    response_text = agent_service.run_chat(request.session_id, request.query)
+    # Call our agent service to get a response, if a slot is free
+    async with admission.chat_limiter:
+        try:
+            response_text = await agent_service.run_chat(request.session_id, request.query, _search_filter(request))
+        except asyncio.TimeoutError:
+            metrics.REQUESTS_REJECTED.labels("chat", "deadline").inc()
+            raise HTTPException(status_code=504, detail=_DEADLINE_DETAIL)
     
-    return ChatResponse(response=response_text, session_id=request.session_id)
\ No newline at end of file
+    return ChatResponse(response=response_text, session_id=request.session_id)
+
+
+@router.post("/chat/stream")
+async def stream_chat_with_agent(request: ChatRequest):
+    """
+    Same as /chat, but streams tokens and tool events as Server-Sent Events.
+    """
+    if not request.query or not request.session_id:
+        raise HTTPException(status_code=400, detail="Query and session_id are required.")
+
+    # The slot is taken before the response starts, so overload is still a 429.
+    # The response releases it, even if the body is never streamed.
+    await admission.chat_limiter.acquire()
+
+    async def event_stream():
+        try:
+            async for event in agent_service.stream_chat(request.session_id, request.query, _search_filter(request)):
+                yield _sse(event["event"], event["data"])
+        except asyncio.TimeoutError:
+            metrics.REQUESTS_REJECTED.labels("chat", "deadline").inc()
+            yield _sse("error", {"detail": _DEADLINE_DETAIL})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return admission.AdmittedStreamingResponse(
+        admission.chat_limiter,
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _search_filter(request: ChatRequest):
+    return vector_db.build_search_filter(request.file_ids, request.uploaded_after, request.uploaded_before)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """
+    Hit ratio and latency saved by the semantic caches of this worker process.
+    """
+    return {
+        "retrieval": semantic_cache.retrieval_cache.stats(),
+        "chat": semantic_cache.chat_cache.stats(),
+    }
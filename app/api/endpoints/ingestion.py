@@ -1,80 +1,415 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import os
+import tarfile
 import uuid
+import zipfile
+import zlib
 
-from app.services import file_processor
-from app.db import vector_db, metadata_db
-from app.schemas.ingestion import UploadResponse
+from app.core import admission, metrics
+from app.core.config import settings
+from app.db import metadata_db, vector_db
+from app.services import archives, ingestion_worker, semantic_cache
+from app.schemas.ingestion import (
+    UploadResponse, JobStatusResponse, DeleteFileResponse, BulkUploadResponse, BatchStatusResponse, BatchJobStatus,
+    FileResponse, FileVersionResponse, ChunkResponse, IngestionStatsResponse,
+)
 
 router = APIRouter()
 
-def process_and_store_in_background(
-    file_name: str,
-    file_content: bytes,
-    file_type: str,
-    db: Session
-):
-    """The function that the background task will run."""
-    print(f"Background task started for {file_name}.")
-    
-    # Process the file to get Document objects --> using the default 'recursive' strategy.
-    documents = file_processor.process_file(
-        file_name=file_name,
-        file_content=file_content,
-        file_type=file_type,
-        chunk_strategy="recursive"
-    )
-
-    if not documents:
-        print(f"No content extracted from {file_name}. Aborting storage.")
-        return
-
-    # Store the chunks and embeddings in Qdrant (Vector DB)
-    vector_store = vector_db.get_vector_store()
-    vector_store.add_documents(documents)
-    print(f"Stored {len(documents)} chunks in Qdrant for {file_name}.")
-
-    # Store the file metadata in PostgreSQL (Relational DB)
-    metadata_db.save_file_metadata(
-        db=db,
-        file_name=file_name,
-        chunking_strategy="recursive",
-        embedding_model="all-MiniLM-L6-v2" # Default model in our vector_db service
-    )
-    print(f"Stored metadata in PostgreSQL for {file_name}.")
-    print(f"Background task finished for {file_name}.")
+_FILE_EXTENSIONS = {"application/pdf": ".pdf", "text/plain": ".txt"}
 
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_file(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(metadata_db.get_db),
+    document_key: str | None = Form(None),
+    db: AsyncSession = Depends(metadata_db.get_async_db),
 ):
     """
-    This endpoint handles file uploads. It processes the file in the background.
+    This endpoint handles file uploads. The file is spooled to disk and queued
+    for the ingestion worker pool. Uploading a document again under the same
+    `document_key` creates a new version of it; without a key, every upload is
+    a new document (two different files may well share a name).
     """
     if file.content_type not in ["application/pdf", "text/plain"]:
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a .pdf or .txt file.")
-
-    # Read the file content into memory
-    file_content = await file.read()
+    if file.size is not None and file.size > settings.INGEST_MAX_FILE_BYTES:
+        raise _file_too_large(file.filename)
+    # Fast path; the unique index checked by the insert below is what guarantees it
+    if document_key and await metadata_db.aactive_document_keys(db, [document_key]):
+        raise _already_ingesting()
+    await _check_pending_jobs(db, 1)
 
     # Create a unique ID for this processing job
     job_id = str(uuid.uuid4())
 
-    # Add the processing function to the background tasks
-    background_tasks.add_task(
-        process_and_store_in_background,
-        file.filename,
-        file_content,
-        file.content_type,
-        db
-    )
-    
+    # Spool the upload to disk so the job survives restarts and never travels through the web process memory again.
+    # The request holds a slot of the upload limiter, taken by the UploadAdmission middleware.
+    file_path = _spool_path(job_id, _FILE_EXTENSIONS[file.content_type])
+    await _spool_upload(file, file_path, settings.INGEST_MAX_FILE_BYTES)
+
+    try:
+        await metadata_db.acreate_ingestion_job(
+            db,
+            job_id=job_id,
+            file_name=file.filename,
+            file_type=file.content_type,
+            file_path=file_path,
+            chunking_strategy=settings.INGEST_CHUNK_STRATEGY,
+            document_key=document_key or None,
+        )
+    except IntegrityError:
+        # A concurrent upload of the same document got its job in first
+        await db.rollback()
+        os.remove(file_path)
+        raise _already_ingesting()
+    ingestion_worker.enqueue_job(job_id)
+
     # Return an immediate response to the user
     return {
-        "message": "File upload successful. Processing in the background.",
+        "message": "File upload successful. Processing has been queued.",
         "file_name": file.filename,
         "job_id": job_id,
-    }
\ No newline at end of file
+    }
+
+
+@router.post("/bulk", response_model=BulkUploadResponse)
+async def upload_files(
+    files: list[UploadFile] = File(...),
+    document_key_prefix: str | None = Form(None),
+    db: AsyncSession = Depends(metadata_db.get_async_db),
+):
+    """
+    Bulk upload of many .pdf/.txt files and/or .zip/.tar(.gz) archives of them.
+    Every document becomes its own job, so they are processed in parallel by the
+    worker pool. Returns one batch ID to follow them all. Documents past
+    INGEST_BULK_MAX_FILES, or past the room left in the queue, are skipped.
+    With a `document_key_prefix`, each document is keyed by the prefix and its
+    file name or full path in the archive, so uploading it again creates a new
+    version. Without one, every document is new.
+    """
+    limit, limit_reason = await _bulk_capacity(db)
+    batch_id = str(uuid.uuid4())
+    queued, skipped = [], []
+    try:
+        for file in files:
+            if archives.is_archive(file.filename or ""):
+                archive_path = _spool_path(f"{batch_id}-{uuid.uuid4()}", ".archive")
+                await _spool_upload(file, archive_path, settings.INGEST_MAX_REQUEST_BYTES)
+                try:
+                    # Unpacking is blocking file IO, keep it off the event loop
+                    await run_in_threadpool(
+                        _spool_archive_members, archive_path, file.filename, queued, skipped, limit, limit_reason
+                    )
+                finally:
+                    os.remove(archive_path)
+                continue
+
+            file_type = file.content_type if file.content_type in _FILE_EXTENSIONS else archives.file_type_for(file.filename or "")
+            if file_type is None:
+                skipped.append(file.filename)
+                continue
+            if file.size is not None and file.size > settings.INGEST_MAX_FILE_BYTES:
+                skipped.append(f"{file.filename} (larger than {settings.INGEST_MAX_FILE_BYTES} bytes)")
+                continue
+            if len(queued) >= limit:
+                skipped.append(f"{file.filename} ({limit_reason})")
+                continue
+            job_id = str(uuid.uuid4())
+            file_path = _spool_path(job_id, _FILE_EXTENSIONS[file_type])
+            await _spool_upload(file, file_path, settings.INGEST_MAX_FILE_BYTES)
+            queued.append((job_id, file.filename, file_type, file_path))
+    except Exception:
+        # Nothing was queued yet, don't leave the spooled files behind
+        _remove_spooled(queued)
+        raise
+
+    # Versions of one document are ingested one after the other. Fast path, the inserts below guarantee it.
+    document_keys = {job_id: _bulk_document_key(document_key_prefix, file_name) for job_id, file_name, _, _ in queued}
+    active = await metadata_db.aactive_document_keys(db, [key for key in document_keys.values() if key])
+    accepted, seen = [], set()
+    for job_id, file_name, file_type, file_path in queued:
+        document_key = document_keys[job_id]
+        if document_key and (document_key in active or document_key in seen):
+            skipped.append(f"{file_name} (already being ingested)")
+            os.remove(file_path)
+        else:
+            seen.add(document_key)
+            accepted.append((job_id, file_name, file_type, file_path))
+    queued = accepted
+
+    if not queued:
+        raise HTTPException(status_code=400, detail="No .pdf or .txt files to ingest in the upload.")
+    try:
+        # Other uploads may have filled the queue in the meantime
+        await _check_pending_jobs(db, len(queued))
+    except HTTPException:
+        _remove_spooled(queued)
+        raise
+
+    # One transaction for all the jobs, then they are handed to the pool together.
+    # Each insert has its own savepoint: a document that a concurrent upload got
+    # a job in for first (the unique index) is skipped, not the whole batch.
+    inserted = []
+    for job_id, file_name, file_type, file_path in queued:
+        try:
+            async with db.begin_nested():
+                await metadata_db.acreate_ingestion_job(
+                    db,
+                    job_id=job_id,
+                    file_name=file_name,
+                    file_type=file_type,
+                    file_path=file_path,
+                    chunking_strategy=settings.INGEST_CHUNK_STRATEGY,
+                    batch_id=batch_id,
+                    document_key=document_keys[job_id],
+                    commit=False,
+                )
+        except IntegrityError:
+            skipped.append(f"{file_name} (already being ingested)")
+            os.remove(file_path)
+            continue
+        inserted.append(job_id)
+    await db.commit()
+    if not inserted:
+        raise _already_ingesting()
+    for job_id in inserted:
+        ingestion_worker.enqueue_job(job_id)
+
+    return {
+        "message": f"{len(inserted)} files queued for processing.",
+        "batch_id": batch_id,
+        "files_queued": len(inserted),
+        "skipped": skipped,
+    }
+
+
+@router.get("/batches/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch_status(batch_id: str, db: AsyncSession = Depends(metadata_db.get_async_db)):
+    """
+    Aggregated status of a bulk upload, with the status of each of its jobs.
+    """
+    jobs = await metadata_db.alist_batch_jobs(db, batch_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+
+    counts = {}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+
+    return BatchStatusResponse(
+        batch_id=batch_id,
+        status=_batch_status(counts, len(jobs)),
+        total=len(jobs),
+        counts=counts,
+        jobs=[
+            BatchJobStatus(job_id=job.id, file_name=job.file_name, file_id=job.file_id, status=job.status, error=job.error)
+            for job in jobs
+        ],
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str, db: AsyncSession = Depends(metadata_db.get_async_db)):
+    """
+    Reports the status and per-stage progress of an ingestion job.
+    """
+    job = await metadata_db.aget_ingestion_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    return JobStatusResponse(
+        job_id=job.id,
+        file_name=job.file_name,
+        file_id=job.file_id,
+        status=job.status,
+        stage=job.stage,
+        attempts=job.attempts,
+        error=job.error,
+        stages=job.stage_progress or {},
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        finished_at=job.finished_at,
+    )
+
+
+def _spool_path(name: str, extension: str) -> str:
+    os.makedirs(settings.INGEST_SPOOL_DIR, exist_ok=True)
+    return os.path.join(settings.INGEST_SPOOL_DIR, name + extension)
+
+
+async def _spool_upload(file: UploadFile, file_path: str, max_bytes: int):
+    size = 0
+    try:
+        with open(file_path, "wb") as f:
+            while chunk := await file.read(settings.INGEST_UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    break
+                f.write(chunk)
+    except BaseException:
+        # E.g. the client disconnected, don't leave a partial file behind
+        os.remove(file_path)
+        raise
+    if size > max_bytes:
+        os.remove(file_path)
+        raise _file_too_large(file.filename)
+
+
+def _bulk_document_key(prefix: str | None, file_name: str) -> str | None:
+    # Archive members are named by their full path in the archive
+    return f"{prefix.rstrip('/')}/{file_name}" if prefix else None
+
+
+def _already_ingesting() -> HTTPException:
+    return HTTPException(status_code=409, detail="This document is already being ingested. Try again when the job has finished.")
+
+
+def _remove_spooled(queued: list):
+    for _, _, _, file_path in queued:
+        os.remove(file_path)
+
+
+async def _check_pending_jobs(db: AsyncSession, new_jobs: int):
+    # Backpressure: the spool and the queue stop growing when the workers fall behind
+    if await metadata_db.acount_pending_jobs(db) + new_jobs > settings.INGEST_MAX_PENDING_JOBS:
+        raise _queue_full()
+
+
+async def _bulk_capacity(db: AsyncSession) -> tuple[int, str]:
+    """How many documents of a bulk upload are spooled and queued, and why the others are skipped."""
+    room = settings.INGEST_MAX_PENDING_JOBS - await metadata_db.acount_pending_jobs(db)
+    if room <= 0:
+        raise _queue_full()
+    if room < settings.INGEST_BULK_MAX_FILES:
+        return room, "the ingestion queue is full"
+    return settings.INGEST_BULK_MAX_FILES, f"over the limit of {settings.INGEST_BULK_MAX_FILES} files per upload"
+
+
+def _queue_full() -> HTTPException:
+    return admission.overloaded(
+        "ingestion", "queue_full", "Too many documents are waiting to be ingested. Please retry later."
+    )
+
+
+def _file_too_large(file_name: str) -> HTTPException:
+    metrics.REQUESTS_REJECTED.labels("ingestion", "file_too_large").inc()
+    return HTTPException(status_code=413, detail=f"{file_name} is larger than {settings.INGEST_MAX_FILE_BYTES} bytes.")
+
+
+def _spool_archive_members(archive_path: str, archive_name: str, queued: list, skipped: list, limit: int, limit_reason: str):
+    """Copies each supported member of an archive to its own spool file, up to `limit` queued documents."""
+    try:
+        for member_name, stream in archives.iter_members(archive_path):
+            file_type = archives.file_type_for(member_name)
+            if file_type is None:
+                skipped.append(f"{archive_name}/{member_name}")
+                continue
+            if len(queued) >= limit:
+                skipped.append(f"{archive_name}/{member_name} ({limit_reason})")
+                continue
+            job_id = str(uuid.uuid4())
+            file_path = _spool_path(job_id, _FILE_EXTENSIONS[file_type])
+            if not _copy_member(stream, file_path):
+                skipped.append(f"{archive_name}/{member_name} (larger than {settings.INGEST_MAX_FILE_BYTES} bytes)")
+                continue
+            queued.append((job_id, member_name, file_type, file_path))
+    except (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the archive {archive_name}: {e}")
+
+
+def _copy_member(stream, file_path: str) -> bool:
+    """Copies an archive member to its spool file. False (and no file) if it is over the size limit."""
+    size = 0
+    try:
+        with open(file_path, "wb") as f:
+            while chunk := stream.read(settings.INGEST_UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > settings.INGEST_MAX_FILE_BYTES:
+                    break
+                f.write(chunk)
+    except BaseException:
+        # E.g. a corrupt member, don't leave a partial file behind
+        os.remove(file_path)
+        raise
+    if size > settings.INGEST_MAX_FILE_BYTES:
+        os.remove(file_path)
+        return False
+    return True
+
+
+def _batch_status(counts: dict, total: int) -> str:
+    if counts.get("queued", 0) == total:
+        return "queued"
+    if counts.get("queued", 0) or counts.get("running", 0):
+        return "running"
+    if not counts.get("failed"):
+        return "completed"
+    return "failed" if counts["failed"] == total else "completed_with_errors"
+
+
+@router.get("/files", response_model=list[FileResponse])
+async def list_files(limit: int = 100, offset: int = 0, db: AsyncSession = Depends(metadata_db.get_async_db)):
+    """
+    Ingested files with their statistics, newest first.
+    """
+    return await metadata_db.alist_files(db, min(limit, 1000), offset)
+
+
+@router.get("/files/{file_id}/chunks", response_model=list[ChunkResponse])
+async def list_file_chunks(file_id: int, limit: int = 100, offset: int = 0, db: AsyncSession = Depends(metadata_db.get_async_db)):
+    """
+    Where each chunk of a file comes from: page, character offsets and Qdrant point ID.
+    """
+    db_file = await metadata_db.aget_file_metadata(db, file_id)
+    if db_file is None:
+        raise HTTPException(status_code=404, detail="File not found.")
+    return await metadata_db.alist_chunks(db, db_file, min(limit, 1000), offset)
+
+
+@router.get("/files/{file_id}/versions", response_model=list[FileVersionResponse])
+async def list_file_versions(file_id: int, db: AsyncSession = Depends(metadata_db.get_async_db)):
+    """
+    Versions of a file and how many chunks each one added and removed.
+    """
+    if await metadata_db.aget_file_metadata(db, file_id) is None:
+        raise HTTPException(status_code=404, detail="File not found.")
+    return await metadata_db.alist_file_versions(db, file_id)
+
+
+@router.get("/stats", response_model=IngestionStatsResponse)
+async def get_ingestion_stats(db: AsyncSession = Depends(metadata_db.get_async_db)):
+    """
+    Corpus statistics: files, chunks per file, ingest time and throughput.
+    """
+    return await metadata_db.aget_ingestion_stats(db)
+
+
+@router.delete("/files/{file_id}", response_model=DeleteFileResponse)
+async def delete_file(file_id: int, db: AsyncSession = Depends(metadata_db.get_async_db)):
+    """
+    Removes a file from the knowledge base: all its chunks in Qdrant, deleted
+    in bulk by a payload filter, and its metadata row.
+    """
+    db_file = await metadata_db.aget_file_metadata(db, file_id)
+    if db_file is None:
+        raise HTTPException(status_code=404, detail="File not found.")
+    if await metadata_db.ahas_active_job(db, file_id):
+        raise HTTPException(status_code=409, detail="The file is still being ingested. Try again when the job has finished.")
+
+    # Chunks first: if this fails, the row stays and the delete can be retried
+    chunks_deleted = await run_in_threadpool(vector_db.delete_file_points, file_id)
+    file_name = db_file.file_name
+    await metadata_db.adelete_file_metadata(db, db_file)
+    # Cached retrievals and answers may quote the deleted file
+    await semantic_cache.abump_corpus_version()
+
+    return {
+        "message": "File deleted.",
+        "file_id": file_id,
+        "file_name": file_name,
+        "chunks_deleted": chunks_deleted,
+    }
@@ -0,0 +1,169 @@
+"""
+Admission control: bounds the work an API process accepts, so a traffic spike
+turns into fast 429 responses instead of growing queues, memory and timeouts.
+"""
+import asyncio
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse, StreamingResponse
+
+from app.core import metrics
+from app.core.config import settings
+
+
+def overloaded(pipeline: str, reason: str, detail: str) -> HTTPException:
+    """A 429 telling the client when to retry."""
+    metrics.REQUESTS_REJECTED.labels(pipeline, reason).inc()
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(settings.OVERLOAD_RETRY_AFTER_SECONDS)},
+    )
+
+
+class AdmissionLimiter:
+    """
+    At most `max_concurrent` requests run at once and at most `max_queued` wait
+    for a slot. Beyond that requests are rejected right away; waiting ones give
+    up after `queue_timeout` seconds. Limits are per process (per gunicorn worker).
+    """
+
+    def __init__(self, pipeline: str, max_concurrent: int, max_queued: int, queue_timeout: float):
+        self.pipeline = pipeline
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        self._semaphore = None
+
+    async def acquire(self):
+        """Takes a slot or raises a 429. Every successful call needs a `release`."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        if self._semaphore.locked() and self.queued >= self.max_queued:
+            raise overloaded(self.pipeline, "queue_full", "The server is busy. Please retry later.")
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise overloaded(self.pipeline, "queue_timeout", "The server is busy. Please retry later.")
+        finally:
+            self.queued -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse holding a slot of `limiter` taken by the endpoint. The
+    slot is released when the response is done, however it ends: finished,
+    failed, or the client gone before or while the body was streamed. An
+    unfinished body generator is closed, cancelling the work behind it.
+    """
+
+    def __init__(self, limiter: AdmissionLimiter, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.limiter.release()
+            if hasattr(self.body_iterator, "aclose"):
+                await self.body_iterator.aclose()
+
+
+chat_limiter = AdmissionLimiter(
+    "chat", settings.CHAT_MAX_CONCURRENT, settings.CHAT_MAX_QUEUED, settings.CHAT_QUEUE_TIMEOUT_SECONDS
+)
+upload_limiter = AdmissionLimiter(
+    "ingestion", settings.INGEST_MAX_CONCURRENT_UPLOADS, settings.INGEST_MAX_QUEUED_UPLOADS, settings.INGEST_QUEUE_TIMEOUT_SECONDS
+)
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class UploadAdmission:
+    """
+    ASGI middleware for the upload requests (POST under `path_prefix`). It runs
+    before Starlette reads and parses the multipart body, which it spools to
+    temporary files:
+
+    - a request whose Content-Length is over `max_bytes` gets 413 right away
+    - the request takes a slot of `limiter` (or gets 429) for as long as it runs,
+      so at most `limiter.max_concurrent` bodies are received and spooled at once
+    - the body is counted as it arrives, and a request sending more than
+      `max_bytes` (e.g. chunked, without Content-Length) is cut off with 413
+    """
+
+    def __init__(self, app, limiter: AdmissionLimiter, max_bytes: int, path_prefix: str):
+        self.app = app
+        self.limiter = limiter
+        self.max_bytes = max_bytes
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._too_large(scope, receive, send)
+            return
+
+        try:
+            await self.limiter.acquire()
+        except HTTPException as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    too_large = True
+                    raise RequestTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if too_large:
+                return # the app's error response for the cut-off body is replaced by the 413
+            response_started = response_started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except RequestTooLarge:
+            pass
+        finally:
+            self.limiter.release()
+        if too_large and not response_started:
+            await self._too_large(scope, receive, send)
+
+    async def _too_large(self, scope, receive, send):
+        metrics.REQUESTS_REJECTED.labels("ingestion", "request_too_large").inc()
+        response = JSONResponse({"detail": f"The request is larger than {self.max_bytes} bytes."}, status_code=413)
+        await response(scope, receive, send)
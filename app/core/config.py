@@ -1,25 +1,121 @@
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     # PostgreSQL
     DATABASE_URL: str
+    DATABASE_ASYNC_URL: str | None = None # derived from DATABASE_URL (asyncpg driver) if not set
+    DATABASE_POOL_SIZE: int = 5 # connections kept open per process and engine
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_RECYCLE_SECONDS: int = 1800
     
     # Qdrant
     QDRANT_HOST: str
     QDRANT_PORT: int
     QDRANT_COLLECTION_NAME: str
+    QDRANT_LOCATION: str | None = None # ":memory:" runs Qdrant in-process (benchmarks), overrides host and port
+    QDRANT_INDEX_PROFILE: str = "default" # see app/db/index_profiles.py
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_PREFER_GRPC: bool = True # gRPC has less per-request overhead than REST, mainly for upserts
+    QDRANT_UPSERT_BATCH_SIZE: int = 256 # points per upsert request
+    QDRANT_UPSERT_PARALLELISM: int = 4 # upsert requests in flight at once
+
+    # Retrieval
+    RETRIEVAL_MODE: str = "hybrid" # "dense" or "hybrid" (dense + BM25 fused with RRF)
+    RETRIEVAL_K: int = 5
+    HYBRID_PREFETCH_K: int = 20
+    CONTEXT_PACKING: bool = True # merge, de-duplicate and diversify the hits before they reach the LLM
+    CONTEXT_CANDIDATES_K: int = 20 # chunks fetched for packing, at most RETRIEVAL_K passages are kept
+    CONTEXT_TOKEN_BUDGET: int = 600 # estimated tokens of document context per search (about 5 chunks)
+    CONTEXT_MMR_LAMBDA: float = 0.7 # 1.0 ranks by relevance only, lower values favour diversity
+    CONTEXT_DUPLICATE_SIMILARITY: float = 0.95 # passages this similar to a kept one are dropped
     
     # Redis
     REDIS_URL: str
+    CHAT_HISTORY_TTL_SECONDS: int = 7 * 24 * 3600 # idle sessions expire
+    CHAT_HISTORY_TOKEN_BUDGET: int = 2000 # recent messages kept verbatim, older ones are summarized
+    CHAT_HISTORY_SUMMARY: bool = True # False drops messages that leave the window
     
     # LLM
     GOOGLE_API_KEY: str
+    AGENT_VERBOSE: bool = False # verbose agent tracing hides tool steps from the SSE stream
+    CHAT_ROUTER_ENABLED: bool = True # answer document questions with one LLM call instead of the agent
+    CHAT_ROUTER_MIN_SIMILARITY: float = 0.3
+    CHAT_ROUTER_MARGIN: float = 0.05 # required lead of the best intent over the runner-up
+    CHAT_MAX_CONCURRENT: int = 32 # chat requests answered at once per API process
+    CHAT_MAX_QUEUED: int = 64 # chat requests waiting for a slot, more are rejected with 429
+    CHAT_QUEUE_TIMEOUT_SECONDS: float = 5.0 # waiting requests give up with 429 after this
+    CHAT_TIMEOUT_SECONDS: float = 60.0 # deadline of one answer, cancels outstanding LLM and tool calls
     
     # Email
     SMTP_SERVER: str
     SMTP_PORT: int
     SMTP_SENDER_EMAIL: str
-    SMTP_SENDER_PASSWORD: str
+    SMTP_SENDER_PASSWORD: str # leave empty for servers without authentication
+    SMTP_USE_TLS: bool = True # STARTTLS after connecting
+    SMTP_TIMEOUT_SECONDS: float = 10.0
+    EMAIL_DISPATCH_ENABLED: bool = True # send queued emails from a background task of each API process
+    EMAIL_DISPATCH_INTERVAL_SECONDS: float = 5.0 # polling interval, new bookings wake the dispatcher right away
+    EMAIL_DISPATCH_BATCH_SIZE: int = 20 # emails sent per connection round
+    EMAIL_MAX_ATTEMPTS: int = 5
+    EMAIL_RETRY_BACKOFF_SECONDS: float = 30.0 # doubled after each failed attempt
+
+    # Embeddings
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = "torch" # "torch", "onnx" or "onnx-int8", see app/db/embedding_backends.py
+    EMBEDDING_ONNX_FILE: str | None = None # override the ONNX file, e.g. onnx/model_qint8_avx512_vnni.onnx
+    EMBEDDING_THREADS: int = 0 # inference threads, 0 leaves the library default
+    PRELOAD_EMBEDDING_MODEL: bool = True # gunicorn: load the model in the master, shared by all workers
+    EMBEDDING_WARMUP: bool = True # run one encode at startup so the first request isn't slow
+    EMBEDDING_MAX_BATCH_SIZE: int = 64
+    EMBEDDING_MAX_WAIT_MS: float = 5.0
+    EMBEDDING_CACHE_BACKEND: str = "redis" # "redis" or "memory"
+    EMBEDDING_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    EMBEDDING_CACHE_TTL_SECONDS: int = 7 * 24 * 3600 # Redis entries expire after this, so the tier stays bounded
+
+    # Semantic cache
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_CHAT: bool = False # also cache full answers to questions asked without history
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1000
+
+    # Observability
+    OTEL_ENABLED: bool = False # also emit OpenTelemetry spans (needs opentelemetry-api and a configured SDK)
+    CHUNK_DEBUG_SAMPLE_RATE: float = 0.0 # fraction of chunks logged at DEBUG level during ingestion
+
+    # Chunking
+    INGEST_CHUNK_STRATEGY: str = "recursive" # "recursive" or "semantic"
+    SEMANTIC_CHUNK_VECTORS: str = "mean" # "mean" pools sentence embeddings, "reembed" embeds each chunk
+    PAGE_ALIGNED_CHUNKS: bool = False # chunk each PDF page on its own: editing a page only changes its chunks, but no chunk spans a page break
+
+    # Ingestion workers
+    INGEST_SPOOL_DIR: str = "data/uploads"
+    INGEST_MAX_WORKERS: int = 2
+    INGEST_MAX_RETRIES: int = 3
+    INGEST_RETRY_BACKOFF_SECONDS: float = 2.0
+    INGEST_JOB_LEASE_SECONDS: int = 60 # a running job's lease, renewed every third of it; expired leases are reclaimed
+    INGEST_STALE_JOB_SECONDS: int = 600 # reclaim running jobs without a lease (older versions) after this long
+    INGEST_REAPER_INTERVAL_SECONDS: float = 30.0 # how often each API process looks for expired leases
+    INGEST_STREAMING: bool = True
+    INGEST_UPSERT_BATCH_SIZE: int = 64
+    INGEST_UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+    INGEST_BULK_MAX_FILES: int = 500 # files per bulk upload, archive members included; at most INGEST_MAX_PENDING_JOBS
+    INGEST_MAX_FILE_BYTES: int = 100 * 1024 * 1024 # per uploaded file or archive member, larger ones get 413
+    INGEST_MAX_REQUEST_BYTES: int = 1024 * 1024 * 1024 # per upload request, counted as the body arrives
+    INGEST_MAX_CONCURRENT_UPLOADS: int = 8 # upload requests received and spooled at once per API process
+    INGEST_MAX_QUEUED_UPLOADS: int = 16
+    INGEST_QUEUE_TIMEOUT_SECONDS: float = 10.0 # waiting uploads give up with 429 after this
+    INGEST_MAX_PENDING_JOBS: int = 500 # queued and running jobs of all processes, more uploads are rejected with 429
+
+    # Overload
+    OVERLOAD_RETRY_AFTER_SECONDS: int = 5 # Retry-After of 429 responses
+
+    @model_validator(mode="after")
+    def _check_ingest_limits(self):
+        if self.INGEST_BULK_MAX_FILES > self.INGEST_MAX_PENDING_JOBS:
+            # The whole batch is queued at once, a larger one could never be accepted
+            raise ValueError("INGEST_BULK_MAX_FILES must not be larger than INGEST_MAX_PENDING_JOBS.")
+        return self
 
     class Config:
         env_file = ".env"
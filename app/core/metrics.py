@@ -0,0 +1,147 @@
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+
+from app.core.config import settings
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+# Up to a minute, so slow LLM calls still land in a bucket
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Duration of one stage of the ingestion or chat pipeline.",
+    ["pipeline", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "rag_stage_errors_total",
+    "Stages that raised an exception.",
+    ["pipeline", "stage"],
+)
+INGESTION_JOBS = Counter(
+    "rag_ingestion_jobs_total",
+    "Finished ingestion jobs by final status.",
+    ["status"],
+)
+EMAILS = Counter(
+    "rag_emails_total",
+    "Outbox email delivery attempts by result (sent, retry, failed).",
+    ["status"],
+)
+REQUESTS_REJECTED = Counter(
+    "rag_requests_rejected_total",
+    "Requests rejected by admission control (429, 413) or cut off by their deadline (504).",
+    ["pipeline", "reason"],
+)
+LLM_TOKENS = Counter(
+    "rag_llm_tokens_total",
+    "Tokens used by LLM calls, as reported by the model.",
+    ["type"],
+)
+
+_tracer = None
+
+
+def get_tracer():
+    """OpenTelemetry tracer when OTEL_ENABLED is set and the API is installed, otherwise None."""
+    global _tracer
+    if _tracer is None and settings.OTEL_ENABLED and trace is not None:
+        _tracer = trace.get_tracer("rag-agent")
+    return _tracer
+
+
+@contextmanager
+def span(pipeline: str, stage: str, **attributes):
+    """Times a block into the stage histogram and, if enabled, an OpenTelemetry span."""
+    tracer = get_tracer()
+    otel_span = tracer.start_as_current_span(f"{pipeline}.{stage}", attributes=attributes) if tracer else nullcontext()
+    with otel_span:
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            STAGE_ERRORS.labels(pipeline, stage).inc()
+            raise
+        finally:
+            STAGE_SECONDS.labels(pipeline, stage).observe(time.perf_counter() - start)
+
+
+class ChatMetricsHandler(BaseCallbackHandler):
+    """
+    LangChain callback that records each LLM call and each tool call of the
+    agent as a 'chat' stage ('llm', 'tool:document_search', ...).
+    """
+
+    def __init__(self):
+        self._runs = {}
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, "llm")
+
+    def on_llm_start(self, serialized: dict, prompts: list, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, "llm")
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    LLM_TOKENS.labels("input").inc(usage.get("input_tokens", 0))
+                    LLM_TOKENS.labels("output").inc(usage.get("output_tokens", 0))
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, failed=True)
+
+    def on_tool_start(self, serialized: dict, input_str: str, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, f"tool:{serialized.get('name', 'unknown')}")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, failed=True)
+
+    def _start(self, run_id: UUID, stage: str):
+        tracer = get_tracer()
+        otel_span = tracer.start_span(f"chat.{stage}") if tracer else None
+        self._runs[run_id] = (stage, time.perf_counter(), otel_span)
+
+    def _end(self, run_id: UUID, failed: bool = False):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        stage, start, otel_span = run
+        STAGE_SECONDS.labels("chat", stage).observe(time.perf_counter() - start)
+        if failed:
+            STAGE_ERRORS.labels("chat", stage).inc()
+        if otel_span is not None:
+            otel_span.end()
+
+
+chat_metrics_handler = ChatMetricsHandler()
+
+
+def render() -> tuple[bytes, str]:
+    """
+    Returns the metrics in the Prometheus text format and its content type.
+    With PROMETHEUS_MULTIPROC_DIR set, the metrics of all processes are merged,
+    including the ingestion workers.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,52 @@
+import os
+import time
+from contextlib import contextmanager
+
+# Seconds spent in each startup step of this process, in order
+timings = {}
+
+
+@contextmanager
+def timed(step: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[step] = time.perf_counter() - start
+        print(f"[startup] {step}: {timings[step]:.2f}s (pid {os.getpid()})")
+
+
+def record(step: str, seconds: float):
+    timings[step] = seconds
+    print(f"[startup] {step}: {seconds:.2f}s (pid {os.getpid()})")
+
+
+def preload_embedding_model():
+    """
+    Loads the embedding model once. Called in the gunicorn master before the
+    workers are forked: the weights are then shared copy-on-write by every
+    worker instead of being loaded N times.
+    """
+    from app.db import vector_db
+
+    with timed("embedding_model_load"):
+        model = vector_db.get_embedding_function().client
+        # Inference never writes to the weights, so their pages stay shared after fork
+        model.eval()
+        for parameter in model.parameters():
+            parameter.requires_grad_(False)
+
+
+def warm_up_embedding_model():
+    """Runs one encode so the first request doesn't pay for lazy initialization."""
+    from app.db import vector_db
+
+    with timed("embedding_warmup"):
+        # Straight to the model: a cached vector would skip the warm-up
+        vector_db.get_embedding_function().client.encode(["warm up"])
+
+
+def report():
+    total = sum(timings.values())
+    steps = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items())
+    print(f"[startup] ready in {total:.2f}s (pid {os.getpid()}): {steps}")
@@ -0,0 +1,312 @@
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Sequence
+
+import redis
+import redis.asyncio as aioredis
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import (
+    AIMessage, BaseMessage, HumanMessage, SystemMessage, message_to_dict, messages_from_dict,
+)
+
+from app.core import metrics
+
+_redis_clients = {}
+_async_redis_clients = {}
+
+# Summary updates run in the background; keep references so they aren't garbage collected
+_background_tasks = set()
+
+# Rough token estimate (about 4 characters per token for English) plus per-message overhead
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# The newest messages are always kept, even if they alone exceed the budget
+MIN_WINDOW_MESSAGES = 2
+
+SUMMARY_LOCK_SECONDS = 120
+TURN_LOCK_POLL_SECONDS = 0.05
+
+# Deletes the lock only if it still holds our token, in one atomic step
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def get_redis_client(url: str) -> redis.Redis:
+    if url not in _redis_clients:
+        _redis_clients[url] = redis.Redis.from_url(url)
+    return _redis_clients[url]
+
+
+def get_async_redis_client(url: str) -> aioredis.Redis:
+    if url not in _async_redis_clients:
+        _async_redis_clients[url] = aioredis.Redis.from_url(url)
+    return _async_redis_clients[url]
+
+
+class AsyncRedisChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat history in Redis with native async reads and writes, so loading and
+    saving the history never blocks the event loop. Shares pooled clients.
+
+    With a `token_budget`, only a sliding window of the newest messages that
+    fits the budget is kept. Older messages are moved to a pending list and,
+    if a `summarizer` is given, folded into a running summary by a background
+    task after the turn. The summary is returned as a leading SystemMessage,
+    so each turn loads and sends a bounded amount of history.
+
+    Loading the messages also loads `metadata`, a small dict of per-session
+    state (strings) that `aset_metadata` updates.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        url: str,
+        key_prefix: str = "message_store:",
+        ttl: int | None = None,
+        token_budget: int | None = None,
+        summarizer: Callable[[str, list[BaseMessage]], Awaitable[str]] | None = None,
+    ):
+        self.session_id = session_id
+        self.url = url
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.metadata = {}
+
+    @property
+    def key(self) -> str:
+        return self.key_prefix + self.session_id
+
+    @property
+    def summary_key(self) -> str:
+        return self.key + ":summary"
+
+    @property
+    def pending_key(self) -> str:
+        # Messages evicted from the window that are not in the summary yet
+        return self.key + ":pending"
+
+    @property
+    def metadata_key(self) -> str:
+        return self.key + ":metadata"
+
+    @property
+    def messages(self) -> list[BaseMessage]:
+        with metrics.span("chat", "history_load"):
+            pipe = get_redis_client(self.url).pipeline(transaction=False)
+            pipe.lrange(self.key, 0, -1)
+            pipe.get(self.summary_key)
+            pipe.hgetall(self.metadata_key)
+            items, summary, metadata = pipe.execute()
+        self.metadata = _decode_metadata(metadata)
+        return _with_summary(summary, _decode(items))
+
+    async def aget_messages(self) -> list[BaseMessage]:
+        with metrics.span("chat", "history_load"):
+            pipe = get_async_redis_client(self.url).pipeline(transaction=False)
+            pipe.lrange(self.key, 0, -1)
+            pipe.get(self.summary_key)
+            pipe.hgetall(self.metadata_key)
+            items, summary, metadata = await pipe.execute()
+        self.metadata = _decode_metadata(metadata)
+        return _with_summary(summary, _decode(items))
+
+    async def aset_metadata(self, **fields: str) -> None:
+        pipe = get_async_redis_client(self.url).pipeline()
+        pipe.hset(self.metadata_key, mapping=fields)
+        if self.ttl:
+            pipe.expire(self.metadata_key, self.ttl)
+        await pipe.execute()
+        self.metadata.update(fields)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        if not messages:
+            return
+        with metrics.span("chat", "history_write"):
+            pipe = get_redis_client(self.url).pipeline()
+            pipe.lpush(self.key, *_encode(messages))
+            if self.ttl:
+                pipe.expire(self.key, self.ttl)
+                pipe.expire(self.summary_key, self.ttl)
+            pipe.execute()
+            if self.token_budget:
+                # Evicted messages wait in the pending list for the next async update
+                self._trim()
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        if not messages:
+            return
+        with metrics.span("chat", "history_write"):
+            pipe = get_async_redis_client(self.url).pipeline()
+            pipe.lpush(self.key, *_encode(messages))
+            if self.ttl:
+                pipe.expire(self.key, self.ttl)
+                pipe.expire(self.summary_key, self.ttl)
+            await pipe.execute()
+            evicted = await self._atrim() if self.token_budget else 0
+
+        if evicted and self.summarizer:
+            task = asyncio.create_task(self.aupdate_summary())
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
+    def clear(self) -> None:
+        get_redis_client(self.url).delete(self.key, self.summary_key, self.pending_key, self.metadata_key)
+
+    async def aclear(self) -> None:
+        await get_async_redis_client(self.url).delete(self.key, self.summary_key, self.pending_key, self.metadata_key)
+
+    @asynccontextmanager
+    async def aturn_lock(self, lock_seconds: float):
+        """
+        Serializes the turns of the session across processes, so concurrent
+        messages don't interleave their reads and writes of the history. Waits
+        for the turn in progress; the lock expires after `lock_seconds` in case
+        its holder died. Bound the wait with a timeout around the caller.
+        """
+        client = get_async_redis_client(self.url)
+        lock_key = self.key + ":turn_lock"
+        token = uuid.uuid4().hex
+        while not await client.set(lock_key, token, nx=True, px=int(lock_seconds * 1000)):
+            await asyncio.sleep(TURN_LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            # Only our own lock, it may have expired and been taken by the next turn
+            await client.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+    def _trim(self) -> int:
+        with get_redis_client(self.url).pipeline() as pipe:
+            try:
+                # WATCH makes the trim a no-op if another turn writes in between
+                pipe.watch(self.key)
+                items = pipe.lrange(self.key, 0, -1)
+                keep = _window_size(items, self.token_budget)
+                if keep >= len(items):
+                    return 0
+                pipe.multi()
+                self._queue_eviction(pipe, items, keep)
+                pipe.execute()
+                return len(items) - keep
+            except redis.WatchError:
+                # The next write trims again
+                return 0
+
+    async def _atrim(self) -> int:
+        async with get_async_redis_client(self.url).pipeline() as pipe:
+            try:
+                await pipe.watch(self.key)
+                items = await pipe.lrange(self.key, 0, -1)
+                keep = _window_size(items, self.token_budget)
+                if keep >= len(items):
+                    return 0
+                pipe.multi()
+                self._queue_eviction(pipe, items, keep)
+                await pipe.execute()
+                return len(items) - keep
+            except redis.WatchError:
+                return 0
+
+    def _queue_eviction(self, pipe, items: list, keep: int):
+        pipe.ltrim(self.key, 0, keep - 1)
+        if self.summarizer:
+            # Oldest first, so the pending list stays in chronological order
+            pipe.rpush(self.pending_key, *items[keep:][::-1])
+            if self.ttl:
+                pipe.expire(self.pending_key, self.ttl)
+
+    async def aupdate_summary(self) -> None:
+        """
+        Folds the pending messages into the running summary. Runs after the
+        response was sent. Only one update per session runs at a time; messages
+        evicted meanwhile are picked up by the next update.
+        """
+        client = get_async_redis_client(self.url)
+        lock_key = self.key + ":summary_lock"
+        if not await client.set(lock_key, 1, nx=True, ex=SUMMARY_LOCK_SECONDS):
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.lrange(self.pending_key, 0, -1)
+            pipe.get(self.summary_key)
+            items, summary = await pipe.execute()
+            if not items:
+                return
+
+            with metrics.span("chat", "summarize"):
+                # The pending list is oldest first, _decode expects newest first
+                summary = await self.summarizer(summary.decode("utf-8") if summary else "", _decode(items[::-1]))
+
+            pipe = client.pipeline()
+            pipe.set(self.summary_key, summary, ex=self.ttl)
+            pipe.ltrim(self.pending_key, len(items), -1)
+            await pipe.execute()
+        except Exception as e:
+            # The pending messages stay queued and are retried with the next update
+            print(f"Failed to update the conversation summary for {self.session_id}: {e}")
+        finally:
+            await client.delete(lock_key)
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    return len(content) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def _window_size(items: list, token_budget: int) -> int:
+    """How many of the newest items fit the budget (items are newest first, like the list)."""
+    used = 0
+    for i, message in enumerate(reversed(_decode(items))):
+        used += estimate_tokens(message)
+        if used > token_budget and i >= MIN_WINDOW_MESSAGES:
+            return i
+    return len(items)
+
+
+def _decode_metadata(metadata: dict) -> dict[str, str]:
+    return {key.decode("utf-8"): value.decode("utf-8") for key, value in metadata.items()}
+
+
+def _with_summary(summary: bytes | None, messages: list[BaseMessage]) -> list[BaseMessage]:
+    if not summary:
+        return messages
+    return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary.decode('utf-8')}")] + messages
+
+
+# Human and AI messages are stored as {"r": "h"|"a", "c": content} instead of the
+# full LangChain dict, which is several times larger. Other types use the full form.
+_COMPACT_TYPES = {"h": HumanMessage, "a": AIMessage}
+_COMPACT_ROLES = {"human": "h", "ai": "a"}
+
+
+def _encode(messages: Sequence[BaseMessage]) -> list[str]:
+    encoded = []
+    for message in messages:
+        role = _COMPACT_ROLES.get(message.type)
+        if role and not getattr(message, "tool_calls", None) and not message.additional_kwargs:
+            encoded.append(json.dumps({"r": role, "c": message.content}, separators=(",", ":")))
+        else:
+            encoded.append(json.dumps(message_to_dict(message), separators=(",", ":")))
+    return encoded
+
+
+def _decode(items: list) -> list[BaseMessage]:
+    # Messages are pushed to the head of the list, so the newest come first
+    messages = []
+    for item in items[::-1]:
+        data = json.loads(item)
+        if "r" in data:
+            messages.append(_COMPACT_TYPES[data["r"]](content=data["c"]))
+        else:
+            # Full LangChain format, also used by histories written before the compact one
+            messages.extend(messages_from_dict([data]))
+    return messages
@@ -0,0 +1,176 @@
+"""
+Rebuilds the Qdrant collection with another index profile without downtime.
+
+The application always talks to QDRANT_COLLECTION_NAME. For a migration that
+name must be an alias pointing at a physical collection, so a new collection
+can be built and filled next to the old one and the alias is then switched
+over in a single atomic operation. A collection created by the app is not an
+alias yet: bootstrap one under a new name once, point the app at it, and then
+migrate.
+
+Usage:
+    python -m app.db.collection_migration --bootstrap-alias documents_live
+    (set QDRANT_COLLECTION_NAME=documents_live and restart the app)
+    python -m app.db.collection_migration balanced [--drop-old]
+
+Pause uploads and file deletions while a migration runs: points written to
+the old collection after they were copied are not part of the new one. The
+migration refuses to start while ingestion jobs are queued or running, and
+aborts before the switch if a job appeared or the point count changed.
+"""
+import argparse
+import time
+
+from qdrant_client import QdrantClient, models
+
+from app.core.config import settings
+from app.db import metadata_db, vector_db
+from app.db.index_profiles import get_profile
+
+COPY_BATCH_SIZE = 256
+
+
+def resolve_alias(client: QdrantClient, alias_name: str) -> str | None:
+    """Returns the physical collection behind an alias, or None if it is not an alias."""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == alias_name:
+            return alias.collection_name
+    return None
+
+
+def copy_points(client: QdrantClient, source: str, target: str, batch_size: int = COPY_BATCH_SIZE) -> int:
+    copied = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=source,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if points:
+            client.upsert(
+                collection_name=target,
+                points=[models.PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points],
+                wait=True,
+            )
+            copied += len(points)
+            print(f"Copied {copied} points...")
+        if offset is None:
+            return copied
+
+
+def check_ingestion_idle():
+    """Raises if ingestion jobs are queued or running, they would write to the old collection."""
+    with metadata_db.session_scope() as db:
+        pending = metadata_db.count_pending_jobs(db)
+    if pending:
+        raise RuntimeError(
+            f"{pending} ingestion jobs are queued or running. Pause uploads and wait for them to finish before migrating."
+        )
+
+
+def bootstrap_alias(alias_name: str) -> str:
+    """
+    Creates `alias_name` pointing at the physical collection QDRANT_COLLECTION_NAME.
+    The collection stays available under its own name meanwhile, so nothing is
+    interrupted. Returns the name of the collection.
+    """
+    client = vector_db.get_qdrant_client()
+    collection_name = settings.QDRANT_COLLECTION_NAME
+    if resolve_alias(client, collection_name) is not None:
+        raise ValueError(f"'{collection_name}' is already an alias, migrate it directly.")
+    if not client.collection_exists(collection_name):
+        raise ValueError(f"Collection '{collection_name}' does not exist. Start the app once to create it.")
+    if resolve_alias(client, alias_name) is not None or client.collection_exists(alias_name):
+        raise ValueError(f"'{alias_name}' already exists, pick another alias name.")
+
+    client.update_collection_aliases(change_aliases_operations=[
+        models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias_name)),
+    ])
+    print(
+        f"Alias '{alias_name}' now points to '{collection_name}'. Set QDRANT_COLLECTION_NAME={alias_name}, "
+        f"restart the app, then run the migration."
+    )
+    return collection_name
+
+
+def migrate_collection(profile_name: str, drop_old: bool = False) -> str:
+    """
+    Copies every point into a new collection built with `profile_name` and
+    points the alias at it. Returns the name of the new physical collection.
+    The old collection is only deleted (with `drop_old`) after the switch.
+    """
+    profile = get_profile(profile_name)
+    client = vector_db.get_qdrant_client()
+    alias_name = settings.QDRANT_COLLECTION_NAME
+
+    current = resolve_alias(client, alias_name)
+    if current is None:
+        # A collection and an alias can't share a name: replacing the collection by an
+        # alias would take it offline. Serve it through an alias under a new name first.
+        raise ValueError(
+            f"'{alias_name}' is a collection, not an alias. Run "
+            f"`python -m app.db.collection_migration --bootstrap-alias {alias_name}_live` once, "
+            f"set QDRANT_COLLECTION_NAME={alias_name}_live and restart the app, then migrate."
+        )
+    check_ingestion_idle()
+
+    embedding_size = vector_db.dense_vector_params(client.get_collection(current), current).size
+    target = f"{alias_name}__{profile.name}_{int(time.time())}"
+    print(f"Creating '{target}' with the '{profile.name}' index profile.")
+    vector_db.create_collection(client, target, profile, embedding_size)
+
+    start_time = time.time()
+    copied = copy_points(client, current, target)
+    print(f"Copied {copied} points from '{current}' in {time.time() - start_time:.1f}s.")
+
+    # Writes during the copy would be lost with the switch, and for good once the old collection is deleted
+    try:
+        check_ingestion_idle()
+        source_count = client.count(current, exact=True).count
+        target_count = client.count(target, exact=True).count
+        if source_count != target_count:
+            raise RuntimeError(
+                f"'{current}' changed during the copy ({source_count} points, {target_count} copied). Pause uploads and deletions and retry."
+            )
+    except Exception:
+        client.delete_collection(target)
+        print(f"Deleted '{target}', '{alias_name}' is unchanged.")
+        raise
+
+    # One atomic operation: searches see either the old or the new collection
+    client.update_collection_aliases(change_aliases_operations=[
+        models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias_name)),
+        models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=target, alias_name=alias_name)),
+    ])
+    if drop_old:
+        client.delete_collection(current)
+        print(f"Deleted '{current}'.")
+    else:
+        print(f"Kept '{current}' for rollback. Delete it once the new index is verified.")
+
+    print(f"Alias '{alias_name}' now points to '{target}'.")
+    return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the Qdrant collection with another index profile.",
+        epilog="Pause uploads and file deletions while the migration runs: points written to the old collection "
+        "after they were copied are lost. The migration refuses to run while ingestion jobs are queued or running.",
+    )
+    parser.add_argument("profile", nargs="?", help="Name of the index profile, see app/db/index_profiles.py")
+    parser.add_argument("--drop-old", action="store_true", help="Delete the previous collection after the switch")
+    parser.add_argument(
+        "--bootstrap-alias", metavar="ALIAS",
+        help="Once, before the first migration: create ALIAS for the collection QDRANT_COLLECTION_NAME",
+    )
+    args = parser.parse_args()
+    if args.bootstrap_alias:
+        bootstrap_alias(args.bootstrap_alias)
+    elif args.profile:
+        migrate_collection(args.profile, drop_old=args.drop_old)
+    else:
+        parser.error("give an index profile, or --bootstrap-alias before the first migration")
@@ -0,0 +1,231 @@
+"""
+Registry of embedding backends for the SentenceTransformer model.
+
+    torch      PyTorch, the reference implementation
+    onnx       ONNX Runtime, fp32
+    onnx-int8  ONNX Runtime with a dynamically int8-quantized graph
+
+The ONNX backends need `pip install "sentence-transformers[onnx]"`.
+Check accuracy and throughput of the backends on this machine with:
+
+    python -m app.db.embedding_backends --backends torch,onnx,onnx-int8
+"""
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+from langchain_community.embeddings import SentenceTransformerEmbeddings
+
+
+@dataclass(frozen=True)
+class EmbeddingBackend:
+    name: str
+    backend: str # the `backend` argument of SentenceTransformer
+    onnx_file: str | None = None # model file inside the model repository
+    description: str = ""
+    model_kwargs: dict = field(default_factory=dict)
+
+
+BACKENDS = {
+    "torch": EmbeddingBackend("torch", "torch", description="PyTorch fp32 (reference)"),
+    "onnx": EmbeddingBackend("onnx", "onnx", "onnx/model.onnx", "ONNX Runtime fp32"),
+    # all-MiniLM-L6-v2 ships pre-quantized graphs; pick the variant matching the CPU
+    # (model_qint8_avx512_vnni.onnx, model_qint8_arm64.onnx, ...) with EMBEDDING_ONNX_FILE
+    "onnx-int8": EmbeddingBackend("onnx-int8", "onnx", "onnx/model_quint8_avx2.onnx", "ONNX Runtime, dynamic int8 quantization"),
+}
+
+
+def get_backend(name: str) -> EmbeddingBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name}. Available: {', '.join(BACKENDS)}")
+    return BACKENDS[name]
+
+
+def model_id(model_name: str, backend_name: str) -> str:
+    """
+    Identifies the model that produced a vector. Quantized backends give slightly
+    different vectors, so the backend is part of the ID (and of the cache keys).
+    """
+    return model_name if backend_name == "torch" else f"{model_name}@{backend_name}"
+
+
+def load_embeddings(
+    model_name: str,
+    backend_name: str = "torch",
+    threads: int = 0,
+    onnx_file: str | None = None,
+) -> SentenceTransformerEmbeddings:
+    """Loads the model with the given backend. `threads` > 0 caps the inference threads."""
+    backend = get_backend(backend_name)
+    model_kwargs = {"backend": backend.backend}
+
+    if backend.backend == "torch":
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+    else:
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                f"The '{backend_name}' embedding backend needs ONNX Runtime: pip install \"sentence-transformers[onnx]\""
+            ) from e
+        file_name = onnx_file or backend.onnx_file
+        available = onnx_files(model_name)
+        if available is not None and file_name not in available:
+            raise FileNotFoundError(
+                f"'{file_name}' is not in the model '{model_name}'. Set EMBEDDING_ONNX_FILE to one of: "
+                f"{', '.join(available) or 'none, the model has no ONNX files'}"
+            )
+        session_options = onnxruntime.SessionOptions()
+        if threads > 0:
+            session_options.intra_op_num_threads = threads
+            session_options.inter_op_num_threads = 1
+        model_kwargs["model_kwargs"] = {
+            "file_name": file_name,
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options,
+            **backend.model_kwargs,
+        }
+
+    return SentenceTransformerEmbeddings(model_name=model_name, model_kwargs=model_kwargs)
+
+
+def onnx_files(model_name: str) -> list[str] | None:
+    """
+    The ONNX files of a local model directory or a Hugging Face model repository,
+    or None if the repository can't be listed (offline), then loading reports it.
+    """
+    if os.path.isdir(model_name):
+        files = [
+            os.path.relpath(os.path.join(root, name), model_name).replace(os.sep, "/")
+            for root, _, names in os.walk(model_name) for name in names
+        ]
+    else:
+        # SentenceTransformer resolves bare names in the sentence-transformers organization
+        repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        try:
+            from huggingface_hub import list_repo_files
+            files = list_repo_files(repo_id)
+        except Exception:
+            return None
+    return sorted(f for f in files if f.endswith(".onnx"))
+
+
+# SELF-CHECK
+SAMPLE_TEXTS = [
+    "What programming language is used for the Helios architecture?",
+    "The company was founded in 2012 and has offices in three countries.",
+    "Interviews are scheduled between 9 AM and 5 PM on weekdays.",
+    "Revenue grew by 12 percent compared to the previous quarter.",
+    "The ingestion pipeline splits documents into overlapping chunks.",
+    "Please send the confirmation email to the candidate.",
+    "Qdrant stores the vectors and serves approximate nearest neighbour queries.",
+    "Our support team answers within one business day.",
+]
+
+
+def self_check(
+    model_name: str,
+    backend_names: list[str],
+    texts: list[str],
+    batch_size: int = 32,
+    threads: int = 0,
+    rounds: int = 3,
+) -> list[dict]:
+    """
+    Embeds `texts` with every backend and compares the vectors with the torch
+    reference (cosine similarity, top-1 neighbour agreement) and the throughput.
+    """
+    results = []
+    reference = None
+    # First occurrence of each text, so repeated samples don't count as neighbours
+    unique = [texts.index(text) for text in dict.fromkeys(texts)]
+    for name in ["torch"] + [b for b in backend_names if b != "torch"]:
+        start = time.perf_counter()
+        try:
+            model = load_embeddings(model_name, name, threads).client
+        except Exception as e:
+            if name == "torch":
+                raise # no reference to compare with
+            results.append({"backend": name, "model_id": model_id(model_name, name), "error": f"{type(e).__name__}: {e}"})
+            continue
+        load_seconds = time.perf_counter() - start
+
+        model.encode(texts[:batch_size], batch_size=batch_size) # warm-up
+        start = time.perf_counter()
+        for _ in range(rounds):
+            vectors = model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        seconds = (time.perf_counter() - start) / rounds
+
+        result = {
+            "backend": name,
+            "model_id": model_id(model_name, name),
+            "dimension": int(vectors.shape[1]),
+            "load_seconds": round(load_seconds, 2),
+            "texts_per_second": round(len(texts) / seconds, 1),
+        }
+        if reference is None:
+            reference = vectors
+        else:
+            similarity = np.einsum("ij,ij->i", vectors, reference)
+            # Does every text still have the same nearest neighbour?
+            agreement = np.mean(_nearest(vectors[unique]) == _nearest(reference[unique]))
+            result.update(
+                mean_cosine=round(float(similarity.mean()), 5),
+                min_cosine=round(float(similarity.min()), 5),
+                neighbour_agreement=round(float(agreement), 4),
+            )
+        results.append(result)
+    return results
+
+
+def _nearest(vectors: np.ndarray) -> np.ndarray:
+    similarities = vectors @ vectors.T
+    np.fill_diagonal(similarities, -np.inf)
+    return similarities.argmax(axis=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare embedding backends against the PyTorch reference.")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--texts", help="File with one text per line. Defaults to built-in samples")
+    parser.add_argument("--repeat", type=int, default=64, help="Repeat the samples to get a stable throughput")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Fail if any vector is less similar to the reference")
+    args = parser.parse_args()
+
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = SAMPLE_TEXTS * args.repeat
+
+    print(f"{len(texts)} texts, {os.cpu_count()} CPUs, threads={args.threads or 'default'}")
+    results = self_check(args.model, args.backends.split(","), texts, args.batch_size, args.threads)
+    baseline = results[0]["texts_per_second"]
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:>10}: failed to load: {result['error']}")
+            continue
+        line = f"{result['backend']:>10}: {result['texts_per_second']:>8} texts/s ({result['texts_per_second'] / baseline:.2f}x)"
+        if "mean_cosine" in result:
+            line += (
+                f", cosine mean {result['mean_cosine']} min {result['min_cosine']},"
+                f" same nearest neighbour {result['neighbour_agreement']:.0%}"
+            )
+        print(line)
+
+    broken = [r["backend"] for r in results if "error" in r]
+    failed = [r["backend"] for r in results if r.get("min_cosine", 1.0) < args.min_cosine]
+    if broken:
+        print(f"Failed to load: {', '.join(broken)}")
+    if failed:
+        print(f"Below the accuracy threshold of {args.min_cosine}: {', '.join(failed)}")
+    if broken or failed:
+        sys.exit(1)
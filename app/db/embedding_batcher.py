@@ -0,0 +1,148 @@
+import asyncio
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+# Queries jump ahead of document batches so chat latency doesn't wait on ingestion.
+QUERY_PRIORITY = 0
+DOCUMENT_PRIORITY = 1
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Wraps an embedding model and runs it on a dedicated inference thread.
+    Concurrent embedding requests are gathered into dynamic batches of up to
+    `max_batch_size` texts, waiting at most `max_wait_ms` for a batch to fill.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    @property
+    def client(self):
+        # The underlying SentenceTransformer, e.g. for get_sentence_embedding_dimension()
+        return self.embeddings.client
+
+    def submit(self, texts: list[str], priority: int = DOCUMENT_PRIORITY) -> Future:
+        """
+        Queues texts for embedding and returns a Future with their vectors.
+        Requests larger than one batch are split and resolved together.
+        """
+        self._ensure_worker()
+        parts = []
+        for i in range(0, len(texts), self.max_batch_size):
+            future = Future()
+            self._queue.put((priority, next(self._counter), texts[i:i + self.max_batch_size], future))
+            parts.append(future)
+
+        if len(parts) == 1:
+            return parts[0]
+        return _gather(parts)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return self.submit(texts).result()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.submit([text], priority=QUERY_PRIORITY).result()[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return await asyncio.wrap_future(self.submit(texts))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        vectors = await asyncio.wrap_future(self.submit([text], priority=QUERY_PRIORITY))
+        return vectors[0]
+
+    def _ensure_worker(self):
+        # Threads don't survive fork, so a child process starts its own worker.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.PriorityQueue()
+                self._thread = threading.Thread(target=self._worker_loop, name="embedding-batcher", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _worker_loop(self):
+        carry = None
+        while True:
+            item = carry or self._queue.get()
+            carry = None
+            batch = [item]
+            size = len(item[2])
+            deadline = time.monotonic() + self.max_wait
+
+            # Keep collecting until the batch is full or the wait budget is spent
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if size + len(item[2]) > self.max_batch_size:
+                    carry = item
+                    break
+                batch.append(item)
+                size += len(item[2])
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # Drop requests whose callers have given up
+        batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        texts = [text for item in batch for text in item[2]]
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+        except Exception as e:
+            for item in batch:
+                item[3].set_exception(e)
+            return
+
+        offset = 0
+        for _, _, item_texts, future in batch:
+            future.set_result(vectors[offset:offset + len(item_texts)])
+            offset += len(item_texts)
+
+
+def _gather(parts: list[Future]) -> Future:
+    """Combines the futures of a split request into one Future of the concatenated vectors."""
+    combined = Future()
+    combined.set_running_or_notify_cancel()
+    remaining = [len(parts)]
+    lock = threading.Lock()
+
+    def _on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] or combined.done():
+                return
+        errors = [part.exception() for part in parts if part.exception() is not None]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result([vector for part in parts for vector in part.result()])
+
+    for part in parts:
+        part.add_done_callback(_on_done)
+    return combined
@@ -0,0 +1,194 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import redis
+import redis.asyncio as aioredis
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed cache in front of an embedding function.
+    Vectors are keyed by a hash of the model name plus the text and kept in an
+    in-process LRU tier (evicted by size in bytes) backed by an optional Redis tier,
+    whose entries expire after `ttl_seconds`.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        redis_url: str | None = None,
+        ttl_seconds: int = 7 * 24 * 3600,
+        key_prefix: str = "embedding:",
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        if ttl_seconds <= 0:
+            raise ValueError("The embedding cache needs a positive TTL, Redis entries would never expire.")
+        self.ttl_seconds = ttl_seconds
+        self.key_prefix = key_prefix
+        self._redis = redis.Redis.from_url(redis_url) if redis_url else None
+        # The async paths use their own client, so they never block the event loop
+        self._async_redis = aioredis.Redis.from_url(redis_url) if redis_url else None
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0}
+
+    @property
+    def client(self):
+        return self.embeddings.client
+
+    def cache_key(self, text: str) -> str:
+        digest = hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+        return self.key_prefix + digest
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text], lambda missing: [self.embeddings.embed_query(missing[0])])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self._aembed(texts, self.embeddings.aembed_documents)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        async def compute(missing):
+            return [await self.embeddings.aembed_query(missing[0])]
+        return (await self._aembed([text], compute))[0]
+
+    def stats(self) -> dict:
+        """Hit/miss counters and the current size of the in-process tier."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._memory)
+            stats["bytes"] = self._memory_bytes
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_ratio"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        return stats
+
+    def _embed(self, texts: list[str], compute) -> list[list[float]]:
+        keys = [self.cache_key(text) for text in texts]
+        vectors = self._memory_lookup(keys)
+
+        # Tier 2: Redis
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing and self._redis is not None:
+            vectors.update(self._persistent_hits(self._redis_get(missing)))
+            missing = [key for key in missing if key not in vectors]
+
+        # Compute whatever is left, once per distinct text
+        if missing:
+            texts_by_key = self._texts_by_key(keys, texts, missing)
+            new_vectors = self._computed(texts_by_key, compute(list(texts_by_key.values())))
+            if self._redis is not None:
+                self._redis_set(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key].tolist() for key in keys]
+
+    async def _aembed(self, texts: list[str], acompute) -> list[list[float]]:
+        """`_embed` for the event loop: awaits Redis and the model instead of blocking a thread."""
+        keys = [self.cache_key(text) for text in texts]
+        vectors = self._memory_lookup(keys)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing and self._async_redis is not None:
+            vectors.update(self._persistent_hits(await self._aredis_get(missing)))
+            missing = [key for key in missing if key not in vectors]
+
+        if missing:
+            texts_by_key = self._texts_by_key(keys, texts, missing)
+            new_vectors = self._computed(texts_by_key, await acompute(list(texts_by_key.values())))
+            if self._async_redis is not None:
+                await self._aredis_set(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def _memory_lookup(self, keys: list[str]) -> dict:
+        # Tier 1: in-process LRU
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory_get(key)
+                if vector is not None:
+                    vectors[key] = vector
+            self._stats["memory_hits"] += len(vectors)
+        return vectors
+
+    def _persistent_hits(self, found: dict) -> dict:
+        with self._lock:
+            for key, vector in found.items():
+                self._memory_put(key, vector)
+            self._stats["persistent_hits"] += len(found)
+        return found
+
+    @staticmethod
+    def _texts_by_key(keys: list[str], texts: list[str], missing: list[str]) -> dict:
+        missing_set = set(missing)
+        return {key: text for key, text in zip(keys, texts) if key in missing_set}
+
+    def _computed(self, texts_by_key: dict, computed) -> dict:
+        new_vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(texts_by_key, computed)}
+        with self._lock:
+            for key, vector in new_vectors.items():
+                self._memory_put(key, vector)
+            self._stats["misses"] += len(new_vectors)
+        return new_vectors
+
+    def _memory_get(self, key):
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+        return vector
+
+    def _memory_put(self, key, vector):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory_bytes > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self._stats["evictions"] += 1
+
+    def _redis_get(self, keys: list[str]) -> dict:
+        try:
+            values = self._redis.mget(keys)
+        except redis.RedisError as e:
+            print(f"Embedding cache: Redis lookup failed, falling back to the model. Error: {e}")
+            return {}
+        return {key: np.frombuffer(value, dtype=np.float32) for key, value in zip(keys, values) if value is not None}
+
+    async def _aredis_get(self, keys: list[str]) -> dict:
+        try:
+            values = await self._async_redis.mget(keys)
+        except redis.RedisError as e:
+            print(f"Embedding cache: Redis lookup failed, falling back to the model. Error: {e}")
+            return {}
+        return {key: np.frombuffer(value, dtype=np.float32) for key, value in zip(keys, values) if value is not None}
+
+    def _redis_set(self, vectors: dict):
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for key, vector in vectors.items():
+                pipe.set(key, vector.tobytes(), ex=self.ttl_seconds)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Embedding cache: Redis write failed. Error: {e}")
+
+    async def _aredis_set(self, vectors: dict):
+        try:
+            async with self._async_redis.pipeline(transaction=False) as pipe:
+                for key, vector in vectors.items():
+                    pipe.set(key, vector.tobytes(), ex=self.ttl_seconds)
+                await pipe.execute()
+        except redis.RedisError as e:
+            print(f"Embedding cache: Redis write failed. Error: {e}")
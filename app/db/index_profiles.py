@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+
+from qdrant_client import models
+
+
+@dataclass(frozen=True)
+class IndexProfile:
+    """
+    Named set of Qdrant index settings: HNSW graph parameters, search-time ef,
+    quantization and on-disk storage. Selected with QDRANT_INDEX_PROFILE.
+    """
+    name: str
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    search_ef: int | None = None
+    quantization: str | None = None # None, "scalar" (int8) or "binary"
+    oversampling: float = 1.0
+    rescore: bool = True
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+
+    def vectors_config(self, size: int) -> models.VectorParams:
+        return models.VectorParams(size=size, distance=models.Distance.COSINE, on_disk=self.on_disk_vectors)
+
+    def hnsw_config(self) -> models.HnswConfigDiff:
+        return models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def search_params(self) -> models.SearchParams | None:
+        if self.search_ef is None and self.quantization is None:
+            return None
+        quantization = None
+        if self.quantization is not None:
+            quantization = models.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        return models.SearchParams(hnsw_ef=self.search_ef, quantization=quantization)
+
+
+PROFILES = {
+    # Qdrant defaults, everything in RAM
+    "default": IndexProfile("default"),
+    # int8 vectors in RAM with rescoring, 4x less vector memory at similar recall
+    "balanced": IndexProfile(
+        "balanced", hnsw_ef_construct=200, search_ef=128,
+        quantization="scalar", oversampling=2.0,
+    ),
+    # Full vectors and payload on disk, binary codes in RAM, for very large corpora
+    "low_memory": IndexProfile(
+        "low_memory", hnsw_ef_construct=100, search_ef=128,
+        quantization="binary", oversampling=3.0,
+        on_disk_vectors=True, on_disk_payload=True,
+    ),
+    # Denser graph and wider search when recall matters more than latency
+    "high_recall": IndexProfile("high_recall", hnsw_m=32, hnsw_ef_construct=256, search_ef=256),
+}
+
+
+def get_profile(name: str) -> IndexProfile:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown index profile: {name}. Available: {', '.join(PROFILES)}")
+    return PROFILES[name]
@@ -1,20 +1,115 @@
-from sqlalchemy import create_engine
+import csv
+import io
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, delete, func, insert, inspect, or_, select, text, update
+from sqlalchemy.engine import Connection, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 
 from app.core.config import settings
 from app.db.models import Base
 
-from .models import FileMetadata, InterviewBooking
+from .models import Chunk, EmailOutbox, FileMetadata, FileVersion, InterviewBooking, IngestionJob
 
-# Create the engine to connect to the database
-engine = create_engine(settings.DATABASE_URL)
+# Async drivers for the URLs of the sync engine
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+# Values for existing rows of columns added to an existing table, where they differ from the
+# column default: files ingested before versioning are complete, as their first version
+_BACKFILL_VALUES = {("file_metadata", "status"): "ready", ("file_metadata", "version"): 1}
+
+# Chunk rows are written with COPY on PostgreSQL, and with executemany on other databases
+CHUNK_COLUMNS = ["file_id", "version", "chunk_index", "point_id", "content_hash", "char_start", "char_end", "page", "char_count"]
+
+
+def _engine_options(url: str) -> dict:
+    # Connections are checked before use, so a restarted database doesn't fail requests
+    options = {"pool_pre_ping": True}
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=settings.DATABASE_POOL_SIZE,
+            max_overflow=settings.DATABASE_MAX_OVERFLOW,
+            pool_recycle=settings.DATABASE_POOL_RECYCLE_SECONDS,
+        )
+    return options
+
+def _async_url() -> str:
+    if settings.DATABASE_ASYNC_URL:
+        return settings.DATABASE_ASYNC_URL
+    url = make_url(settings.DATABASE_URL)
+    return url.set(drivername=_ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
+
+# Create the engine to connect to the database.
+# The sync engine serves the ingestion workers, the API uses the async one.
+engine = create_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
 
 # SessionLocal class is a factory for new Session objects
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+_async_engine = None
+_async_session_factory = None
+
+def get_async_engine():
+    # Created on first use, so worker processes never import the async driver
+    global _async_engine
+    if _async_engine is None:
+        url = _async_url()
+        _async_engine = create_async_engine(url, **_engine_options(url))
+    return _async_engine
+
+def AsyncSessionLocal() -> AsyncSession:
+    """Returns a new AsyncSession, use it as `async with AsyncSessionLocal() as db:`."""
+    global _async_session_factory
+    if _async_session_factory is None:
+        _async_session_factory = async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+    return _async_session_factory()
+
+async def dispose_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _async_session_factory = None
+
 def init_db():
-    # This creates all the tables defined in models.py
-    Base.metadata.create_all(bind=engine)
+    # This creates all the tables defined in models.py, and the columns and
+    # indexes that tables created by an older version are missing
+    with engine.begin() as connection:
+        Base.metadata.create_all(bind=connection)
+        _upgrade_tables(connection)
+
+def _upgrade_tables(connection: Connection):
+    """
+    create_all only creates missing tables. Adds the columns and indexes added
+    to models.py since a table was created, and fills the new columns of
+    existing rows. Safe to run on every startup.
+    """
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            definition = f"{preparer.format_column(column)} {column.type.compile(dialect=connection.dialect)}"
+            server_default = column.server_default.arg if column.server_default is not None else None
+            if server_default is not None and connection.dialect.name != "sqlite":
+                # SQLite can't add a column whose default is an expression such as now()
+                definition += f" DEFAULT {server_default.compile(dialect=connection.dialect)}"
+            connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}"))
+            print(f"Added column {table.name}.{column.name}.")
+
+            value = _BACKFILL_VALUES.get((table.name, column.name))
+            if value is None and column.default is not None and column.default.is_scalar:
+                value = column.default.arg
+            if value is not None:
+                connection.execute(update(table).where(column.is_(None)).values({column.name: value}))
+
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                print(f"Created index {index.name}.")
 
 def get_db():
     # Dependency to get a DB session for each request
@@ -23,22 +118,193 @@ def get_db():
         yield db
     finally:
         db.close()
-        
 
-def save_file_metadata(db: Session, file_name: str, chunking_strategy: str, embedding_model: str):
+async def get_async_db():
+    # Async counterpart of get_db, for the API endpoints
+    async with AsyncSessionLocal() as db:
+        yield db
+
+@contextmanager
+def session_scope():
+    """A session for code outside of a request, e.g. the agent's tools."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Files and chunks
+def save_file_metadata(
+    db: Session,
+    file_name: str,
+    chunking_strategy: str,
+    embedding_model: str,
+    file_type: str | None = None,
+    file_size_bytes: int | None = None,
+    document_key: str | None = None,
+):
     """Saves a record of the processed file to the PostgreSQL database."""
     db_file = FileMetadata(
         file_name=file_name,
+        document_key=document_key,
+        version=0,
         chunking_strategy=chunking_strategy,
         embedding_model=embedding_model,
+        file_type=file_type,
+        file_size_bytes=file_size_bytes,
+        status="processing",
     )
     db.add(db_file)
     db.commit()
     db.refresh(db_file)
     return db_file
 
-def save_booking(db: Session, full_name: str, email: str, date: str, time: str) -> int:
-    """Saves an interview booking to the PostgreSQL database."""
+def find_file_by_key(db: Session, document_key: str) -> FileMetadata | None:
+    return db.query(FileMetadata).filter(FileMetadata.document_key == document_key).first()
+
+def complete_file_version(
+    db: Session,
+    db_file: FileMetadata,
+    version: int,
+    chunks_added: int,
+    chunks_removed: int,
+    **stats,
+):
+    """
+    Makes `version` the current version of the file: drops the chunk rows of
+    older versions, stores the final statistics (chunk_count, page_count, ...)
+    and records the version. One transaction.
+    """
+    db.execute(delete(Chunk).where(Chunk.file_id == db_file.id, Chunk.version < version))
+    for key, value in stats.items():
+        setattr(db_file, key, value)
+    db_file.version = version
+    db_file.status = "ready"
+    db_file.completed_at = datetime.now(timezone.utc)
+    db.add(FileVersion(
+        file_id=db_file.id,
+        version=version,
+        content_hash=stats.get("content_hash"),
+        chunk_count=stats.get("chunk_count"),
+        chunks_added=chunks_added,
+        chunks_removed=chunks_removed,
+        ingest_seconds=stats.get("ingest_seconds"),
+    ))
+    db.commit()
+
+def get_file_metadata(db: Session, file_id: int, for_update: bool = False) -> FileMetadata | None:
+    """With `for_update`, the row is locked (SELECT ... FOR UPDATE) and reloaded until the transaction ends."""
+    if for_update:
+        return db.get(FileMetadata, file_id, with_for_update=True, populate_existing=True)
+    return db.get(FileMetadata, file_id)
+
+def delete_file_metadata(db: Session, db_file: FileMetadata):
+    # Chunks and versions are deleted explicitly, SQLite doesn't enforce the cascade
+    db.execute(delete(Chunk).where(Chunk.file_id == db_file.id))
+    db.execute(delete(FileVersion).where(FileVersion.file_id == db_file.id))
+    db.delete(db_file)
+    db.commit()
+
+def delete_chunks(db: Session, file_id: int, version: int, commit: bool = True):
+    db.execute(delete(Chunk).where(Chunk.file_id == file_id, Chunk.version == version))
+    if commit:
+        db.commit()
+
+def stale_point_ids(db: Session, file_id: int, version: int) -> list[str]:
+    """Points of older versions of the file that `version` no longer contains."""
+    current = select(Chunk.point_id).where(Chunk.file_id == file_id, Chunk.version == version)
+    result = db.execute(
+        select(Chunk.point_id).distinct()
+        .where(Chunk.file_id == file_id, Chunk.version < version, Chunk.point_id.not_in(current))
+    )
+    return list(result.scalars())
+
+def bulk_insert_chunks(db: Session, rows: list[dict]):
+    """
+    Inserts chunk rows in one round trip: COPY on PostgreSQL, a single
+    executemany elsewhere. No ORM objects are created.
+    """
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # None is written as an empty unquoted field, which COPY reads as NULL
+        writer.writerows([row.get(column) for column in CHUNK_COLUMNS] for row in rows)
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        cursor.copy_expert(f"COPY {Chunk.__tablename__} ({', '.join(CHUNK_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        db.execute(insert(Chunk), [{column: row.get(column) for column in CHUNK_COLUMNS} for row in rows])
+    db.commit()
+
+async def aget_file_metadata(db: AsyncSession, file_id: int) -> FileMetadata | None:
+    return await db.get(FileMetadata, file_id)
+
+async def adelete_file_metadata(db: AsyncSession, db_file: FileMetadata):
+    await db.execute(delete(Chunk).where(Chunk.file_id == db_file.id))
+    await db.execute(delete(FileVersion).where(FileVersion.file_id == db_file.id))
+    await db.delete(db_file)
+    await db.commit()
+
+async def alist_files(db: AsyncSession, limit: int = 100, offset: int = 0) -> list[FileMetadata]:
+    result = await db.execute(select(FileMetadata).order_by(FileMetadata.id.desc()).limit(limit).offset(offset))
+    return list(result.scalars())
+
+async def alist_chunks(db: AsyncSession, db_file: FileMetadata, limit: int = 100, offset: int = 0) -> list[Chunk]:
+    # Chunks of the current version, a re-ingestion in progress writes the next one
+    result = await db.execute(
+        select(Chunk)
+        .where(Chunk.file_id == db_file.id, Chunk.version == db_file.version)
+        .order_by(Chunk.chunk_index).limit(limit).offset(offset)
+    )
+    return list(result.scalars())
+
+async def alist_file_versions(db: AsyncSession, file_id: int) -> list[FileVersion]:
+    result = await db.execute(select(FileVersion).where(FileVersion.file_id == file_id).order_by(FileVersion.version))
+    return list(result.scalars())
+
+async def aget_ingestion_stats(db: AsyncSession) -> dict:
+    """
+    Corpus-wide statistics. Computed from the per-file counters, so the cost
+    depends on the number of files, not on the number of chunks.
+    """
+    statuses = dict((await db.execute(select(FileMetadata.status, func.count()).group_by(FileMetadata.status))).all())
+    row = (await db.execute(
+        select(
+            func.coalesce(func.sum(FileMetadata.chunk_count), 0),
+            func.avg(FileMetadata.chunk_count),
+            func.max(FileMetadata.chunk_count),
+            func.coalesce(func.sum(FileMetadata.file_size_bytes), 0),
+            func.coalesce(func.sum(FileMetadata.character_count), 0),
+            func.coalesce(func.sum(FileMetadata.ingest_seconds), 0.0),
+            func.avg(FileMetadata.ingest_seconds),
+            func.max(FileMetadata.ingest_seconds),
+        ).where(FileMetadata.status == "ready")
+    )).one()
+    total_chunks, avg_chunks, max_chunks, total_bytes, total_characters, total_seconds, avg_seconds, max_seconds = row
+    return {
+        "files": sum(statuses.values()),
+        "files_by_status": statuses,
+        "chunks": int(total_chunks),
+        "chunks_per_file": {"avg": _rounded(avg_chunks), "max": max_chunks},
+        "bytes": int(total_bytes),
+        "characters": int(total_characters),
+        "ingest_seconds": {"total": _rounded(total_seconds), "avg": _rounded(avg_seconds), "max": _rounded(max_seconds)},
+        "chunks_per_second": _rounded(total_chunks / total_seconds) if total_seconds else None,
+    }
+
+def _rounded(value) -> float | None:
+    return round(float(value), 3) if value is not None else None
+
+
+# Bookings
+def save_booking(db: Session, full_name: str, email: str, date: str, time: str, confirmation: dict | None = None) -> int:
+    """
+    Saves an interview booking to the PostgreSQL database. The `confirmation`
+    email is queued in the outbox in the same transaction.
+    """
     booking = InterviewBooking(
         full_name=full_name, 
         email=email, 
@@ -46,7 +312,249 @@ def save_booking(db: Session, full_name: str, email: str, date: str, time: str)
         booking_time=time
     )
     db.add(booking)
+    if confirmation:
+        db.flush()
+        db.add(EmailOutbox(booking_id=booking.id, **confirmation))
     db.commit()
     db.refresh(booking)
     print(f"Successfully saved booking for {full_name} with ID {booking.id} to database.")
-    return booking.id
\ No newline at end of file
+    return booking.id
+
+async def asave_booking(
+    db: AsyncSession, full_name: str, email: str, date: str, time: str, confirmation: dict | None = None
+) -> int:
+    booking = InterviewBooking(full_name=full_name, email=email, booking_date=date, booking_time=time)
+    db.add(booking)
+    if confirmation:
+        await db.flush()
+        db.add(EmailOutbox(booking_id=booking.id, **confirmation))
+    await db.commit()
+    print(f"Successfully saved booking for {full_name} with ID {booking.id} to database.")
+    return booking.id
+
+
+# Email outbox
+async def aclaim_outbox_emails(db: AsyncSession, limit: int, lease_seconds: float) -> list[EmailOutbox]:
+    """
+    Moves up to `limit` due emails to 'sending' and returns them. Rows locked by
+    another dispatcher are skipped. A 'sending' email whose lease expired (its
+    dispatcher died mid-send) is due again.
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(EmailOutbox)
+        .where(EmailOutbox.status.in_(("pending", "sending")), EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    emails = list(result.scalars())
+    for email in emails:
+        email.status = "sending"
+        email.attempts += 1
+        email.next_attempt_at = now + timedelta(seconds=lease_seconds)
+    await db.commit()
+    return emails
+
+def record_email_result(email: EmailOutbox, error: str | None, max_attempts: int, backoff_seconds: float) -> str:
+    """
+    Sets the delivery state of a claimed email: 'sent', back to 'pending' with
+    an exponential backoff, or 'failed' after `max_attempts`. Returns the state.
+    """
+    now = datetime.now(timezone.utc)
+    if error is None:
+        email.status = "sent"
+        email.sent_at = now
+        email.last_error = None
+    elif email.attempts >= max_attempts:
+        email.status = "failed"
+        email.last_error = error
+    else:
+        email.status = "pending"
+        email.last_error = error
+        email.next_attempt_at = now + timedelta(seconds=backoff_seconds * 2 ** (email.attempts - 1))
+    return email.status
+
+
+# Ingestion jobs
+async def acreate_ingestion_job(
+    db: AsyncSession,
+    job_id: str,
+    file_name: str,
+    file_type: str,
+    file_path: str,
+    chunking_strategy: str,
+    batch_id: str | None = None,
+    document_key: str | None = None,
+    commit: bool = True,
+) -> IngestionJob:
+    """
+    Records a new queued ingestion job. Bulk uploads pass commit=False and commit all jobs at once.
+    Raises IntegrityError if a queued or running job already ingests `document_key`.
+    """
+    job = IngestionJob(
+        id=job_id,
+        file_name=file_name,
+        file_type=file_type,
+        file_path=file_path,
+        chunking_strategy=chunking_strategy,
+        batch_id=batch_id,
+        document_key=document_key,
+        status="queued",
+        stage="queued",
+        stage_progress={},
+    )
+    db.add(job)
+    if commit:
+        await db.commit()
+    return job
+
+def get_ingestion_job(db: Session, job_id: str) -> IngestionJob | None:
+    return db.get(IngestionJob, job_id)
+
+async def aget_ingestion_job(db: AsyncSession, job_id: str) -> IngestionJob | None:
+    return await db.get(IngestionJob, job_id)
+
+async def alist_batch_jobs(db: AsyncSession, batch_id: str) -> list[IngestionJob]:
+    result = await db.execute(
+        select(IngestionJob).where(IngestionJob.batch_id == batch_id).order_by(IngestionJob.file_name)
+    )
+    return list(result.scalars())
+
+async def aactive_document_keys(db: AsyncSession, document_keys: list[str]) -> set[str]:
+    """The keys among `document_keys` that a queued or running job is ingesting."""
+    result = await db.execute(
+        select(IngestionJob.document_key).distinct()
+        .where(IngestionJob.document_key.in_(document_keys), IngestionJob.status.in_(("queued", "running")))
+    )
+    return set(result.scalars())
+
+def count_pending_jobs(db: Session) -> int:
+    """Queued and running jobs of all processes: the depth of the ingestion queue."""
+    return db.query(func.count(IngestionJob.id)).filter(IngestionJob.status.in_(("queued", "running"))).scalar()
+
+async def acount_pending_jobs(db: AsyncSession) -> int:
+    """Queued and running jobs of all processes: the depth of the ingestion queue."""
+    result = await db.execute(
+        select(func.count()).select_from(IngestionJob).where(IngestionJob.status.in_(("queued", "running")))
+    )
+    return result.scalar_one()
+
+async def ahas_active_job(db: AsyncSession, file_id: int) -> bool:
+    """Whether a queued or running ingestion job is still storing chunks for the file."""
+    result = await db.execute(
+        select(IngestionJob.id)
+        .where(IngestionJob.file_id == file_id, IngestionJob.status.in_(("queued", "running")))
+        .limit(1)
+    )
+    return result.first() is not None
+
+def claim_ingestion_job(db: Session, job_id: str, worker_id: str, lease_seconds: float) -> IngestionJob | None:
+    """
+    Atomically moves a queued job that is due to 'running', leased to `worker_id`
+    for `lease_seconds`. Returns None if another worker already claimed it or its
+    retry backoff (not_before) has not passed yet.
+    """
+    now = datetime.now(timezone.utc)
+    result = db.execute(
+        update(IngestionJob)
+        .where(
+            IngestionJob.id == job_id,
+            IngestionJob.status == "queued",
+            or_(IngestionJob.not_before.is_(None), IngestionJob.not_before <= now),
+        )
+        .values(
+            status="running",
+            attempts=IngestionJob.attempts + 1,
+            error=None,
+            claimed_by=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            not_before=None,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount == 0:
+        return None
+    job = db.get(IngestionJob, job_id)
+    db.refresh(job)
+    return job
+
+def renew_job_lease(db: Session, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+    """Extends the lease of a running job. False if the worker doesn't hold it anymore."""
+    result = db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == job_id, IngestionJob.status == "running", IngestionJob.claimed_by == worker_id)
+        .values(lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount > 0
+
+def seconds_until_due(job: IngestionJob) -> float:
+    """How long a queued job still backs off before it can be claimed, 0 if it is due."""
+    if job.not_before is None:
+        return 0.0
+    not_before = job.not_before
+    if not_before.tzinfo is None:
+        # SQLite returns naive timestamps, they are UTC
+        not_before = not_before.replace(tzinfo=timezone.utc)
+    return max((not_before - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+def update_job_stage(db: Session, job: IngestionJob, stage: str, **progress):
+    """Marks the current stage of a job and merges progress details for that stage."""
+    stages = dict(job.stage_progress or {})
+    stages[stage] = {**stages.get(stage, {}), **progress}
+    job.stage = stage
+    job.stage_progress = stages
+    db.commit()
+
+def finish_ingestion_job(
+    db: Session,
+    job: IngestionJob,
+    status: str,
+    error: str | None = None,
+    retry_after: float | None = None,
+):
+    """Ends a run of the job and releases its lease. A job requeued for a retry waits `retry_after` seconds."""
+    job.status = status
+    job.stage = status
+    job.error = error
+    job.claimed_by = None
+    job.lease_expires_at = None
+    if retry_after:
+        job.not_before = datetime.now(timezone.utc) + timedelta(seconds=retry_after)
+    if status in ("completed", "failed"):
+        job.finished_at = datetime.now(timezone.utc)
+    db.commit()
+
+def reclaim_expired_jobs(db: Session, stale_after_seconds: int) -> list[str]:
+    """
+    Resets 'running' jobs whose lease expired (their worker died or hangs) back
+    to 'queued' and returns their IDs. Jobs claimed before leases existed are
+    reset once they have not been updated for `stale_after_seconds`. Each job
+    is reclaimed by one process only, even when several reclaim at once.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=stale_after_seconds)
+    result = db.execute(
+        update(IngestionJob)
+        .where(
+            IngestionJob.status == "running",
+            or_(
+                IngestionJob.lease_expires_at < now,
+                IngestionJob.lease_expires_at.is_(None) & (IngestionJob.updated_at < cutoff),
+            ),
+        )
+        .values(status="queued", stage="queued", claimed_by=None, lease_expires_at=None)
+        .returning(IngestionJob.id)
+        .execution_options(synchronize_session=False)
+    )
+    job_ids = list(result.scalars())
+    db.commit()
+    return job_ids
+
+def list_resumable_jobs(db: Session, stale_after_seconds: int) -> list[IngestionJob]:
+    """Returns queued jobs, after reclaiming running jobs whose lease expired (see reclaim_expired_jobs)."""
+    reclaim_expired_jobs(db, stale_after_seconds)
+    return db.query(IngestionJob).filter(IngestionJob.status == "queued").order_by(IngestionJob.created_at).all()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func
+from sqlalchemy import BigInteger, Column, Float, ForeignKey, Index, Integer, String, Text, DateTime, JSON, func
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -7,9 +7,49 @@ class FileMetadata(Base):
     __tablename__ = "file_metadata"
     id = Column(Integer, primary_key=True, index=True)
     file_name = Column(String, index=True)
+    document_key = Column(String, nullable=True, unique=True, index=True) # stable identity across re-uploads, given by the upload; None for a one-off document
+    version = Column(Integer, default=0) # number of completed ingestions
+    content_hash = Column(String(64), nullable=True) # SHA-256 of the uploaded file of the current version
     chunking_strategy = Column(String)
     embedding_model = Column(String)
+    status = Column(String, default="processing") # processing, ready
+    file_type = Column(String, nullable=True)
+    file_size_bytes = Column(BigInteger, nullable=True)
+    page_count = Column(Integer, nullable=True)
+    character_count = Column(BigInteger, nullable=True)
+    chunk_count = Column(Integer, nullable=True)
+    ingest_seconds = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+class FileVersion(Base):
+    """One row per completed ingestion of a file, with what changed compared to the previous version."""
+    __tablename__ = "file_versions"
+    id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey("file_metadata.id", ondelete="CASCADE"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=True)
+    chunk_count = Column(Integer, nullable=True)
+    chunks_added = Column(Integer, nullable=True) # embedded and upserted
+    chunks_removed = Column(Integer, nullable=True) # deleted from Qdrant
+    ingest_seconds = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Chunk(Base):
+    """One row per chunk stored in Qdrant, so where a chunk comes from can be looked up without Qdrant."""
+    __tablename__ = "chunks"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    file_id = Column(Integer, ForeignKey("file_metadata.id", ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False) # file version the row belongs to
+    chunk_index = Column(Integer, nullable=False)
+    point_id = Column(String(36), nullable=False) # Qdrant point ID
+    content_hash = Column(String(64), nullable=False)
+    char_start = Column(Integer, nullable=True) # offsets in the extracted text of the file
+    char_end = Column(Integer, nullable=True)
+    page = Column(Integer, nullable=True) # 1-based, PDFs only
+    char_count = Column(Integer, nullable=False)
+
+    __table_args__ = (Index("ix_chunks_file_id_version_chunk_index", "file_id", "version", "chunk_index"),)
 
 class InterviewBooking(Base):
     __tablename__ = "interview_bookings"
@@ -18,4 +58,52 @@ class InterviewBooking(Base):
     email = Column(String)
     booking_date = Column(String)
     booking_time = Column(String)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class EmailOutbox(Base):
+    """Emails to send, written in the same transaction as the record they belong to."""
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    booking_id = Column(Integer, ForeignKey("interview_bookings.id"), nullable=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String, default="pending") # pending, sending, sent, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now()) # also the lease of a 'sending' email
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),)
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    id = Column(String, primary_key=True, index=True)
+    file_name = Column(String)
+    file_type = Column(String)
+    file_path = Column(String)
+    chunking_strategy = Column(String)
+    file_id = Column(Integer, nullable=True, index=True) # FileMetadata row created when processing starts
+    batch_id = Column(String, nullable=True, index=True) # set for files of a bulk upload
+    document_key = Column(String, nullable=True, index=True) # see FileMetadata.document_key
+    status = Column(String, index=True, default="queued") # queued, running, completed, failed
+    stage = Column(String, default="queued")
+    stage_progress = Column(JSON, default=dict)
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    claimed_by = Column(String, nullable=True) # host:pid of the worker running the job
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True) # renewed while running, reclaimed once expired
+    not_before = Column(DateTime(timezone=True), nullable=True) # retry backoff of a queued job
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Versions of one document are ingested one after the other: one active job per document key
+    __table_args__ = (
+        Index(
+            "ux_ingestion_jobs_active_document_key", document_key, unique=True,
+            postgresql_where=status.in_(("queued", "running")),
+            sqlite_where=status.in_(("queued", "running")),
+        ),
+    )
@@ -0,0 +1,42 @@
+import hashlib
+import re
+from collections import Counter
+
+from qdrant_client import models
+
+# Name of the sparse vector in the Qdrant collection
+SPARSE_VECTOR_NAME = "bm25"
+
+# BM25 parameters. Qdrant applies the IDF part at query time (Modifier.IDF),
+# so documents only carry the saturated term frequencies.
+K1 = 1.2
+B = 0.75
+AVG_DOC_TOKENS = 100
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def token_index(token: str) -> int:
+    """Stable 31-bit index for a token, so no vocabulary has to be stored."""
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "little") & 0x7FFFFFFF
+
+
+def encode_document(text: str) -> models.SparseVector:
+    """BM25 term-frequency vector of a chunk, computed at ingestion time."""
+    tokens = tokenize(text)
+    length_norm = 1 - B + B * len(tokens) / AVG_DOC_TOKENS
+    weights = {}
+    for token, tf in Counter(tokens).items():
+        index = token_index(token)
+        weights[index] = weights.get(index, 0.0) + tf * (K1 + 1) / (tf + K1 * length_norm)
+    return models.SparseVector(indices=list(weights), values=list(weights.values()))
+
+
+def encode_query(text: str) -> models.SparseVector:
+    indices = sorted({token_index(token) for token in tokenize(text)})
+    return models.SparseVector(indices=indices, values=[1.0] * len(indices))
@@ -1,64 +1,409 @@
-from qdrant_client import QdrantClient, models
-from langchain_community.embeddings import SentenceTransformerEmbeddings
+import hashlib
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from qdrant_client import QdrantClient, AsyncQdrantClient, models
+from app.core import metrics
 from app.core.config import settings
-from langchain_community.vectorstores import Qdrant
+from app.db.embedding_batcher import BatchingEmbeddings
+from app.db.embedding_cache import CachedEmbeddings
+from app.db import embedding_backends, sparse_encoder
+from app.db.index_profiles import IndexProfile, get_profile
+from langchain.schema.document import Document
 
-from langchain.retrievers.multi_query import MultiQueryRetriever
-from langchain_google_genai import ChatGoogleGenerativeAI
+EMBEDDING_MODEL_NAME = settings.EMBEDDING_MODEL
+# Model plus backend, recorded per file and used in the embedding cache keys
+EMBEDDING_MODEL_ID = embedding_backends.model_id(EMBEDDING_MODEL_NAME, settings.EMBEDDING_BACKEND)
+
+# The dense vector is the collection's unnamed default vector, next to the named sparse one
+DENSE_VECTOR_NAME = ""
+
+# Namespace for deterministic point IDs derived from chunk content
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c1d2e-6a55-4a8e-9f1e-2b8f4f0c3a11")
 
 _qdrant_client = None
+_async_qdrant_client = None
 _embedding_function = None
+_sparse_enabled = None
+_upsert_executor = None
+
+# Payload filter applied to the searches of the current request, e.g. the files picked in /chat
+_search_filter: ContextVar[models.Filter | None] = ContextVar("search_filter", default=None)
 
 def get_qdrant_client():
     global _qdrant_client
     if _qdrant_client is None:
-        _qdrant_client = QdrantClient(host=settings.QDRANT_HOST, port=settings.QDRANT_PORT)
+        if settings.QDRANT_LOCATION:
+            _qdrant_client = QdrantClient(location=settings.QDRANT_LOCATION)
+        else:
+            _qdrant_client = QdrantClient(
+                host=settings.QDRANT_HOST,
+                port=settings.QDRANT_PORT,
+                grpc_port=settings.QDRANT_GRPC_PORT,
+                prefer_grpc=settings.QDRANT_PREFER_GRPC,
+            )
     return _qdrant_client
 
+def get_async_qdrant_client():
+    global _async_qdrant_client
+    if _async_qdrant_client is None:
+        if settings.QDRANT_LOCATION:
+            # NOTE: an in-process ":memory:" instance is not shared with the sync client
+            _async_qdrant_client = AsyncQdrantClient(location=settings.QDRANT_LOCATION)
+        else:
+            _async_qdrant_client = AsyncQdrantClient(
+                host=settings.QDRANT_HOST,
+                port=settings.QDRANT_PORT,
+                grpc_port=settings.QDRANT_GRPC_PORT,
+                prefer_grpc=settings.QDRANT_PREFER_GRPC,
+            )
+    return _async_qdrant_client
+
 def get_embedding_function():
     global _embedding_function
     if _embedding_function is None:
-        # Initialize the embedding function with a specific model
-        _embedding_function = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
+        # Initialize the embedding function with a specific model.
+        # All callers share one batching engine so concurrent requests are embedded together.
+        model = embedding_backends.load_embeddings(
+            EMBEDDING_MODEL_NAME,
+            settings.EMBEDDING_BACKEND,
+            threads=settings.EMBEDDING_THREADS,
+            onnx_file=settings.EMBEDDING_ONNX_FILE,
+        )
+        batcher = BatchingEmbeddings(
+            model,
+            max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+            max_wait_ms=settings.EMBEDDING_MAX_WAIT_MS,
+        )
+        # Cache in front of the batcher so only cache misses reach the model
+        _embedding_function = CachedEmbeddings(
+            batcher,
+            model_name=EMBEDDING_MODEL_ID,
+            max_bytes=settings.EMBEDDING_CACHE_MAX_BYTES,
+            redis_url=settings.REDIS_URL if settings.EMBEDDING_CACHE_BACKEND == "redis" else None,
+            ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+        )
     return _embedding_function
 
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_point_id(source: str, chunk_hash: str) -> str:
+    """
+    Deterministic Qdrant point ID for a chunk of a given file (its FileMetadata ID, or
+    its name when there is none). Retries and new versions of a file find unchanged
+    chunks under the same ID and don't embed them again. The model is part of the
+    ID, so switching models re-embeds everything.
+    The file is part of the ID on purpose: a point's payload carries its file,
+    pages and offsets, which file filters, deletes and version diffs rely on. An
+    identical chunk in two files is stored twice but embedded once, the
+    embedding cache is keyed by content alone.
+    """
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{source}\0{EMBEDDING_MODEL_ID}\0{chunk_hash}"))
+
+def get_index_profile() -> IndexProfile:
+    return get_profile(settings.QDRANT_INDEX_PROFILE)
+
+def create_collection(client: QdrantClient, collection_name: str, profile: IndexProfile, embedding_size: int):
+    """Creates a collection with the dense + sparse vectors and the index settings of a profile."""
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=profile.vectors_config(embedding_size),
+        sparse_vectors_config=_sparse_config(),
+        hnsw_config=profile.hnsw_config(),
+        quantization_config=profile.quantization_config(),
+        on_disk_payload=profile.on_disk_payload,
+    )
+    create_payload_indexes(client, collection_name)
+
+def create_payload_indexes(client: QdrantClient, collection_name: str):
+    # Indexed fields keep filtered searches and deletes fast at any collection size.
+    # Qdrant also uses them to keep the HNSW graph connected within a filtered subset.
+    for field_name, field_schema in (
+        ("metadata.source", models.PayloadSchemaType.KEYWORD),
+        ("metadata.file_id", models.PayloadSchemaType.INTEGER),
+        ("metadata.uploaded_at", models.PayloadSchemaType.DATETIME),
+    ):
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=field_schema,
+        )
+
+def _sparse_config() -> dict:
+    return {sparse_encoder.SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)}
+
 def init_db():
+    global _sparse_enabled
     client = get_qdrant_client()
     embedding_size = get_embedding_function().client.get_sentence_embedding_dimension()
     
     # Check if the collection already exists
     try:
-        client.get_collection(collection_name=settings.QDRANT_COLLECTION_NAME)
-        print("Qdrant collection already exists.")
+        collection = client.get_collection(collection_name=settings.QDRANT_COLLECTION_NAME)
     except Exception:
+        collection = None
+
+    if collection is None:
         # If it doesn't exist, create it
-        print("Creating Qdrant collection.")
-        client.create_collection(
-            collection_name=settings.QDRANT_COLLECTION_NAME,
-            vectors_config=models.VectorParams(size=embedding_size, distance=models.Distance.COSINE),
+        print(f"Creating Qdrant collection with the '{settings.QDRANT_INDEX_PROFILE}' index profile.")
+        create_collection(client, settings.QDRANT_COLLECTION_NAME, get_index_profile(), embedding_size)
+    else:
+        # Existing collections keep their index settings. Use collection_migration to switch profiles.
+        print("Qdrant collection already exists.")
+        check_vector_size(collection, embedding_size)
+        create_payload_indexes(client, settings.QDRANT_COLLECTION_NAME)
+        if sparse_encoder.SPARSE_VECTOR_NAME not in (collection.config.params.sparse_vectors or {}):
+            # Collections created before hybrid search get the sparse vector added.
+            # Points stored earlier are only found by the dense search.
+            print("Adding the BM25 sparse vector to the Qdrant collection.")
+            try:
+                client.update_collection(
+                    collection_name=settings.QDRANT_COLLECTION_NAME,
+                    sparse_vectors_config=_sparse_config(),
+                )
+            except Exception as e:
+                print(f"Could not add the sparse vector, retrieval stays dense-only. Error: {e}")
+    _sparse_enabled = None
+
+def dense_vector_params(collection, collection_name: str) -> models.VectorParams:
+    """The params of the dense vector of a collection, or a clear error if it has none the app can use."""
+    vectors = collection.config.params.vectors
+    # Unnamed default vector, or a dict of named vectors
+    if isinstance(vectors, models.VectorParams):
+        return vectors
+    if vectors and DENSE_VECTOR_NAME in vectors:
+        return vectors[DENSE_VECTOR_NAME]
+    raise RuntimeError(
+        f"Qdrant collection '{collection_name}' has no unnamed dense vector, only the named vectors "
+        f"{sorted(vectors or {})}. It was not created by this app: use a different QDRANT_COLLECTION_NAME."
+    )
+
+def check_vector_size(collection, embedding_size: int):
+    """Refuses to run against a collection built for a model with another dimension."""
+    size = dense_vector_params(collection, settings.QDRANT_COLLECTION_NAME).size
+    if size != embedding_size:
+        raise RuntimeError(
+            f"Qdrant collection '{settings.QDRANT_COLLECTION_NAME}' stores {size}-dimensional vectors, "
+            f"but the embedding model {EMBEDDING_MODEL_ID} produces {embedding_size}. "
+            f"Use a different QDRANT_COLLECTION_NAME or re-ingest the documents."
         )
 
-def get_vector_store() -> Qdrant:
+def sparse_enabled() -> bool:
+    """Whether the collection has the BM25 sparse vector that hybrid search needs."""
+    global _sparse_enabled
+    if _sparse_enabled is None:
+        collection = get_qdrant_client().get_collection(collection_name=settings.QDRANT_COLLECTION_NAME)
+        _sparse_enabled = sparse_encoder.SPARSE_VECTOR_NAME in (collection.config.params.sparse_vectors or {})
+    return _sparse_enabled
+
+def add_documents(documents: list, vectors: list | None = None) -> int:
     """
-    Returns a LangChain Qdrant vector store instance.
-    This is the main object we use to interact with Qdrant via LangChain.
+    Stores chunks under content-hash IDs. Chunks that are already in Qdrant are
+    not embedded again, only their payload is refreshed (their position in the
+    file may have changed). Precomputed vectors (e.g. from the semantic chunker)
+    are upserted as they are; the other new chunks are embedded in a single batch.
+    Returns the number of chunks that were stored.
     """
+    unique = {}
+    for i, doc in enumerate(documents):
+        doc.metadata["content_hash"] = content_hash(doc.page_content)
+        point_id = chunk_point_id(doc.metadata.get("file_id") or doc.metadata["source"], doc.metadata["content_hash"])
+        unique[point_id] = (doc, vectors[i] if vectors else None)
+    if not unique:
+        return 0
+
     client = get_qdrant_client()
-    embeddings = get_embedding_function()
-    
-    vector_store = Qdrant(
-        client=client,
+    existing = client.retrieve(
         collection_name=settings.QDRANT_COLLECTION_NAME,
-        embeddings=embeddings,
+        ids=list(unique),
+        with_payload=False,
+        with_vectors=False,
     )
-    return vector_store
+    if existing:
+        _refresh_payloads(client, [(str(point.id), unique.pop(str(point.id))[0]) for point in existing])
+    if not unique:
+        return 0
+
+    to_embed = [point_id for point_id, (_, vector) in unique.items() if vector is None]
+    if to_embed:
+        with metrics.span("ingestion", "embed"):
+            embedded = get_embedding_function().embed_documents([unique[point_id][0].page_content for point_id in to_embed])
+        for point_id, vector in zip(to_embed, embedded):
+            unique[point_id] = (unique[point_id][0], vector)
+
+    # Same payload layout as LangChain's Qdrant store, so its retrievers keep working
+    with_sparse = sparse_enabled()
+    points = [
+        models.PointStruct(
+            id=point_id,
+            vector=_point_vectors(doc, vector, with_sparse),
+            payload={"page_content": doc.page_content, "metadata": doc.metadata},
+        )
+        for point_id, (doc, vector) in unique.items()
+    ]
+    with metrics.span("ingestion", "upsert"):
+        upsert_points(client, settings.QDRANT_COLLECTION_NAME, points)
+    return len(points)
 
 
-def get_retriever():
+def upsert_points(client: QdrantClient, collection_name: str, points: list):
     """
-    Creates a standard retriever from the Qdrant vector store.
+    Upserts in batches of QDRANT_UPSERT_BATCH_SIZE with up to QDRANT_UPSERT_PARALLELISM
+    requests in flight, so large files don't wait on one request at a time.
     """
-    print("Creating a base vector store retriever.")
-    vector_store = get_vector_store()
-    # We will use this as the base for our multi-query retriever in the agent service
-    return vector_store.as_retriever(search_kwargs={"k": 5})
\ No newline at end of file
+    size = settings.QDRANT_UPSERT_BATCH_SIZE
+    batches = [points[i:i + size] for i in range(0, len(points), size)]
+    if len(batches) == 1:
+        client.upsert(collection_name=collection_name, points=batches[0], wait=True)
+        return
+    # list() waits for every batch and re-raises the first failure
+    list(_get_upsert_executor().map(
+        lambda batch: client.upsert(collection_name=collection_name, points=batch, wait=True),
+        batches,
+    ))
+
+
+def _get_upsert_executor() -> ThreadPoolExecutor:
+    global _upsert_executor
+    if _upsert_executor is None:
+        _upsert_executor = ThreadPoolExecutor(
+            max_workers=settings.QDRANT_UPSERT_PARALLELISM,
+            thread_name_prefix="qdrant-upsert",
+        )
+    return _upsert_executor
+
+
+def _refresh_payloads(client: QdrantClient, documents: list[tuple[str, Document]]):
+    operations = [
+        models.SetPayloadOperation(set_payload=models.SetPayload(payload={"metadata": doc.metadata}, points=[point_id]))
+        for point_id, doc in documents
+    ]
+    size = settings.QDRANT_UPSERT_BATCH_SIZE
+    with metrics.span("ingestion", "refresh_payload"):
+        for i in range(0, len(operations), size):
+            client.batch_update_points(
+                collection_name=settings.QDRANT_COLLECTION_NAME,
+                update_operations=operations[i:i + size],
+                wait=True,
+            )
+
+
+def delete_points(point_ids: list[str]):
+    """Deletes points by ID in a single request."""
+    if point_ids:
+        get_qdrant_client().delete(
+            collection_name=settings.QDRANT_COLLECTION_NAME,
+            points_selector=models.PointIdsList(points=point_ids),
+            wait=True,
+        )
+
+
+def delete_file_points(file_id: int) -> int:
+    """Deletes all chunks of a file in one filtered request. Returns how many there were."""
+    client = get_qdrant_client()
+    selector = models.Filter(must=[models.FieldCondition(key="metadata.file_id", match=models.MatchValue(value=file_id))])
+    count = client.count(collection_name=settings.QDRANT_COLLECTION_NAME, count_filter=selector, exact=True).count
+    if count:
+        client.delete(
+            collection_name=settings.QDRANT_COLLECTION_NAME,
+            points_selector=models.FilterSelector(filter=selector),
+            wait=True,
+        )
+    return count
+
+
+def _point_vectors(doc, vector, with_sparse: bool):
+    if not with_sparse:
+        return list(vector)
+    return {DENSE_VECTOR_NAME: list(vector), sparse_encoder.SPARSE_VECTOR_NAME: sparse_encoder.encode_document(doc.page_content)}
+
+
+def build_search_filter(
+    file_ids: list[int] | None = None,
+    uploaded_after: datetime | None = None,
+    uploaded_before: datetime | None = None,
+) -> models.Filter | None:
+    """Payload filter restricting the search to some files and/or an upload date range."""
+    conditions = []
+    if file_ids:
+        conditions.append(models.FieldCondition(key="metadata.file_id", match=models.MatchAny(any=list(file_ids))))
+    if uploaded_after or uploaded_before:
+        conditions.append(models.FieldCondition(
+            key="metadata.uploaded_at",
+            range=models.DatetimeRange(gte=uploaded_after, lte=uploaded_before),
+        ))
+    return models.Filter(must=conditions) if conditions else None
+
+
+@contextmanager
+def filtered_search(query_filter: models.Filter | None):
+    """Applies `query_filter` to every search made in this context, including the agent's tool calls."""
+    token = _search_filter.set(query_filter)
+    try:
+        yield
+    finally:
+        _search_filter.reset(token)
+
+
+def search_filter() -> models.Filter | None:
+    return _search_filter.get()
+
+
+def search_documents(query: str, k: int | None = None, with_vectors: bool = False) -> list[Document]:
+    """
+    Searches the collection with the configured retrieval mode.
+    'hybrid' runs the dense and BM25 searches in one request and fuses them with RRF.
+    With `with_vectors`, each document carries its dense vector in metadata["_vector"].
+    """
+    dense = get_embedding_function().embed_query(query)
+    request = _search_request(query, dense, k or settings.RETRIEVAL_K, with_vectors)
+    response = get_qdrant_client().query_points(**request)
+    return [_to_document(point) for point in response.points]
+
+
+async def asearch_documents(query: str, k: int | None = None, with_vectors: bool = False) -> list[Document]:
+    dense = await get_embedding_function().aembed_query(query)
+    request = _search_request(query, dense, k or settings.RETRIEVAL_K, with_vectors)
+    response = await get_async_qdrant_client().query_points(**request)
+    return [_to_document(point) for point in response.points]
+
+
+def _search_request(query: str, dense: list[float], k: int, with_vectors: bool = False) -> dict:
+    query_filter = search_filter()
+    request = {
+        "collection_name": settings.QDRANT_COLLECTION_NAME,
+        "limit": k,
+        "with_payload": True,
+        # Only the dense vector, the sparse one is of no use to the caller
+        "with_vectors": ([DENSE_VECTOR_NAME] if sparse_enabled() else True) if with_vectors else False,
+        "query_filter": query_filter,
+    }
+    search_params = get_index_profile().search_params()
+    if settings.RETRIEVAL_MODE == "hybrid" and sparse_enabled():
+        prefetch_k = max(k, settings.HYBRID_PREFETCH_K)
+        # Filtered inside each prefetch, so both candidate lists come from the selected files
+        request["prefetch"] = [
+            models.Prefetch(query=dense, filter=query_filter, limit=prefetch_k, params=search_params),
+            models.Prefetch(
+                query=sparse_encoder.encode_query(query), using=sparse_encoder.SPARSE_VECTOR_NAME,
+                filter=query_filter, limit=prefetch_k,
+            ),
+        ]
+        request["query"] = models.FusionQuery(fusion=models.Fusion.RRF)
+    else:
+        request["query"] = dense
+        request["search_params"] = search_params
+    return request
+
+
+def _to_document(point) -> Document:
+    payload = point.payload or {}
+    metadata = dict(payload.get("metadata") or {})
+    metadata["_id"] = point.id
+    metadata["_score"] = point.score
+    if point.vector is not None:
+        metadata["_vector"] = point.vector.get(DENSE_VECTOR_NAME) if isinstance(point.vector, dict) else point.vector
+    return Document(page_content=payload.get("page_content", ""), metadata=metadata)
@@ -1,8 +1,13 @@
+from datetime import datetime
 from pydantic import BaseModel
 
 class ChatRequest(BaseModel):
     query: str
     session_id: str
+    # Optional filters for the document search
+    file_ids: list[int] | None = None # IDs returned by the ingestion job status
+    uploaded_after: datetime | None = None
+    uploaded_before: datetime | None = None
 
 class ChatResponse(BaseModel):
     response: str
@@ -1,7 +1,99 @@
 # In app/schemas/ingestion.py
+from datetime import datetime
+from typing import Any
 from pydantic import BaseModel
 
 class UploadResponse(BaseModel):
     message: str
     file_name: str
-    job_id: str
\ No newline at end of file
+    job_id: str
+
+class BulkUploadResponse(BaseModel):
+    message: str
+    batch_id: str
+    files_queued: int
+    skipped: list[str] = [] # unsupported files and archive members
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    file_name: str
+    file_id: int | None = None
+    status: str
+    stage: str
+    attempts: int
+    error: str | None = None
+    stages: dict[str, Any] = {}
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    finished_at: datetime | None = None
+
+class BatchJobStatus(BaseModel):
+    job_id: str
+    file_name: str
+    file_id: int | None = None
+    status: str
+    error: str | None = None
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str
+    status: str # queued, running, completed, completed_with_errors, failed
+    total: int
+    counts: dict[str, int] = {}
+    jobs: list[BatchJobStatus] = []
+
+class DeleteFileResponse(BaseModel):
+    message: str
+    file_id: int
+    file_name: str
+    chunks_deleted: int
+
+class FileResponse(BaseModel):
+    id: int
+    file_name: str
+    document_key: str | None = None
+    version: int | None = None
+    status: str | None = None
+    file_type: str | None = None
+    file_size_bytes: int | None = None
+    page_count: int | None = None
+    character_count: int | None = None
+    chunk_count: int | None = None
+    ingest_seconds: float | None = None
+    chunking_strategy: str | None = None
+    embedding_model: str | None = None
+    created_at: datetime | None = None
+    completed_at: datetime | None = None
+
+    model_config = {"from_attributes": True}
+
+class FileVersionResponse(BaseModel):
+    version: int
+    content_hash: str | None = None
+    chunk_count: int | None = None
+    chunks_added: int | None = None
+    chunks_removed: int | None = None
+    ingest_seconds: float | None = None
+    created_at: datetime | None = None
+
+    model_config = {"from_attributes": True}
+
+class ChunkResponse(BaseModel):
+    chunk_index: int
+    point_id: str
+    content_hash: str
+    char_start: int | None = None
+    char_end: int | None = None
+    page: int | None = None
+    char_count: int
+
+    model_config = {"from_attributes": True}
+
+class IngestionStatsResponse(BaseModel):
+    files: int
+    files_by_status: dict[str, int] = {}
+    chunks: int
+    chunks_per_file: dict[str, float | None] = {}
+    bytes: int
+    characters: int
+    ingest_seconds: dict[str, float | None] = {}
+    chunks_per_second: float | None = None
@@ -1,16 +1,23 @@
 from langchain.agents import AgentExecutor, create_tool_calling_agent
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.tools import BaseTool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_community.chat_message_histories import RedisChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from pydantic import BaseModel, Field
 from typing import Type
-from langchain_core.runnables import RunnablePassthrough
+import asyncio
+import time
+import weakref
+from langchain_core.messages import HumanMessage, AIMessage
 
+from app.core import metrics
 from app.core.config import settings
 from app.db import vector_db, metadata_db
-from app.services import notification
+from app.db.chat_history import AsyncRedisChatMessageHistory
+from app.services import context_packer, email_outbox, intent_router, notification, semantic_cache
+
+# Tool names, to recognise tool calls without building the tools
+DOCUMENT_SEARCH_TOOL = "document_search"
+INTERVIEW_BOOKING_TOOL = "interview_booking_tool"
 
 
 # Document Search Tool
@@ -18,18 +25,60 @@ class DocumentSearchInput(BaseModel):
     query: str = Field(description="The user's question to search for in the documents.")
 
 class DocumentSearchTool(BaseTool):
-    name: str = "document_search"
+    name: str = DOCUMENT_SEARCH_TOOL
     description: str = "Use this to answer questions about the provided documents. This is the only way to get information from the documents."
     args_schema: Type[BaseModel] = DocumentSearchInput
 
     def _run(self, query: str) -> str:
         print(f"Tool running with query: '{query}'")
-        retriever = vector_db.get_retriever()
-        results = retriever.invoke(query)
-        
-        if not results:
-            return "No information found in the documents for that query."
-        return "\n---\n".join([doc.page_content for doc in results])
+        use_cache = _use_semantic_cache()
+        if use_cache:
+            version = semantic_cache.get_corpus_version()
+            vector = vector_db.get_embedding_function().embed_query(query)
+            cached = semantic_cache.retrieval_cache.lookup(vector, version)
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        result = _format_results(vector_db.search_documents(query, *_search_args()))
+
+        if use_cache:
+            semantic_cache.retrieval_cache.store(vector, result, version, time.perf_counter() - start)
+        return result
+
+    async def _arun(self, query: str) -> str:
+        print(f"Tool running with query: '{query}'")
+        use_cache = _use_semantic_cache()
+        if use_cache:
+            version = await semantic_cache.aget_corpus_version()
+            vector = await vector_db.get_embedding_function().aembed_query(query)
+            cached = semantic_cache.retrieval_cache.lookup(vector, version)
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        result = _format_results(await vector_db.asearch_documents(query, *_search_args()))
+
+        if use_cache:
+            semantic_cache.retrieval_cache.store(vector, result, version, time.perf_counter() - start)
+        return result
+
+def _use_semantic_cache() -> bool:
+    # Cached results are for the whole corpus, filtered searches always go to Qdrant
+    return settings.SEMANTIC_CACHE_ENABLED and vector_db.search_filter() is None
+
+def _search_args() -> tuple[int, bool]:
+    # Packing picks from a wider candidate set and needs the vectors for MMR
+    if settings.CONTEXT_PACKING:
+        return settings.CONTEXT_CANDIDATES_K, True
+    return settings.RETRIEVAL_K, False
+
+def _format_results(results) -> str:
+    if not results:
+        return "No information found in the documents for that query."
+    if settings.CONTEXT_PACKING:
+        return context_packer.pack(results)
+    return "\n---\n".join([doc.page_content for doc in results])
 
 # BOOKING TOOL
 class InterviewBookingInput(BaseModel):
@@ -39,27 +88,68 @@ class InterviewBookingInput(BaseModel):
     time: str = Field(description="The requested time for the interview in 24-hour format, e.g., '14:30'.")
 
 class InterviewBookingTool(BaseTool):
-    name: str = "interview_booking_tool"
+    name: str = INTERVIEW_BOOKING_TOOL
     description: str = "Use this tool to book an interview. It requires the person's full name, email, and the desired date and time."
     args_schema: Type[BaseModel] = InterviewBookingInput
 
     def _run(self, full_name: str, email: str, date: str, time: str) -> str:
         try:
-            # Use a context manager to get a DB session
-            db_session_gen = metadata_db.get_db()
-            db = next(db_session_gen)
-            
-            # Save to DB
-            booking_id = metadata_db.save_booking(db, full_name, email, date, time)
-            
-            # Send confirmation email
-            notification.send_booking_confirmation(full_name, email, date, time)
-            
-            return f"Successfully booked interview for {full_name}. A confirmation email has been sent. The booking ID is {booking_id}."
+            confirmation = notification.booking_confirmation(full_name, email, date, time)
+            with metadata_db.session_scope() as db:
+                # Save to DB, the confirmation email is queued in the same transaction
+                booking_id = metadata_db.save_booking(db, full_name, email, date, time, confirmation)
+            email_outbox.wake()
+
+            return f"Successfully booked interview for {full_name}. A confirmation email is on its way. The booking ID is {booking_id}."
+        except Exception as e:
+            return f"Error: Failed to book interview. Reason: {e}"
+
+    async def _arun(self, full_name: str, email: str, date: str, time: str) -> str:
+        try:
+            confirmation = notification.booking_confirmation(full_name, email, date, time)
+            async with metadata_db.AsyncSessionLocal() as db:
+                booking_id = await metadata_db.asave_booking(db, full_name, email, date, time, confirmation)
+            email_outbox.wake()
+
+            return f"Successfully booked interview for {full_name}. A confirmation email is on its way. The booking ID is {booking_id}."
         except Exception as e:
             return f"Error: Failed to book interview. Reason: {e}"
-        finally:
-            db.close()
+
+
+_llm = None
+
+def get_llm():
+    # One shared client for the agent and the single-call document path
+    global _llm
+    if _llm is None:
+        # Imported on first use, the Google client libraries are slow to import
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0, google_api_key=settings.GOOGLE_API_KEY)
+    return _llm
+
+
+# CONVERSATION MEMORY
+summary_prompt = ChatPromptTemplate.from_messages([
+    ("system", """You maintain a running summary of a conversation between a user and PalmBot.
+Extend the current summary with the new lines. Keep names, emails, dates, times and facts the user gave,
+and the questions already answered. Reply with the updated summary only, in at most 150 words."""),
+    ("human", "Current summary:\n{summary}\n\nNew lines:\n{lines}"),
+])
+
+async def summarize_history(summary: str, messages: list) -> str:
+    lines = "\n".join(f"{message.type}: {_chunk_text(message)}" for message in messages)
+    response = await (summary_prompt | get_llm()).ainvoke({"summary": summary or "(empty)", "lines": lines})
+    return _chunk_text(response)
+
+def get_session_history(session_id: str) -> AsyncRedisChatMessageHistory:
+    # Sliding window within the token budget, older turns are summarized in the background
+    return AsyncRedisChatMessageHistory(
+        session_id,
+        url=settings.REDIS_URL,
+        ttl=settings.CHAT_HISTORY_TTL_SECONDS,
+        token_budget=settings.CHAT_HISTORY_TOKEN_BUDGET,
+        summarizer=summarize_history if settings.CHAT_HISTORY_SUMMARY else None,
+    )
 
 
 # THE AGENT
@@ -81,28 +171,244 @@ def create_agent_executor():
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0, google_api_key=settings.GOOGLE_API_KEY)
-    
-    agent = create_tool_calling_agent(llm, tools, prompt)
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+    agent = create_tool_calling_agent(get_llm(), tools, prompt)
+    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=settings.AGENT_VERBOSE, return_intermediate_steps=True)
     
     # The memory wrapper
     agent_with_memory = RunnableWithMessageHistory(
         agent_executor,
-        lambda session_id: RedisChatMessageHistory(session_id, url=settings.REDIS_URL),
+        get_session_history,
         input_messages_key="input",
+        output_messages_key="output",
         history_messages_key="chat_history",
     )
     
     return agent_with_memory
 
 
-agent_executor_with_memory = create_agent_executor()
+_agent_executor = None
+
+def get_agent_executor():
+    # Built on first use instead of at import time, to keep startup fast
+    global _agent_executor
+    if _agent_executor is None:
+        _agent_executor = create_agent_executor()
+    return _agent_executor
+
+# DOCUMENT FAST PATH
+# Document questions are answered with the retrieval done up front and a single
+# LLM call, instead of one call to pick the tool and a second one to answer.
+answer_prompt = ChatPromptTemplate.from_messages([
+    ("system", """You are a helpful assistant named PalmBot. Answer the user's question using only the document excerpts below.
+If the excerpts don't contain the answer, say that the documents don't cover it.
+
+Document excerpts:
+{context}"""),
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("human", "{input}"),
+])
 
-def run_chat(session_id: str, query: str):
-    config = {"configurable": {"session_id": session_id}}
-    response = agent_executor_with_memory.invoke(
-        {"input": query}, 
-        config=config
+async def _route(query: str, history: AsyncRedisChatMessageHistory) -> str:
+    """Routes the query; the history's metadata must be loaded (`aget_messages`)."""
+    if not settings.CHAT_ROUTER_ENABLED:
+        return intent_router.AMBIGUOUS
+    return await intent_router.classify(query, history.metadata.get("booking_in_progress") == "1")
+
+async def _record_booking_state(history: AsyncRedisChatMessageHistory, route: str, answer: str, steps: list):
+    """
+    Marks the session as in the middle of a booking if the agent asked for missing
+    details of a booking request and didn't book, so the reply skips the fast path.
+    """
+    booked = any(
+        action.tool == INTERVIEW_BOOKING_TOOL and str(observation).startswith("Successfully")
+        for action, observation in steps
     )
-    return response["output"]
\ No newline at end of file
+    in_progress = route == intent_router.BOOKING and not booked and intent_router.asks_for_booking_details(str(answer))
+    if in_progress != (history.metadata.get("booking_in_progress") == "1"):
+        await history.aset_metadata(booking_in_progress="1" if in_progress else "0")
+
+async def _retrieve_context(query: str, history: list, config: dict) -> str:
+    standalone = intent_router.rewrite_follow_up(query, history)
+    return await DocumentSearchTool().ainvoke({"query": standalone}, config=config)
+
+
+# Turn locks of the sessions active in this process, and the answers in progress
+_session_locks = weakref.WeakValueDictionary()
+_answers_in_progress = {}
+
+async def run_chat(session_id: str, query: str, search_filter=None):
+    """
+    Answers a query. A `search_filter` (see vector_db.build_search_filter) limits the document search.
+    Turns of one session run one after the other. The same message sent again while
+    it is being answered (a client retry, a double click) waits for that answer
+    instead of running again. Raises asyncio.TimeoutError after CHAT_TIMEOUT_SECONDS,
+    cancelling the outstanding LLM and tool calls.
+    """
+    key = (session_id, query, repr(search_filter))
+    task = _answers_in_progress.get(key)
+    if task is None:
+        task = asyncio.create_task(
+            asyncio.wait_for(_locked_turn(session_id, query, search_filter), settings.CHAT_TIMEOUT_SECONDS)
+        )
+        _answers_in_progress[key] = task
+        task.add_done_callback(lambda task: _forget_answer(key, task))
+    # Shielded, so a caller going away doesn't cancel the answer others wait for
+    return await asyncio.shield(task)
+
+
+async def _locked_turn(session_id: str, query: str, search_filter):
+    async with _session_lock(session_id), get_session_history(session_id).aturn_lock(settings.CHAT_TIMEOUT_SECONDS):
+        with vector_db.filtered_search(search_filter):
+            return await _run_chat(session_id, query)
+
+
+def _session_lock(session_id: str) -> asyncio.Lock:
+    # Waiters of this process queue here instead of polling the Redis lock
+    lock = _session_locks.get(session_id)
+    if lock is None:
+        lock = _session_locks[session_id] = asyncio.Lock()
+    return lock
+
+
+def _forget_answer(key: tuple, task: asyncio.Task):
+    _answers_in_progress.pop(key, None)
+    if not task.cancelled():
+        task.exception() # retrieved, even if every caller went away
+
+
+async def _run_chat(session_id: str, query: str):
+    config = {"configurable": {"session_id": session_id}, "callbacks": [metrics.chat_metrics_handler]}
+    history = get_session_history(session_id)
+    messages = await history.aget_messages()
+
+    # Questions asked without any history can be answered from the semantic cache
+    cache_entry = None
+    if _use_semantic_cache() and settings.SEMANTIC_CACHE_CHAT and not messages:
+        version = await semantic_cache.aget_corpus_version()
+        vector = await vector_db.get_embedding_function().aembed_query(query)
+        cached = semantic_cache.chat_cache.lookup(vector, version)
+        if cached is not None:
+            await history.aadd_messages([HumanMessage(content=query), AIMessage(content=cached)])
+            return cached
+        cache_entry = (vector, version)
+
+    start = time.perf_counter()
+    route = await _route(query, history)
+    if route == intent_router.DOCUMENT:
+        context = await _retrieve_context(query, messages, config)
+        chain = answer_prompt | get_llm()
+        answer = _chunk_text(await chain.ainvoke({"context": context, "chat_history": messages, "input": query}, config=config))
+        await history.aadd_messages([HumanMessage(content=query), AIMessage(content=answer)])
+        cacheable = True
+    else:
+        response = await get_agent_executor().ainvoke({"input": query}, config=config)
+        answer = response["output"]
+        await _record_booking_state(history, route, answer, response["intermediate_steps"])
+        # Only pure document answers are reusable, never bookings
+        cacheable = all(action.tool == DOCUMENT_SEARCH_TOOL for action, _ in response["intermediate_steps"])
+
+    if cache_entry and cacheable:
+        semantic_cache.chat_cache.store(cache_entry[0], answer, cache_entry[1], time.perf_counter() - start)
+    return answer
+
+
+async def stream_chat(session_id: str, query: str, search_filter=None):
+    """
+    Runs the agent and yields events as they happen:
+    'token' for each streamed LLM token, 'tool_start'/'tool_end' for tool calls
+    and a final 'done' with the complete answer.
+    """
+    async for event in _with_deadline(_locked_stream(session_id, query, search_filter), settings.CHAT_TIMEOUT_SECONDS):
+        yield event
+
+
+async def _locked_stream(session_id: str, query: str, search_filter):
+    async with _session_lock(session_id), get_session_history(session_id).aturn_lock(settings.CHAT_TIMEOUT_SECONDS):
+        with vector_db.filtered_search(search_filter):
+            async for event in _stream_chat(session_id, query):
+                yield event
+
+
+async def _with_deadline(events, seconds: float):
+    """
+    Yields the events of an async generator until the deadline, then raises
+    asyncio.TimeoutError. The generator runs in its own task, which is cancelled
+    with its outstanding LLM and tool calls at the deadline or when the consumer
+    stops listening.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for event in events:
+                queue.put_nowait((False, event))
+            queue.put_nowait((True, None))
+        except Exception as e:
+            queue.put_nowait((True, e))
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            finished, item = await asyncio.wait_for(queue.get(), max(deadline - loop.time(), 0))
+            if finished:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        producer.cancel()
+        # Waits for the generator's cleanup, e.g. releasing the session's turn lock
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+async def _stream_chat(session_id: str, query: str):
+    config = {"configurable": {"session_id": session_id}, "callbacks": [metrics.chat_metrics_handler]}
+    history = get_session_history(session_id)
+    messages = await history.aget_messages()
+
+    route = await _route(query, history)
+    if route == intent_router.DOCUMENT:
+        # Same events as the agent would send, with only one LLM call
+        search_input = {"query": intent_router.rewrite_follow_up(query, messages)}
+        yield {"event": "tool_start", "data": {"name": DOCUMENT_SEARCH_TOOL, "input": search_input}}
+        context = await DocumentSearchTool().ainvoke(search_input, config=config)
+        yield {"event": "tool_end", "data": {"name": DOCUMENT_SEARCH_TOOL, "output": context}}
+
+        answer = ""
+        chain = answer_prompt | get_llm()
+        async for chunk in chain.astream({"context": context, "chat_history": messages, "input": query}, config=config):
+            text = _chunk_text(chunk)
+            if text:
+                answer += text
+                yield {"event": "token", "data": {"text": text}}
+        await history.aadd_messages([HumanMessage(content=query), AIMessage(content=answer)])
+        yield {"event": "done", "data": {"response": answer}}
+        return
+
+    steps = []
+    async for event in get_agent_executor().astream_events({"input": query}, config=config, version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_stream":
+            text = _chunk_text(event["data"]["chunk"])
+            if text:
+                yield {"event": "token", "data": {"text": text}}
+        elif kind == "on_chain_stream" and not event.get("parent_ids"):
+            # Steps streamed by the AgentExecutor, as seen by the outermost runnable
+            chunk = event["data"]["chunk"]
+            for action in chunk.get("actions", []):
+                yield {"event": "tool_start", "data": {"name": action.tool, "input": action.tool_input}}
+            for step in chunk.get("steps", []):
+                steps.append((step.action, step.observation))
+                yield {"event": "tool_end", "data": {"name": step.action.tool, "output": str(step.observation)}}
+            if "output" in chunk:
+                await _record_booking_state(history, route, chunk["output"], steps)
+                yield {"event": "done", "data": {"response": chunk["output"]}}
+
+
+def _chunk_text(chunk) -> str:
+    # Gemini may stream content as a list of parts
+    if isinstance(chunk.content, str):
+        return chunk.content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in chunk.content)
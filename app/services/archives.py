@@ -0,0 +1,42 @@
+import os
+import tarfile
+import zipfile
+from typing import IO, Iterator
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+# Supported document types by file extension, for archive members and uploads without a content type
+FILE_TYPES = {".pdf": "application/pdf", ".txt": "text/plain"}
+
+
+def is_archive(file_name: str) -> bool:
+    return file_name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def file_type_for(file_name: str) -> str | None:
+    return FILE_TYPES.get(os.path.splitext(file_name)[1].lower())
+
+
+def iter_members(archive_path: str) -> Iterator[tuple[str, IO[bytes]]]:
+    """
+    Yields (name, readable stream) for the regular files of a zip or tar archive.
+    Members are streamed one at a time, nothing is extracted by path.
+    """
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and not _is_hidden(info.filename):
+                    with archive.open(info) as f:
+                        yield info.filename, f
+    else:
+        # "r:*" detects gzip, bz2 and xz compression
+        with tarfile.open(archive_path, "r:*") as archive:
+            for member in archive:
+                if member.isfile() and not _is_hidden(member.name):
+                    with archive.extractfile(member) as f:
+                        yield member.name, f
+
+
+def _is_hidden(name: str) -> bool:
+    # Resource forks and dotfiles added by archivers, e.g. __MACOSX/ or .DS_Store
+    return any(part.startswith((".", "__MACOSX")) for part in name.split("/"))
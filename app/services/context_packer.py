@@ -0,0 +1,211 @@
+"""
+Turns the candidate chunks of a document search into the context sent to the LLM:
+
+    1. identical chunks (e.g. the same file uploaded twice) are dropped
+    2. overlapping and adjacent chunks of the same file are merged into one passage
+    3. maximal marginal relevance (MMR) picks passages that are relevant but
+       not near-duplicates of each other, using the vectors Qdrant returned
+    4. the passages are packed into a token budget, each labelled with its source
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core import metrics
+from app.core.config import settings
+from app.db.chat_history import CHARS_PER_TOKEN
+
+SEPARATOR = "\n---\n"
+
+
+@dataclass
+class Passage:
+    text: str
+    source: str
+    score: float # relevance in [0, 1], the best of the merged chunks
+    pages: list[int] = field(default_factory=list)
+    char_end: int | None = None # of the last merged chunk
+    chunk_index: int | None = None
+    vector: np.ndarray | None = None # sum of the normalized chunk vectors
+
+    def label(self) -> str:
+        if not self.pages:
+            return self.source
+        first, last = min(self.pages), max(self.pages)
+        return f"{self.source}, page {first}" if first == last else f"{self.source}, pages {first}-{last}"
+
+
+def pack(
+    documents: list[Document],
+    token_budget: int | None = None,
+    max_passages: int | None = None,
+    mmr_lambda: float | None = None,
+    duplicate_similarity: float | None = None,
+) -> str:
+    """Packs search results (best first) into at most `token_budget` estimated tokens of context."""
+    token_budget = token_budget or settings.CONTEXT_TOKEN_BUDGET
+    with metrics.span("chat", "context_pack"):
+        passages = merge_chunks(_unique(documents), max_chars=token_budget * CHARS_PER_TOKEN)
+        selected = select_mmr(
+            passages,
+            max_passages or settings.RETRIEVAL_K,
+            settings.CONTEXT_MMR_LAMBDA if mmr_lambda is None else mmr_lambda,
+            duplicate_similarity or settings.CONTEXT_DUPLICATE_SIMILARITY,
+        )
+        return SEPARATOR.join(_fit_budget(selected, token_budget))
+
+
+def merge_chunks(documents: list[Document], max_chars: int) -> list[Passage]:
+    """
+    Merges chunks of the same file whose character ranges overlap or that are
+    consecutive, removing the repeated overlap. Chunks without positions (stored
+    before offsets were recorded) stay separate passages.
+    """
+    scores = _relevance(documents)
+    by_source = {}
+    for doc, score in zip(documents, scores):
+        source_key = doc.metadata.get("file_id") or doc.metadata.get("source")
+        by_source.setdefault(source_key, []).append((doc, score))
+
+    passages = []
+    for chunks in by_source.values():
+        chunks.sort(key=lambda item: (item[0].metadata.get("char_start") is None, item[0].metadata.get("char_start") or 0))
+        current = None
+        for doc, score in chunks:
+            if current is not None and _continues(current, doc, max_chars):
+                _extend(current, doc, score)
+            else:
+                current = _new_passage(doc, score)
+                passages.append(current)
+
+    for passage in passages:
+        if passage.vector is not None:
+            passage.vector = passage.vector / max(float(np.linalg.norm(passage.vector)), 1e-12)
+    return passages
+
+
+def select_mmr(passages: list[Passage], k: int, mmr_lambda: float, duplicate_similarity: float) -> list[Passage]:
+    """
+    Picks up to `k` passages by maximal marginal relevance:
+    mmr_lambda * relevance - (1 - mmr_lambda) * similarity to the passages picked so far.
+    Passages at least `duplicate_similarity` similar to a picked one are dropped.
+    """
+    if not passages:
+        return []
+    dimension = next((len(p.vector) for p in passages if p.vector is not None), 0)
+    # Passages without a vector count as dissimilar to everything
+    vectors = np.array([p.vector if p.vector is not None else np.zeros(dimension) for p in passages], dtype=np.float32)
+    similarities = vectors @ vectors.T if dimension else np.zeros((len(passages), len(passages)))
+    relevance = np.array([p.score for p in passages])
+
+    selected = []
+    redundancy = np.zeros(len(passages)) # highest similarity to a selected passage
+    remaining = set(range(len(passages)))
+    while remaining and len(selected) < k:
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy[i])
+        remaining.discard(best)
+        if selected and redundancy[best] >= duplicate_similarity:
+            continue
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarities[best])
+    return [passages[i] for i in selected]
+
+
+def _fit_budget(passages: list[Passage], token_budget: int) -> list[str]:
+    """Formats passages in order while they fit; smaller later ones may still fit after a skip."""
+    blocks, used = [], 0
+    for passage in passages:
+        header = f"[{len(blocks) + 1}] {passage.label()}\n"
+        tokens = _estimate_tokens(header + passage.text + SEPARATOR)
+        if used + tokens <= token_budget:
+            blocks.append(header + passage.text)
+            used += tokens
+        elif not blocks:
+            # The most relevant passage alone is over the budget, keep its beginning
+            max_chars = max(token_budget * CHARS_PER_TOKEN - len(header), 0)
+            text = passage.text[:max_chars]
+            if " " in text and len(text) < len(passage.text):
+                text = text[:text.rindex(" ")]
+            blocks.append(header + text)
+            used = token_budget
+    return blocks
+
+
+def _unique(documents: list[Document]) -> list[Document]:
+    # The first, best ranked copy of identical text wins
+    seen, unique = set(), []
+    for doc in documents:
+        key = " ".join(doc.page_content.split())
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(doc)
+    return unique
+
+
+def _relevance(documents: list[Document]) -> list[float]:
+    """
+    Search scores scaled to [0, 1]. Fused hybrid scores (RRF) and cosine scores
+    have different ranges, so only their order within one result list matters.
+    """
+    scores = [doc.metadata.get("_score") for doc in documents]
+    if any(score is None for score in scores):
+        return [1 - i / len(documents) for i in range(len(documents))]
+    low, high = min(scores, default=0.0), max(scores, default=0.0)
+    if high - low < 1e-12:
+        return [1.0] * len(documents)
+    return [(score - low) / (high - low) for score in scores]
+
+
+def _new_passage(doc: Document, score: float) -> Passage:
+    metadata = doc.metadata
+    vector = metadata.get("_vector")
+    return Passage(
+        text=doc.page_content,
+        source=metadata.get("source", "unknown"),
+        score=score,
+        pages=[metadata["page"]] if metadata.get("page") is not None else [],
+        char_end=metadata.get("char_end"),
+        chunk_index=metadata.get("chunk_index"),
+        vector=_normalize(vector) if vector is not None else None,
+    )
+
+
+def _continues(passage: Passage, doc: Document, max_chars: int) -> bool:
+    char_start = doc.metadata.get("char_start")
+    if passage.char_end is None or char_start is None:
+        return False
+    overlaps = char_start <= passage.char_end
+    consecutive = passage.chunk_index is not None and doc.metadata.get("chunk_index") == passage.chunk_index + 1
+    if not (overlaps or consecutive):
+        return False
+    # Passages stay small enough to fit the budget
+    added = doc.metadata.get("char_end", char_start + len(doc.page_content)) - max(char_start, passage.char_end)
+    return len(passage.text) + max(added, 0) <= max_chars
+
+
+def _extend(passage: Passage, doc: Document, score: float):
+    metadata = doc.metadata
+    char_start, char_end = metadata["char_start"], metadata.get("char_end", metadata["char_start"] + len(doc.page_content))
+    if char_start <= passage.char_end:
+        # Only the part after the overlap is new
+        passage.text += doc.page_content[passage.char_end - char_start:]
+    else:
+        passage.text += "\n" + doc.page_content
+    passage.char_end = max(passage.char_end, char_end)
+    passage.chunk_index = metadata.get("chunk_index")
+    passage.score = max(passage.score, score)
+    if metadata.get("page") is not None and metadata["page"] not in passage.pages:
+        passage.pages.append(metadata["page"])
+    vector = metadata.get("_vector")
+    if vector is not None:
+        passage.vector = _normalize(vector) if passage.vector is None else passage.vector + _normalize(vector)
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
@@ -0,0 +1,109 @@
+"""
+Background dispatcher for the email outbox.
+
+Bookings queue their confirmation email in the `email_outbox` table in the
+same transaction as the booking, so an email is never lost or sent for a
+booking that was rolled back. Every API process runs one dispatcher task that
+claims due emails in batches, sends them over a single reused SMTP connection
+and records the delivery state, retrying failures with an exponential backoff.
+"""
+import asyncio
+
+from app.core import metrics
+from app.core.config import settings
+from app.db import metadata_db
+from app.services import notification
+
+# A claimed email is retried by any dispatcher if it is still 'sending' after this long
+SEND_LEASE_SECONDS = 300
+
+_task = None
+_loop = None
+_wakeup = None
+
+
+def start():
+    """Starts the dispatcher on the running event loop, if enabled."""
+    global _task, _loop, _wakeup
+    if not settings.EMAIL_DISPATCH_ENABLED or _task is not None:
+        return
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _task, _loop, _wakeup
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = _loop = _wakeup = None
+
+
+def wake():
+    """Tells the dispatcher of this process that an email was queued. Safe to call from any thread."""
+    if _loop is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+async def dispatch_once(connection: notification.SmtpConnection) -> int:
+    """Claims one batch of due emails, sends them and records the results. Returns the batch size."""
+    async with metadata_db.AsyncSessionLocal() as db:
+        emails = await metadata_db.aclaim_outbox_emails(db, settings.EMAIL_DISPATCH_BATCH_SIZE, SEND_LEASE_SECONDS)
+        if not emails:
+            return 0
+
+        messages = [(email.recipient, email.subject, email.body) for email in emails]
+        # smtplib is blocking, the whole batch goes to one thread
+        errors = await asyncio.to_thread(_send_batch, connection, messages)
+
+        for email, error in zip(emails, errors):
+            status = metadata_db.record_email_result(
+                email, error, settings.EMAIL_MAX_ATTEMPTS, settings.EMAIL_RETRY_BACKOFF_SECONDS
+            )
+            metrics.EMAILS.labels("retry" if status == "pending" else status).inc()
+            if error:
+                print(f"Failed to send email {email.id} to {email.recipient} (attempt {email.attempts}, {status}): {error}")
+        await db.commit()
+        return len(emails)
+
+
+async def _run():
+    connection = notification.SmtpConnection()
+    try:
+        while True:
+            try:
+                sent = await dispatch_once(connection)
+            except Exception as e:
+                # Database unavailable or similar, claimed emails are retried after their lease
+                print(f"Email dispatcher error: {e}")
+                sent = 0
+            if sent >= settings.EMAIL_DISPATCH_BATCH_SIZE:
+                continue # more emails may be due
+
+            if sent == 0:
+                # Nothing queued, don't hold the connection open while idle
+                await asyncio.to_thread(connection.close)
+            try:
+                await asyncio.wait_for(_wakeup.wait(), settings.EMAIL_DISPATCH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+    finally:
+        await asyncio.to_thread(connection.close)
+
+
+def _send_batch(connection: notification.SmtpConnection, messages: list[tuple[str, str, str]]) -> list[str | None]:
+    errors = []
+    for recipient, subject, body in messages:
+        try:
+            with metrics.span("email", "send"):
+                connection.send(recipient, subject, body)
+            errors.append(None)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+    return errors
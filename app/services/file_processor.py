@@ -1,10 +1,23 @@
+import bisect
 import io
+import logging
+import random
+import re
+from typing import Iterator
 import pypdf
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
-from langchain_experimental.text_splitter import SemanticChunker
 
+from app.core import metrics
+from app.core.config import settings
 from app.db.vector_db import get_embedding_function
+from app.services.semantic_chunker import VectorizedSemanticChunker
+
+# Streaming mode: how much text is buffered before it is chunked, and the block size for text files
+STREAM_BUFFER_CHARS = 20_000
+TEXT_BLOCK_CHARS = 64 * 1024
+
+logger = logging.getLogger(__name__)
 
 def process_file(
     file_name: str, 
@@ -29,38 +42,166 @@ def process_file(
     return documents
 
 
+def chunk_text(
+    text: str,
+    file_name: str,
+    chunk_strategy: str = "semantic",
+    page_starts: list[int] | None = None,
+) -> tuple[list[Document], list[list[float]] | None]:
+    """
+    Chunks the text and returns the Documents with their vectors when the
+    strategy already produced them (semantic), otherwise None.
+    `page_starts` are the offsets where each PDF page starts in the text.
+    """
+    text_splitter = _get_text_splitter(chunk_strategy)
+    if not (page_starts and settings.PAGE_ALIGNED_CHUNKS):
+        documents, vectors = _split_text(text_splitter, text, file_name)
+        _add_positions(documents, text, page_starts=page_starts)
+        return documents, vectors
+
+    documents, vectors = [], []
+    for start, end in zip(page_starts, page_starts[1:] + [len(text)]):
+        page_documents, page_vectors = _split_text(text_splitter, text[start:end], file_name)
+        _add_positions(page_documents, text[start:end], start, page_starts, len(documents))
+        documents += page_documents
+        vectors += page_vectors or []
+    return documents, vectors or None
+
+
+def iter_chunks(
+    file_path: str,
+    file_name: str,
+    file_type: str,
+    chunk_strategy: str = "semantic",
+    stats: dict | None = None,
+) -> Iterator[tuple[Document, list[float] | None]]:
+    """
+    Streaming counterpart of `process_file` for files spooled to disk.
+    Text is read page by page and chunked incrementally, so memory stays flat
+    no matter how large the file is. Yields (Document, vector or None) pairs.
+    If given, `stats` receives the number of pages and characters read.
+    """
+    text_splitter = _get_text_splitter(chunk_strategy)
+    buffer = ""
+    offset = 0 # position of the buffer in the whole text
+    page_starts = []
+    chunk_index = 0
+
+    page_aligned = file_type == "application/pdf" and settings.PAGE_ALIGNED_CHUNKS
+
+    for piece in _iter_text_from_file(file_path, file_type):
+        if file_type == "application/pdf":
+            page_starts.append(offset + len(buffer))
+        if page_aligned:
+            # Chunks never span pages, an edited page leaves the chunks of the other pages unchanged
+            documents, vectors = _split_text(text_splitter, piece, file_name)
+            _add_positions(documents, piece, offset, page_starts, chunk_index)
+            for i in range(len(documents)):
+                yield documents[i], vectors[i] if vectors else None
+            chunk_index += len(documents)
+            offset += len(piece)
+            continue
+
+        buffer += piece
+        if len(buffer) < STREAM_BUFFER_CHARS:
+            continue
+
+        documents, vectors = _split_text(text_splitter, buffer, file_name)
+        _add_positions(documents, buffer, offset, page_starts, chunk_index)
+        # The last chunk may continue on the next page, so it is carried over into the buffer.
+        # Only with a known position and a short tail, otherwise the buffer would keep
+        # growing and every piece would re-chunk (and re-embed) all of it.
+        carry_from = _carry_from(documents, len(buffer), offset)
+        emitted = len(documents) if carry_from is None else len(documents) - 1
+        for i in range(emitted):
+            yield documents[i], vectors[i] if vectors else None
+        chunk_index += emitted
+        if carry_from is None:
+            offset += len(buffer)
+            buffer = ""
+        else:
+            offset += carry_from
+            buffer = buffer[carry_from:]
+
+    if buffer.strip():
+        documents, vectors = _split_text(text_splitter, buffer, file_name)
+        _add_positions(documents, buffer, offset, page_starts, chunk_index)
+        for i in range(len(documents)):
+            yield documents[i], vectors[i] if vectors else None
+
+    if stats is not None:
+        stats.update(pages=len(page_starts) or None, characters=offset + len(buffer))
+
+
 # Helper Functions
+def _carry_from(documents: list[Document], buffer_length: int, offset: int) -> int | None:
+    """
+    Where the last chunk starts in the buffer, if it should be carried over into
+    the next one: there are earlier chunks to emit, its position is known and the
+    carried tail is at most half the buffer size. None to emit every chunk.
+    """
+    if len(documents) <= 1 or "char_start" not in documents[-1].metadata:
+        return None
+    carry_from = documents[-1].metadata["char_start"] - offset
+    if buffer_length - carry_from > STREAM_BUFFER_CHARS // 2:
+        return None
+    return carry_from
+
+
 def _extract_text_from_bytes(file_content: bytes, file_type: str) -> str:
     """
     Extracts raw text from in-memory file content (bytes).
     """
+    return "".join(_extract_pages_from_bytes(file_content, file_type))
+
+
+def _extract_pages_from_bytes(file_content: bytes, file_type: str) -> list[str]:
+    """The text of each page of a PDF, or the whole text of a text file as one item."""
+    with metrics.span("ingestion", "extract"):
+        if file_type == "application/pdf":
+            pdf_file = io.BytesIO(file_content)
+            reader = pypdf.PdfReader(pdf_file)
+            pages = [page.extract_text() or "" for page in reader.pages]
+        elif file_type == "text/plain":
+            pages = [file_content.decode("utf-8")]
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
+    return pages
+
+
+def _iter_text_from_file(file_path: str, file_type: str) -> Iterator[str]:
+    """
+    Yields the text of a file on disk piece by piece: one page at a time for PDFs,
+    fixed-size blocks for text files.
+    """
+    # Only the extraction itself is timed, not the consumer of each piece
     if file_type == "application/pdf":
-        pdf_file = io.BytesIO(file_content)
-        reader = pypdf.PdfReader(pdf_file)
-        text = "".join(page.extract_text() for page in reader.pages)
+        reader = pypdf.PdfReader(file_path)
+        for page in reader.pages:
+            with metrics.span("ingestion", "extract"):
+                text = page.extract_text() or ""
+            yield text
     elif file_type == "text/plain":
-        text = file_content.decode("utf-8")
+        with open(file_path, "r", encoding="utf-8") as f:
+            while True:
+                with metrics.span("ingestion", "extract"):
+                    block = f.read(TEXT_BLOCK_CHARS)
+                if not block:
+                    break
+                yield block
     else:
         raise ValueError(f"Unsupported file type: {file_type}")
-    return text
 
 
-def _chunk_text_to_documents(
-    text: str, 
-    file_name: str, 
-    strategy: str
-) -> list[Document]:
-    """
-    Chunks the text using either a recursive or semantic strategy.
-    """
+def _get_text_splitter(strategy: str):
     if strategy == "semantic":
-        # Use SemanticChunker. It requires the embedding model.
-        # By default, it uses a percentile threshold, which is robust.
+        # Our vectorized semantic chunker. It requires the embedding model and
+        # uses a percentile threshold, like LangChain's SemanticChunker.
         embeddings = get_embedding_function()
-        text_splitter = SemanticChunker(embeddings)
+        return VectorizedSemanticChunker(embeddings, chunk_vectors=settings.SEMANTIC_CHUNK_VECTORS)
     elif strategy == "recursive":
         # Fallback to our previous recursive method if specified
-        text_splitter = RecursiveCharacterTextSplitter(
+        return RecursiveCharacterTextSplitter(
             chunk_size=500, # Using the smaller size we tested
             chunk_overlap=100,
             length_function=len,
@@ -68,20 +209,75 @@ def _chunk_text_to_documents(
     else:
         raise ValueError(f"Unsupported chunking strategy: {strategy}")
 
-    # Create the documents. SemanticChunker has a `create_documents` method
-    # that is very convenient.
-    documents = text_splitter.create_documents([text])
-    
+
+def _split_text(text_splitter, text: str, file_name: str) -> tuple[list[Document], list[list[float]] | None]:
+    with metrics.span("ingestion", "chunk"):
+        if isinstance(text_splitter, VectorizedSemanticChunker):
+            documents, vectors = text_splitter.create_documents_with_vectors([text])
+        else:
+            documents, vectors = text_splitter.create_documents([text]), None
+
     # We can add the source metadata to each document for traceability
     for doc in documents:
         doc.metadata["source"] = file_name
-        
-    print("\n" + "="*50)
-    print("--- DEBUG: GENERATED CHUNKS ---")
+    _log_sampled_chunks(documents)
+    return documents, vectors
+
+
+def _add_positions(
+    documents: list[Document],
+    text: str,
+    offset: int = 0,
+    page_starts: list[int] | None = None,
+    first_index: int = 0,
+):
+    """
+    Records the position of each chunk in the file: its index, where it starts
+    and ends in the extracted text (character offsets) and, for PDFs, its page.
+    """
+    cursor = 0
     for i, doc in enumerate(documents):
-        print(f"\n--- CHUNK {i+1} ---")
-        print(doc.page_content)
-        print("-"*(len(f"--- CHUNK {i+1} ---")))
-    print("="*50 + "\n")
-    
+        doc.metadata["chunk_index"] = first_index + i
+        start = _find_chunk(text, doc.page_content, cursor)
+        if start is None:
+            continue
+        # Chunks overlap, so the next one may start before this one ends
+        cursor = start + 1
+        doc.metadata["char_start"] = offset + start
+        doc.metadata["char_end"] = offset + start + len(doc.page_content)
+        if page_starts:
+            doc.metadata["page"] = bisect.bisect_right(page_starts, offset + start)
+
+
+def _find_chunk(text: str, chunk: str, cursor: int) -> int | None:
+    start = text.find(chunk, cursor)
+    if start >= 0:
+        return start
+    # The semantic chunker joins sentences with single spaces, match its first words loosely
+    words = chunk.split()[:8]
+    if not words:
+        return None
+    match = re.compile(r"\s+".join(map(re.escape, words))).search(text, cursor)
+    return match.start() if match else None
+
+
+def _log_sampled_chunks(documents: list[Document]):
+    # Off by default: dumping every chunk costs real I/O on large uploads
+    rate = settings.CHUNK_DEBUG_SAMPLE_RATE
+    if rate <= 0 or not logger.isEnabledFor(logging.DEBUG):
+        return
+    for doc in documents:
+        if random.random() < rate:
+            logger.debug("Chunk from %s (%d chars): %s", doc.metadata["source"], len(doc.page_content), doc.page_content)
+
+
+def _chunk_text_to_documents(
+    text: str, 
+    file_name: str, 
+    strategy: str
+) -> list[Document]:
+    """
+    Chunks the text using either a recursive or semantic strategy.
+    """
+    documents, _ = chunk_text(text, file_name, strategy)
     return documents
@@ -0,0 +1,535 @@
+import hashlib
+import itertools
+import logging
+import os
+import socket
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import timezone
+
+from sqlalchemy.exc import IntegrityError
+
+from app.core import metrics
+from app.core.config import settings
+from app.db import vector_db, metadata_db
+from app.services import file_processor, semantic_cache
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Retries waiting for their backoff, cancelled on shutdown
+_retry_timers = set()
+_retry_lock = threading.Lock()
+_reaper = None
+_reaper_stop = threading.Event()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Returns the pool of worker processes that run ingestion jobs.
+    The pool size is the ingestion concurrency limit of this API process: with
+    several gunicorn workers, up to INGEST_MAX_WORKERS x workers jobs run at once.
+    We use 'spawn' so that workers never inherit the web process' DB, Qdrant or model handles.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = _new_executor()
+        return _executor
+
+
+def _new_executor() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=settings.INGEST_MAX_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def _replace_broken_executor(broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+    """
+    A pool whose worker process died (e.g. killed for running out of memory)
+    refuses every later job. Replaces it with a new pool, once per broken pool.
+    Returns once the processes of the broken pool have exited.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            logger.warning("An ingestion worker process died, restarting the worker pool.")
+            # Its pending jobs fail with BrokenProcessPool and are recovered one by one
+            broken.shutdown(wait=True)
+            _executor = _new_executor()
+        return _executor
+
+
+def enqueue_job(job_id: str, delay: float = 0):
+    """
+    Hands a queued job over to the worker pool, after `delay` seconds. A job
+    that failed is handed over again once its retry backoff has passed, so the
+    backoff never occupies a worker.
+    """
+    if delay > 0:
+        _enqueue_later(job_id, delay)
+        return
+    executor = get_executor()
+    try:
+        future = executor.submit(run_ingestion_job, job_id)
+    except BrokenProcessPool:
+        executor = _replace_broken_executor(executor)
+        future = executor.submit(run_ingestion_job, job_id)
+    future.add_done_callback(lambda future: _schedule_retry(job_id, executor, future))
+
+
+def _enqueue_later(job_id: str, delay: float):
+    timer = threading.Timer(delay, _retry_due, [job_id])
+    timer.daemon = True
+    with _retry_lock:
+        _retry_timers.add(timer)
+    timer.start()
+
+
+def _retry_due(job_id: str):
+    with _retry_lock:
+        _retry_timers.discard(threading.current_thread())
+    # The pool is gone after shutdown, the job is resumed on the next startup
+    if _executor is not None:
+        enqueue_job(job_id)
+
+
+def _schedule_retry(job_id: str, executor: ProcessPoolExecutor, future):
+    # Runs on the pool's management thread, which must not wait for its own pool:
+    # everything that may touch the pool runs on another thread
+    if future.cancelled():
+        return
+    error = future.exception()
+    if isinstance(error, BrokenProcessPool):
+        threading.Thread(target=_recover_job, args=(job_id, executor), daemon=True).start()
+        return
+    if error is not None:
+        logger.error("Ingestion job %s could not be run: %s", job_id, error)
+        return
+    retry_after = future.result()
+    if retry_after is not None:
+        _enqueue_later(job_id, retry_after)
+
+
+def _recover_job(job_id: str, broken: ProcessPoolExecutor):
+    """
+    Hands a job of a broken pool over to the new pool. A job the dead worker
+    was running counts as a failed attempt, so a file that kills its worker
+    every time ends up 'failed' instead of crashing the pool forever.
+    """
+    _replace_broken_executor(broken)
+    try:
+        with metadata_db.session_scope() as db:
+            job = metadata_db.get_ingestion_job(db, job_id)
+            if job is None or job.status not in ("queued", "running"):
+                return
+            if job.status == "queued":
+                retry_after = metadata_db.seconds_until_due(job)
+            elif _worker_is_alive(job.claimed_by):
+                # Claimed by a worker of another process, its lease covers it
+                return
+            else:
+                retry_after = _record_failure(db, job, "The worker process running the job died.")
+    except Exception:
+        logger.exception("Could not recover ingestion job %s, it is resumed once its lease expires.", job_id)
+        return
+    if retry_after is not None and _executor is not None:
+        enqueue_job(job_id, retry_after)
+
+
+def _worker_is_alive(worker_id: str | None) -> bool:
+    host, _, pid = (worker_id or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def resume_pending_jobs():
+    """Re-submits jobs left queued (or whose lease expired while running) by a previous process."""
+    get_executor() # delayed retries are only handed over while the pool exists
+    db = metadata_db.SessionLocal()
+    try:
+        jobs = metadata_db.list_resumable_jobs(db, settings.INGEST_STALE_JOB_SECONDS)
+        pending = [(job.id, metadata_db.seconds_until_due(job)) for job in jobs]
+    finally:
+        db.close()
+
+    for job_id, delay in pending:
+        enqueue_job(job_id, delay)
+    if pending:
+        print(f"Resumed {len(pending)} pending ingestion jobs.")
+    _start_reaper()
+
+
+def reclaim_expired_jobs() -> list[str]:
+    """Hands jobs whose worker stopped renewing their lease over to this process' pool."""
+    with metadata_db.session_scope() as db:
+        job_ids = metadata_db.reclaim_expired_jobs(db, settings.INGEST_STALE_JOB_SECONDS)
+    for job_id in job_ids:
+        enqueue_job(job_id)
+    if job_ids:
+        logger.warning("Re-queued %d ingestion jobs whose lease expired.", len(job_ids))
+    return job_ids
+
+
+def _start_reaper():
+    """
+    Reclaims expired leases every INGEST_REAPER_INTERVAL_SECONDS, so a job whose
+    worker died (in any process) doesn't hold its document key and a pending
+    job slot until the next restart.
+    """
+    global _reaper
+    if _reaper is not None:
+        return
+    _reaper_stop.clear()
+
+    def run():
+        while not _reaper_stop.wait(settings.INGEST_REAPER_INTERVAL_SECONDS):
+            try:
+                reclaim_expired_jobs()
+            except Exception:
+                logger.exception("Failed to reclaim expired ingestion jobs.")
+
+    _reaper = threading.Thread(target=run, name="ingestion-reaper", daemon=True)
+    _reaper.start()
+
+
+def shutdown():
+    global _executor, _reaper
+    _reaper_stop.set()
+    if _reaper is not None:
+        _reaper.join()
+        _reaper = None
+    with _retry_lock:
+        for timer in _retry_timers:
+            timer.cancel()
+        _retry_timers.clear()
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        # Unstarted jobs stay 'queued' in the database and are resumed on the next startup.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Everything below runs inside the worker processes.
+def run_ingestion_job(job_id: str) -> float | None:
+    """
+    Runs one attempt of a job while renewing its lease. On failure the job is
+    requeued with an exponential backoff (or failed after INGEST_MAX_RETRIES).
+    Returns the seconds after which the job should be handed over again, or
+    None once there is nothing more to do.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    db = metadata_db.SessionLocal()
+    try:
+        job = metadata_db.claim_ingestion_job(db, job_id, worker_id, settings.INGEST_JOB_LEASE_SECONDS)
+        if job is None:
+            job = metadata_db.get_ingestion_job(db, job_id)
+            if job is not None and job.status == "queued":
+                # Still backing off, e.g. resumed by another process
+                return max(metadata_db.seconds_until_due(job), 1.0)
+            print(f"Ingestion job {job_id} is not queued anymore. Skipping.")
+            return None
+
+        try:
+            with _lease_heartbeat(job_id, worker_id):
+                _process_job(db, job)
+        except Exception as e:
+            db.rollback()
+            return _record_failure(db, job, str(e))
+
+        metadata_db.finish_ingestion_job(db, job, "completed")
+        metrics.INGESTION_JOBS.labels("completed").inc()
+        _remove_spooled_file(job.file_path)
+        print(f"Ingestion job {job_id} finished for {job.file_name}.")
+        return None
+    finally:
+        db.close()
+
+
+def _record_failure(db, job, error: str) -> float | None:
+    """Requeues a failed attempt with an exponential backoff, or fails the job after INGEST_MAX_RETRIES."""
+    print(f"Ingestion job {job.id} failed on attempt {job.attempts}: {error}")
+    if job.attempts >= settings.INGEST_MAX_RETRIES:
+        metadata_db.finish_ingestion_job(db, job, "failed", error=error)
+        metrics.INGESTION_JOBS.labels("failed").inc()
+        return None
+    retry_after = settings.INGEST_RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+    metadata_db.finish_ingestion_job(db, job, "queued", error=error, retry_after=retry_after)
+    return retry_after
+
+
+@contextmanager
+def _lease_heartbeat(job_id: str, worker_id: str):
+    """
+    Renews the job's lease from a background thread every third of
+    INGEST_JOB_LEASE_SECONDS, also while a long embedding call blocks the job.
+    """
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(settings.INGEST_JOB_LEASE_SECONDS / 3):
+            try:
+                with metadata_db.session_scope() as db:
+                    if not metadata_db.renew_job_lease(db, job_id, worker_id, settings.INGEST_JOB_LEASE_SECONDS):
+                        print(f"Ingestion job {job_id} lost its lease, another worker may run it.")
+                        return
+            except Exception as e:
+                # The next renewal retries, the lease outlasts two missed ones
+                print(f"Failed to renew the lease of ingestion job {job_id}: {e}")
+
+    thread = threading.Thread(target=renew, name=f"lease-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _process_job(db, job):
+    start = time.perf_counter()
+    db_file, version = _register_file(db, job)
+    content_hash = _file_hash(job.file_path)
+    if _is_unchanged(db_file, job, content_hash):
+        print(f"{job.file_name} is unchanged since version {db_file.version}. Nothing to do.")
+        metadata_db.update_job_stage(db, job, "unchanged", status="completed", version=db_file.version)
+        return
+
+    file_metadata = _chunk_metadata(job)
+    if settings.INGEST_STREAMING:
+        stats = _process_job_streaming(db, job, file_metadata, version)
+    else:
+        stats = _process_job_in_memory(db, job, file_metadata, version)
+
+    if not stats["chunk_count"]:
+        print(f"No content extracted from {job.file_name}. Aborting storage.")
+        _discard_version(db, job, db_file, version)
+        return
+
+    # Chunks of the previous version that are not part of this one, deleted in one request
+    metadata_db.update_job_stage(db, job, "removing_stale_chunks", status="running")
+    stale = metadata_db.stale_point_ids(db, db_file.id, version)
+    with metrics.span("ingestion", "delete_stale"):
+        vector_db.delete_points(stale)
+    metadata_db.update_job_stage(db, job, "removing_stale_chunks", status="completed", chunks_removed=len(stale))
+
+    chunks_added = stats.pop("chunks_stored")
+    metadata_db.complete_file_version(
+        db, db_file, version,
+        chunks_added=chunks_added,
+        chunks_removed=len(stale),
+        file_name=job.file_name,
+        file_type=job.file_type,
+        file_size_bytes=os.path.getsize(job.file_path),
+        content_hash=content_hash,
+        chunking_strategy=job.chunking_strategy,
+        embedding_model=vector_db.EMBEDDING_MODEL_ID,
+        ingest_seconds=round(time.perf_counter() - start, 3),
+        **stats,
+    )
+    print(f"{job.file_name} version {version}: {chunks_added} chunks added, {len(stale)} removed.")
+    if chunks_added or stale:
+        # New content is searchable, so cached retrievals and answers are stale
+        semantic_cache.bump_corpus_version()
+
+
+def _process_job_streaming(db, job, file_metadata: dict, version: int):
+    """
+    Extracts, chunks and stores the file incrementally. Chunks are upserted in
+    fixed-size batches as they are produced, so they become searchable right away.
+    Returns the file statistics.
+    """
+    metadata_db.update_job_stage(db, job, "processing", status="running", chunks_produced=0, chunks_stored=0)
+    text_stats = {}
+    chunks = file_processor.iter_chunks(job.file_path, job.file_name, job.file_type, job.chunking_strategy, text_stats)
+    produced = stored = 0
+    chunk_seconds = store_seconds = 0.0
+
+    while True:
+        start = time.perf_counter()
+        batch = list(itertools.islice(chunks, settings.INGEST_UPSERT_BATCH_SIZE))
+        chunk_seconds += time.perf_counter() - start
+        if not batch:
+            break
+
+        documents = [_with_file_metadata(doc, file_metadata) for doc, _ in batch]
+        vectors = [vector for _, vector in batch]
+        start = time.perf_counter()
+        stored += vector_db.add_documents(documents, vectors if vectors[0] is not None else None)
+        _save_chunks(db, documents, version)
+        store_seconds += time.perf_counter() - start
+        produced += len(batch)
+        metadata_db.update_job_stage(db, job, "processing", chunks_produced=produced, chunks_stored=stored)
+
+    metadata_db.update_job_stage(
+        db, job, "processing", status="completed",
+        chunks_skipped=produced - stored,
+        extract_and_chunk_seconds=round(chunk_seconds, 3),
+        store_seconds=round(store_seconds, 3),
+    )
+    return {
+        "chunk_count": produced,
+        "chunks_stored": stored,
+        "page_count": text_stats.get("pages"),
+        "character_count": text_stats.get("characters"),
+    }
+
+
+def _process_job_in_memory(db, job, file_metadata: dict, version: int):
+    with open(job.file_path, "rb") as f:
+        file_content = f.read()
+
+    # Extract
+    metadata_db.update_job_stage(db, job, "extracting", status="running")
+    start = time.perf_counter()
+    pages = file_processor._extract_pages_from_bytes(file_content, job.file_type)
+    raw_text = "".join(pages)
+    metadata_db.update_job_stage(db, job, "extracting", status="completed", characters=len(raw_text), seconds=round(time.perf_counter() - start, 3))
+
+    if not raw_text:
+        return {"chunk_count": 0}
+    page_starts = list(itertools.accumulate((len(page) for page in pages[:-1]), initial=0)) if job.file_type == "application/pdf" else None
+
+    # Chunk
+    metadata_db.update_job_stage(db, job, "chunking", status="running")
+    start = time.perf_counter()
+    documents, vectors = file_processor.chunk_text(raw_text, job.file_name, job.chunking_strategy, page_starts)
+    documents = [_with_file_metadata(doc, file_metadata) for doc in documents]
+    metadata_db.update_job_stage(db, job, "chunking", status="completed", chunks=len(documents), seconds=round(time.perf_counter() - start, 3))
+
+    # Embed and store the chunks in Qdrant (Vector DB)
+    metadata_db.update_job_stage(db, job, "storing", status="running", chunks_total=len(documents))
+    start = time.perf_counter()
+    stored = vector_db.add_documents(documents, vectors)
+    _save_chunks(db, documents, version)
+    metadata_db.update_job_stage(
+        db, job, "storing", status="completed",
+        chunks_stored=stored, chunks_skipped=len(documents) - stored, seconds=round(time.perf_counter() - start, 3),
+    )
+    return {
+        "chunk_count": len(documents),
+        "chunks_stored": stored,
+        "page_count": len(page_starts) if page_starts else None,
+        "character_count": len(raw_text),
+    }
+
+
+def _register_file(db, job):
+    """
+    Finds the file by its document key, or stores new file metadata in
+    PostgreSQL (Relational DB), before any chunk is stored. A job without a
+    key always gets a new file. A re-upload keeps the file ID, so unchanged
+    chunks keep their point IDs. Returns the file and the version being ingested.
+    Only one job per document key is active at a time (a unique index), and the
+    version is picked with the file row locked.
+    """
+    metadata_db.update_job_stage(db, job, "saving_metadata", status="running")
+    if job.file_id is None:
+        document_key = job.document_key
+        db_file = metadata_db.find_file_by_key(db, document_key) if document_key else None
+        if db_file is None:
+            try:
+                db_file = metadata_db.save_file_metadata(
+                    db=db,
+                    file_name=job.file_name,
+                    chunking_strategy=job.chunking_strategy,
+                    embedding_model=vector_db.EMBEDDING_MODEL_ID,
+                    file_type=job.file_type,
+                    file_size_bytes=os.path.getsize(job.file_path),
+                    document_key=document_key,
+                )
+            except IntegrityError:
+                # Created by another job meanwhile, the key is unique
+                db.rollback()
+                db_file = metadata_db.find_file_by_key(db, document_key)
+        job.file_id = db_file.id
+
+    db_file = metadata_db.get_file_metadata(db, job.file_id, for_update=True)
+    if db_file is None:
+        raise RuntimeError(f"File {job.file_id} was deleted while it was being ingested.")
+    version = db_file.version + 1
+    # A retry produces the chunk rows of this version again. Committed together with the stage, which releases the lock.
+    metadata_db.delete_chunks(db, db_file.id, version, commit=False)
+    metadata_db.update_job_stage(db, job, "saving_metadata", status="completed", file_id=db_file.id, version=version)
+    return db_file, version
+
+
+def _is_unchanged(db_file, job, content_hash: str) -> bool:
+    return (
+        db_file.status == "ready"
+        and db_file.content_hash == content_hash
+        and db_file.chunking_strategy == job.chunking_strategy
+        and db_file.embedding_model == vector_db.EMBEDDING_MODEL_ID
+    )
+
+
+def _chunk_metadata(job) -> dict:
+    """Metadata added to every chunk payload."""
+    uploaded_at = job.created_at
+    if uploaded_at.tzinfo is None:
+        # SQLite returns naive timestamps, they are UTC
+        uploaded_at = uploaded_at.replace(tzinfo=timezone.utc)
+    return {"file_id": job.file_id, "uploaded_at": uploaded_at.isoformat()}
+
+
+def _discard_version(db, job, db_file, version: int):
+    if version > 1:
+        # The previous version stays as it is
+        metadata_db.delete_chunks(db, db_file.id, version)
+        return
+    metadata_db.delete_file_metadata(db, db_file)
+    job.file_id = None
+    db.commit()
+
+
+def _file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _save_chunks(db, documents: list, version: int):
+    """Records the chunks in the chunks table with one bulk insert per batch."""
+    rows = [
+        {
+            "file_id": doc.metadata["file_id"],
+            "version": version,
+            "chunk_index": doc.metadata["chunk_index"],
+            "point_id": vector_db.chunk_point_id(doc.metadata["file_id"], doc.metadata["content_hash"]),
+            "content_hash": doc.metadata["content_hash"],
+            "char_start": doc.metadata.get("char_start"),
+            "char_end": doc.metadata.get("char_end"),
+            "page": doc.metadata.get("page"),
+            "char_count": len(doc.page_content),
+        }
+        for doc in documents
+    ]
+    with metrics.span("ingestion", "chunk_rows"):
+        metadata_db.bulk_insert_chunks(db, rows)
+
+
+def _with_file_metadata(doc, file_metadata: dict):
+    doc.metadata.update(file_metadata)
+    return doc
+
+
+def _remove_spooled_file(file_path: str):
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
@@ -0,0 +1,125 @@
+import re
+
+import numpy as np
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from app.core.config import settings
+from app.db import vector_db
+
+# Routes returned by `classify`. Only "document" takes the single-call fast path,
+# everything else goes through the full agent.
+DOCUMENT = "document"
+BOOKING = "booking"
+SMALL_TALK = "small_talk"
+AMBIGUOUS = "ambiguous"
+
+_BOOKING_PATTERN = re.compile(
+    r"\b(book|booking|interview|schedul\w*|reschedul\w*|appointment|slot|cancel)\b|[\w.+-]+@[\w-]+\.\w+",
+    re.IGNORECASE,
+)
+_DOCUMENT_PATTERN = re.compile(
+    r"\b(document|documents|doc|file|pdf|report|text|according to|summari[sz]e|summary|mentioned|described)\b",
+    re.IGNORECASE,
+)
+_SMALL_TALK_PATTERN = re.compile(
+    r"^\s*(hi|hello|hey|thanks|thank you|ok|okay|bye|goodbye|good (morning|afternoon|evening))\b[\s!.?]*$",
+    re.IGNORECASE,
+)
+# The details the booking tool needs, as the agent asks for them
+_BOOKING_DETAILS_PATTERN = re.compile(r"\b(name|e-?mail|date|time|when)\b", re.IGNORECASE)
+# Words that only make sense together with an earlier turn
+_FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|she|his|her|more|else|also|what about|how about)\b",
+    re.IGNORECASE,
+)
+
+# Example utterances per intent, compared to the query embedding
+PROTOTYPES = {
+    DOCUMENT: [
+        "What is the main idea of the document?",
+        "Summarize the key points of the report.",
+        "What does the file say about the architecture?",
+        "Which programming language is used for the system?",
+        "Who founded the company and when?",
+        "Explain how the process described in the text works.",
+        "What are the results and conclusions?",
+        "List the products mentioned in the profile.",
+    ],
+    BOOKING: [
+        "I want to book an interview.",
+        "Schedule an interview for tomorrow at 3 PM.",
+        "Can I get an interview slot next week?",
+        "My name is John Smith and my email is john@example.com.",
+        "Please reschedule my interview.",
+    ],
+    SMALL_TALK: [
+        "Hi, how are you?",
+        "Hello there!",
+        "Thanks for your help.",
+        "Who are you?",
+        "Goodbye.",
+    ],
+}
+
+_prototype_vectors = None
+
+
+async def classify(query: str, booking_in_progress: bool = False) -> str:
+    """
+    Cheap intent classification without an LLM call: keyword rules first,
+    then nearest prototype by embedding similarity. Anything unclear is AMBIGUOUS.
+    While the agent waits for missing booking details (see `asks_for_booking_details`),
+    every reply belongs to the booking flow.
+    """
+    if _BOOKING_PATTERN.search(query) or booking_in_progress:
+        return BOOKING
+    if _SMALL_TALK_PATTERN.match(query):
+        return SMALL_TALK
+    if _DOCUMENT_PATTERN.search(query):
+        return DOCUMENT
+
+    # The query vector is cached, so the retrieval that follows doesn't embed it again
+    embeddings = vector_db.get_embedding_function()
+    query_vector = _normalize(np.asarray([await embeddings.aembed_query(query)], dtype=np.float32))[0]
+    scores = {intent: float(np.max(vectors @ query_vector)) for intent, vectors in (await _get_prototype_vectors()).items()}
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    best, runner_up = ranked[0], ranked[1]
+    if scores[best] < settings.CHAT_ROUTER_MIN_SIMILARITY:
+        return AMBIGUOUS
+    if scores[best] - scores[runner_up] < settings.CHAT_ROUTER_MARGIN:
+        return AMBIGUOUS
+    return best
+
+
+def rewrite_follow_up(query: str, history: list[BaseMessage]) -> str:
+    """
+    Makes a follow-up question standalone for retrieval by prefixing the
+    previous question, e.g. "What about its pricing?" after "What is Helios?".
+    """
+    previous = next((m.content for m in reversed(history) if isinstance(m, HumanMessage)), None)
+    if not previous or not isinstance(previous, str):
+        return query
+    if len(query.split()) <= 3 or _FOLLOW_UP_PATTERN.search(query):
+        return f"{previous} {query}"
+    return query
+
+
+def asks_for_booking_details(answer: str) -> bool:
+    """Whether the agent's answer to a booking request asks the user for a missing detail."""
+    return "?" in answer and bool(_BOOKING_DETAILS_PATTERN.search(answer))
+
+
+async def _get_prototype_vectors() -> dict[str, np.ndarray]:
+    global _prototype_vectors
+    if _prototype_vectors is None:
+        embeddings = vector_db.get_embedding_function()
+        _prototype_vectors = {
+            intent: _normalize(np.asarray(await embeddings.aembed_documents(examples), dtype=np.float32))
+            for intent, examples in PROTOTYPES.items()
+        }
+    return _prototype_vectors
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
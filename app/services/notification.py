@@ -2,11 +2,10 @@ import smtplib
 from email.mime.text import MIMEText
 from app.core.config import settings
 
-def send_booking_confirmation(full_name: str, email: str, date: str, time: str):
-    """Sends a confirmation email for the booked interview."""
+def booking_confirmation(full_name: str, email: str, date: str, time: str) -> dict:
+    """Builds the confirmation email for the booked interview, to be queued in the outbox."""
     recipient_email = settings.SMTP_SENDER_EMAIL
 
-    # Create the email message
     body = (
         f"Dear {full_name},\n\n"
         f"This is a confirmation that your interview with Palm Mind Technology has been successfully booked.\n\n"
@@ -17,17 +16,62 @@ def send_booking_confirmation(full_name: str, email: str, date: str, time: str):
         f"Best regards,\n"
         f"PalmBot"
     )
-    msg = MIMEText(body)
-    msg['Subject'] = 'Interview Confirmation - Palm Mind Technology'
-    msg['From'] = settings.SMTP_SENDER_EMAIL
-    msg['To'] = recipient_email
-
-    try:
-        print(f"Attempting to send booking confirmation email to {recipient_email}...")
-        with smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT) as server:
-            server.starttls() # Secure the connection
-            server.login(settings.SMTP_SENDER_EMAIL, settings.SMTP_SENDER_PASSWORD)
-            server.send_message(msg)
-        print("Confirmation email sent successfully.")
-    except Exception as e:
-        print(f"CRITICAL: Failed to send email. Error: {e}")
+    return {
+        "recipient": recipient_email,
+        "subject": "Interview Confirmation - Palm Mind Technology",
+        "body": body,
+    }
+
+
+class SmtpConnection:
+    """
+    One SMTP connection reused for many emails. Opened on the first send and
+    reopened once if the server dropped it (servers close idle connections).
+    Blocking, call it from a thread.
+    """
+
+    def __init__(self):
+        self._server = None
+
+    def send(self, recipient: str, subject: str, body: str):
+        msg = MIMEText(body)
+        msg['Subject'] = subject
+        msg['From'] = settings.SMTP_SENDER_EMAIL
+        msg['To'] = recipient
+
+        if self._server is None:
+            self._server = self._connect()
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self._server = None
+            self._server = self._connect()
+            self._server.send_message(msg)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+            # The server rejected this email, the connection is still usable
+            raise
+        except Exception:
+            # Unknown connection state, start over with the next email
+            self.close()
+            raise
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        try:
+            if settings.SMTP_USE_TLS:
+                server.starttls() # Secure the connection
+            if settings.SMTP_SENDER_PASSWORD:
+                server.login(settings.SMTP_SENDER_EMAIL, settings.SMTP_SENDER_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        return server
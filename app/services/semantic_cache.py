@@ -0,0 +1,119 @@
+import threading
+
+import numpy as np
+import redis
+
+from app.core.config import settings
+from app.db.chat_history import get_redis_client, get_async_redis_client
+
+# Bumped by the ingestion path whenever new content becomes searchable
+CORPUS_VERSION_KEY = "corpus_version"
+
+
+class SemanticCache:
+    """
+    Small in-process vector index mapping query embeddings to cached results.
+    A lookup hits when a cached query is at least `threshold` cosine-similar.
+    Entries are tied to a corpus version and dropped as soon as it changes.
+    """
+
+    def __init__(self, name: str, threshold: float = 0.95, max_entries: int = 1000):
+        self.name = name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version = None
+        self._vectors = None
+        self._values = []
+        self._costs = []
+        self._next = 0
+        self._stats = {"hits": 0, "misses": 0, "seconds_saved": 0.0}
+
+    def lookup(self, vector: list[float], version: int | None):
+        query = _normalize(vector)
+        with self._lock:
+            self._check_version(version)
+            if version is None or not self._values:
+                self._stats["misses"] += 1
+                return None
+
+            similarities = self._vectors[:len(self._values)] @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self._stats["misses"] += 1
+                return None
+
+            self._stats["hits"] += 1
+            self._stats["seconds_saved"] += self._costs[best]
+            return self._values[best]
+
+    def store(self, vector: list[float], value, version: int | None, compute_seconds: float):
+        """Caches a value. `compute_seconds` is what a future hit saves."""
+        if version is None:
+            return
+        query = _normalize(vector)
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+
+            # Oldest entries are overwritten once the index is full
+            slot = self._next % self.max_entries
+            self._vectors[slot] = query
+            if slot < len(self._values):
+                self._values[slot] = value
+                self._costs[slot] = compute_seconds
+            else:
+                self._values.append(value)
+                self._costs.append(compute_seconds)
+            self._next += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._values)
+            stats["corpus_version"] = self._version
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+        return stats
+
+    def _check_version(self, version: int | None):
+        if version != self._version:
+            self._version = version
+            self._values, self._costs, self._next = [], [], 0
+
+
+def _normalize(vector: list[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+retrieval_cache = SemanticCache(
+    "retrieval", threshold=settings.SEMANTIC_CACHE_THRESHOLD, max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES
+)
+chat_cache = SemanticCache(
+    "chat", threshold=settings.SEMANTIC_CACHE_THRESHOLD, max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES
+)
+
+
+# Corpus version, shared by all processes through Redis.
+# None means it is unknown right now, and the caches are bypassed.
+def get_corpus_version() -> int | None:
+    try:
+        return int(get_redis_client(settings.REDIS_URL).get(CORPUS_VERSION_KEY) or 0)
+    except redis.RedisError:
+        return None
+
+async def aget_corpus_version() -> int | None:
+    try:
+        return int(await get_async_redis_client(settings.REDIS_URL).get(CORPUS_VERSION_KEY) or 0)
+    except redis.RedisError:
+        return None
+
+def bump_corpus_version() -> int:
+    """Invalidates every semantic cache entry. Called after new content is ingested."""
+    return get_redis_client(settings.REDIS_URL).incr(CORPUS_VERSION_KEY)
+
+async def abump_corpus_version() -> int:
+    return await get_async_redis_client(settings.REDIS_URL).incr(CORPUS_VERSION_KEY)
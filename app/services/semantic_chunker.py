@@ -0,0 +1,92 @@
+import re
+
+import numpy as np
+from langchain.schema.document import Document
+from langchain_core.embeddings import Embeddings
+
+
+class VectorizedSemanticChunker:
+    """
+    Splits text where the meaning shifts between consecutive sentences.
+    Works like LangChain's SemanticChunker (percentile breakpoints over cosine
+    distances of sentence windows), but embeds all sentences in large batches,
+    does the maths with NumPy and keeps the sentence embeddings, so every chunk
+    comes with a vector and never has to be embedded a second time.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        breakpoint_percentile: float = 95.0,
+        buffer_size: int = 1,
+        chunk_vectors: str = "mean",
+        batch_size: int = 256,
+        sentence_split_regex: str = r"(?<=[.?!])\s+",
+    ):
+        if chunk_vectors not in ("mean", "reembed"):
+            raise ValueError(f"Unsupported chunk vector mode: {chunk_vectors}")
+        self.embeddings = embeddings
+        self.breakpoint_percentile = breakpoint_percentile
+        self.buffer_size = buffer_size
+        self.chunk_vectors = chunk_vectors
+        self.batch_size = batch_size
+        self.sentence_split_regex = sentence_split_regex
+
+    def split_text(self, text: str) -> list[str]:
+        return [chunk for chunk, _ in self._split(text)]
+
+    def create_documents(self, texts: list[str], metadatas: list[dict] | None = None) -> list[Document]:
+        documents, _ = self.create_documents_with_vectors(texts, metadatas)
+        return documents
+
+    def create_documents_with_vectors(
+        self, texts: list[str], metadatas: list[dict] | None = None
+    ) -> tuple[list[Document], list[list[float]]]:
+        """Returns the chunks as Documents together with one vector per chunk."""
+        documents, vectors = [], []
+        for i, text in enumerate(texts):
+            metadata = metadatas[i] if metadatas else {}
+            for chunk, vector in self._split(text):
+                documents.append(Document(page_content=chunk, metadata=dict(metadata)))
+                vectors.append(vector)
+
+        if self.chunk_vectors == "reembed" and documents:
+            vectors = self._embed([doc.page_content for doc in documents]).tolist()
+        return documents, vectors
+
+    def _split(self, text: str) -> list[tuple[str, list[float]]]:
+        sentences = [s for s in re.split(self.sentence_split_regex, text) if s.strip()]
+        if not sentences:
+            return []
+
+        # Each sentence is embedded together with its neighbours to smooth out noise
+        windows = [
+            " ".join(sentences[max(0, i - self.buffer_size): i + self.buffer_size + 1])
+            for i in range(len(sentences))
+        ]
+        vectors = self._embed(windows)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        # Break after sentence i when the distance to sentence i + 1 is in the top percentile
+        if len(sentences) > 1:
+            distances = 1.0 - np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+            threshold = np.percentile(distances, self.breakpoint_percentile)
+            breakpoints = np.flatnonzero(distances > threshold).tolist()
+        else:
+            breakpoints = []
+
+        chunks = []
+        start = 0
+        for end in breakpoints + [len(sentences) - 1]:
+            pooled = vectors[start:end + 1].mean(axis=0)
+            pooled /= max(np.linalg.norm(pooled), 1e-12)
+            chunks.append((" ".join(sentences[start:end + 1]), pooled.tolist()))
+            start = end + 1
+        return chunks
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        batches = [
+            self.embeddings.embed_documents(texts[i:i + self.batch_size])
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        return np.asarray([vector for batch in batches for vector in batch], dtype=np.float32)
@@ -0,0 +1,263 @@
+"""
+Ingestion benchmark: where does the time go between upload and searchable chunks?
+
+Runs the file_processor pipeline over a corpus of synthetic PDFs and text files
+(plus any sample files passed with --files) and times each stage separately:
+
+    extract  pypdf / text decoding
+    chunk    recursive or semantic splitting (semantic also embeds the sentences)
+    embed    embedding the chunks that have no vector yet
+    upsert   vector_db.add_documents into Qdrant
+
+For every chunking strategy and batch size it reports docs/s, chunks/s, MB/s and
+the peak RSS of each stage. Everything runs offline against an in-memory Qdrant.
+
+    python -m benchmarks.ingestion --strategies recursive,semantic --batch-sizes 16,64,256
+    python -m benchmarks.ingestion --embeddings fake --profile sample
+
+--embeddings fake swaps the model for a deterministic fake, which isolates
+the pipeline overhead and needs no model download.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+# The benchmark is self-contained: in-memory Qdrant and placeholder values for
+# settings the ingestion pipeline never uses. Real values from the environment win.
+os.environ["QDRANT_LOCATION"] = ":memory:"
+for _name, _value in {
+    "DATABASE_URL": "sqlite://",
+    "QDRANT_HOST": "localhost",
+    "QDRANT_PORT": "6333",
+    "QDRANT_COLLECTION_NAME": "benchmark_ingestion",
+    "REDIS_URL": "redis://localhost:6379/0",
+    "GOOGLE_API_KEY": "unused",
+    "SMTP_SERVER": "localhost",
+    "SMTP_PORT": "25",
+    "SMTP_SENDER_EMAIL": "benchmark@example.com",
+    "SMTP_SENDER_PASSWORD": "unused",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from app.core.config import settings
+from app.db import vector_db
+from app.services import file_processor
+from benchmarks.common import RESULTS_DIR, RssSampler, environment, int_list, str_list, write_results
+from benchmarks.profiling import profile
+
+STAGES = ("extract", "chunk", "embed", "upsert")
+
+# Each topic has its own vocabulary, so topic changes give the semantic chunker real breakpoints
+TOPICS = {
+    "architecture": "service gateway queue cluster replica shard latency throughput cache protocol",
+    "finance": "revenue margin budget invoice forecast quarter expense audit capital dividend",
+    "biology": "protein enzyme cell membrane genome receptor mutation tissue organism pathway",
+    "hiring": "candidate interview recruiter offer salary onboarding role schedule panel feedback",
+    "climate": "emission carbon rainfall drought glacier temperature ocean forest storm aerosol",
+}
+FILLER = "the a of to and in is for with on that by this from as are was be it".split()
+
+
+def synthetic_text(rng: random.Random, paragraphs: int) -> str:
+    result = []
+    topic = rng.choice(list(TOPICS))
+    for i in range(paragraphs):
+        if i % 3 == 0:
+            topic = rng.choice(list(TOPICS))
+        words = TOPICS[topic].split()
+        sentences = []
+        for _ in range(rng.randint(4, 8)):
+            sentence = [rng.choice(words if rng.random() < 0.4 else FILLER) for _ in range(rng.randint(8, 18))]
+            sentences.append(" ".join(sentence).capitalize() + ".")
+        result.append(" ".join(sentences))
+    return "\n\n".join(result)
+
+
+def write_pdf(path: str, text: str, lines_per_page: int = 50, line_chars: int = 95):
+    """Writes a minimal valid PDF (Helvetica, one text stream per page) that pypdf can extract."""
+    lines = []
+    for paragraph in text.split("\n"):
+        while len(paragraph) > line_chars:
+            cut = paragraph.rfind(" ", 0, line_chars)
+            cut = cut if cut > 0 else line_chars
+            lines.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        lines.append(paragraph)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    # Object 1 is the catalog, 2 the page tree, 3 the font, then a page and a content stream per page
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, page_lines in zip(page_ids, pages):
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in page_lines)
+        stream = ("BT /F1 10 Tf 14 TL 50 750 Td\n" + "".join(f"({line}) Tj T*\n" for line in escaped) + "ET").encode("latin-1", "replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def build_corpus(args, directory: str) -> list[tuple[str, str, str]]:
+    """Returns (path, file name, content type) for every file of the benchmark corpus."""
+    rng = random.Random(args.seed)
+    files = []
+    for i in range(args.pdfs):
+        path = os.path.join(directory, f"synthetic_{i}.pdf")
+        write_pdf(path, synthetic_text(rng, args.paragraphs))
+        files.append((path, os.path.basename(path), "application/pdf"))
+    for i in range(args.texts):
+        path = os.path.join(directory, f"synthetic_{i}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(synthetic_text(rng, args.paragraphs))
+        files.append((path, os.path.basename(path), "text/plain"))
+    for path in args.files:
+        file_type = "application/pdf" if path.lower().endswith(".pdf") else "text/plain"
+        files.append((path, os.path.basename(path), file_type))
+    return files
+
+
+def make_embeddings(kind: str):
+    """
+    The model behind the same batching engine the app uses, but without the
+    embedding cache: a warm cache would hide the embedding cost on repeated runs.
+    """
+    if kind == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        return DeterministicFakeEmbedding(size=384), 384
+
+    from app.db import embedding_backends
+    from app.db.embedding_batcher import BatchingEmbeddings
+    model = embedding_backends.load_embeddings(
+        vector_db.EMBEDDING_MODEL_NAME, settings.EMBEDDING_BACKEND, settings.EMBEDDING_THREADS, settings.EMBEDDING_ONNX_FILE
+    )
+    batcher = BatchingEmbeddings(model, settings.EMBEDDING_MAX_BATCH_SIZE, settings.EMBEDDING_MAX_WAIT_MS)
+    return batcher, model.client.get_sentence_embedding_dimension()
+
+
+def reset_collection(dimension: int):
+    # Chunk IDs are content hashes, so a reused collection would skip every upsert
+    client = vector_db.get_qdrant_client()
+    if client.collection_exists(settings.QDRANT_COLLECTION_NAME):
+        client.delete_collection(settings.QDRANT_COLLECTION_NAME)
+    vector_db.create_collection(client, settings.QDRANT_COLLECTION_NAME, vector_db.get_index_profile(), dimension)
+    vector_db._sparse_enabled = None
+
+
+def run_pipeline(files: list, strategy: str, batch_size: int) -> dict:
+    totals = {stage: {"seconds": 0.0, "peak_rss_mb": 0.0} for stage in STAGES}
+    input_bytes = sum(os.path.getsize(path) for path, _, _ in files)
+    chunks = 0
+
+    def timed(stage, func, *args):
+        with RssSampler() as sampler:
+            start_time = time.perf_counter()
+            result = func(*args)
+            totals[stage]["seconds"] += time.perf_counter() - start_time
+        totals[stage]["peak_rss_mb"] = max(totals[stage]["peak_rss_mb"], sampler.peak_mb)
+        return result
+
+    embeddings = vector_db.get_embedding_function()
+    for path, file_name, file_type in files:
+        text = timed("extract", lambda: "".join(file_processor._iter_text_from_file(path, file_type)))
+        documents, vectors = timed("chunk", file_processor.chunk_text, text, file_name, strategy)
+        chunks += len(documents)
+
+        if vectors is None:
+            vectors = timed("embed", lambda: [
+                vector
+                for i in range(0, len(documents), batch_size)
+                for vector in embeddings.embed_documents([doc.page_content for doc in documents[i:i + batch_size]])
+            ])
+        timed("upsert", lambda: [
+            vector_db.add_documents(documents[i:i + batch_size], vectors[i:i + batch_size])
+            for i in range(0, len(documents), batch_size)
+        ])
+
+    stages = {}
+    for stage, total in totals.items():
+        seconds = total["seconds"]
+        stages[stage] = {
+            "seconds": round(seconds, 4),
+            "docs_per_sec": round(len(files) / seconds, 2) if seconds else None,
+            "chunks_per_sec": round(chunks / seconds, 1) if seconds else None,
+            "mb_per_sec": round(input_bytes / 2**20 / seconds, 3) if seconds else None,
+            "peak_rss_mb": round(total["peak_rss_mb"], 1),
+        }
+    total_seconds = sum(total["seconds"] for total in totals.values())
+    return {
+        "strategy": strategy,
+        "batch_size": batch_size,
+        "files": len(files),
+        "input_mb": round(input_bytes / 2**20, 3),
+        "chunks": chunks,
+        "total_seconds": round(total_seconds, 4),
+        "chunks_per_sec": round(chunks / total_seconds, 1) if total_seconds else None,
+        "stages": stages,
+    }
+
+
+def run(args) -> dict:
+    embeddings, dimension = make_embeddings(args.embeddings)
+    vector_db._embedding_function = embeddings
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="benchmark_ingestion_") as directory:
+        files = build_corpus(args, directory)
+        print(f"Corpus: {len(files)} files, {sum(os.path.getsize(p) for p, _, _ in files) / 2**20:.2f} MB")
+
+        for strategy in args.strategies:
+            for batch_size in args.batch_sizes:
+                reset_collection(dimension)
+                prefix = os.path.join(args.profile_dir, f"ingestion_{strategy}_{batch_size}")
+                with profile(args.profile, prefix):
+                    result = run_pipeline(files, strategy, batch_size)
+                runs.append(result)
+                breakdown = ", ".join(f"{stage} {stats['seconds']:.2f}s" for stage, stats in result["stages"].items())
+                print(f"[{strategy} batch={batch_size}] {result['chunks']} chunks, {result['chunks_per_sec']} chunks/s ({breakdown})")
+
+    return {
+        "benchmark": "ingestion",
+        "environment": environment(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "runs": runs,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipeline stage by stage.")
+    parser.add_argument("--strategies", type=str_list, default=["recursive", "semantic"])
+    parser.add_argument("--batch-sizes", type=int_list, default=[16, 64, 256], help="Embedding and upsert batch sizes")
+    parser.add_argument("--pdfs", type=int, default=5, help="Number of synthetic PDFs")
+    parser.add_argument("--texts", type=int, default=5, help="Number of synthetic text files")
+    parser.add_argument("--paragraphs", type=int, default=60, help="Paragraphs per synthetic file")
+    parser.add_argument("--files", nargs="*", default=[], help="Sample .pdf/.txt files to include")
+    parser.add_argument("--embeddings", choices=["model", "fake"], default="model")
+    parser.add_argument("--profile", choices=["cprofile", "sample"], help="Also profile every run")
+    parser.add_argument("--profile-dir", default=RESULTS_DIR)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Result file. Defaults to benchmarks/results/ingestion_<time>.json")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    write_results("ingestion", run(args), args.output)
@@ -0,0 +1,634 @@
+"""
+Load test: how do /api/agent/chat and /api/ingest/upload behave under concurrency?
+
+Boots the FastAPI app from main.py in a uvicorn server on a local port, with
+local stand-ins for every external service:
+
+    Qdrant   in-memory (or a real server with --qdrant-url)
+    Redis    fakeredis
+    database SQLite in a temporary file (or any DATABASE_URL from the environment)
+    Gemini   a deterministic fake chat model with --llm-latency-ms per call
+    SMTP     an aiosmtpd sink that counts the booking emails
+
+Closed-loop virtual users then send a mix of chat, booking and upload requests
+at each concurrency level. For every level it reports throughput, p50/p95/p99
+latency, error rate and admission control rejections (429/504) per operation,
+the end-to-end ingestion time of the uploads, and saturation: event-loop lag
+of the API process, its CPU use and the utilization and queue depth of the
+ingestion workers.
+
+    python -m benchmarks.load --concurrency 1,8,32 --requests 200
+    python -m benchmarks.load --mix chat=0.8,upload=0.2 --llm-latency-ms 800
+    python -m benchmarks.load --baseline benchmarks/results/load_baseline.json --max-regression 0.2
+
+With --baseline the run exits with status 1 if p95 latency or throughput of any
+level and operation regressed by more than --max-regression, or its error rate
+grew, so changes to the agent and ingestion paths can be gated in CI.
+
+Ingestion jobs run on INGEST_MAX_WORKERS threads of the API process instead of
+worker processes, because the in-memory stand-ins cannot be shared with other
+processes. Ingestion therefore competes with the API for the GIL, which makes
+the numbers a pessimistic bound. Needs `pip install "fakeredis[lua]" aiosmtpd aiosqlite`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+# Placeholder values for the stand-ins. Real values from the environment win,
+# e.g. DATABASE_URL=postgresql://... to test against a local PostgreSQL.
+SQLITE_PATH = os.path.join(tempfile.gettempdir(), f"benchmark_load_{os.getpid()}.db")
+os.environ.setdefault("QDRANT_LOCATION", ":memory:")
+for _name, _value in {
+    "DATABASE_URL": f"sqlite:///{SQLITE_PATH}",
+    "QDRANT_HOST": "localhost",
+    "QDRANT_PORT": "6333",
+    "QDRANT_COLLECTION_NAME": "benchmark_load",
+    "REDIS_URL": "redis://localhost:6379/0",
+    "GOOGLE_API_KEY": "unused",
+    "SMTP_SERVER": "127.0.0.1",
+    "SMTP_PORT": "25",
+    "SMTP_SENDER_EMAIL": "benchmark@example.com",
+    "SMTP_SENDER_PASSWORD": "",
+    "SMTP_USE_TLS": "false",
+    "EMBEDDING_WARMUP": "false",
+    "EMBEDDING_CACHE_BACKEND": "memory",
+    "EMAIL_DISPATCH_INTERVAL_SECONDS": "0.5",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+import httpx
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.core.config import settings
+from app.db import chat_history, metadata_db, vector_db
+from app.services import agent_service, ingestion_worker
+from benchmarks.common import environment, int_list, latency_summary, write_results
+from benchmarks.ingestion import TOPICS, synthetic_text
+
+OPERATIONS = ("chat", "booking", "upload")
+
+QUESTIONS = [
+    "What does the document say about the {word}?",
+    "Summarize what the report mentions about {word}.",
+    "How is the {word} described in the documents?",
+    "Which section of the file covers the {word}?",
+]
+
+_BOOKING_REQUEST = re.compile(r"for (?P<full_name>[^,]+), email (?P<email>\S+), on (?P<date>\S+) at (?P<time>[\d:]+)")
+
+
+# STAND-INS
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for Gemini. Every call waits `latency_ms`. With tools
+    bound (the agent) it books when asked to, searches the documents otherwise,
+    and answers once a tool returned. Without tools (the single-call document
+    path, summaries) it answers right away.
+    """
+    latency_ms: float = 300.0
+    tools_bound: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-load-test"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tools_bound": True})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency_ms / 1000)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._respond(messages)
+
+    def _respond(self, messages) -> ChatResult:
+        last = messages[-1]
+        prompt_chars = sum(len(str(message.content)) for message in messages)
+        if not self.tools_bound or isinstance(last, ToolMessage):
+            message = AIMessage(content=f"Based on the documents, here is the answer ({prompt_chars} characters of context).")
+        elif match := _BOOKING_REQUEST.search(str(last.content)):
+            message = AIMessage(content="", tool_calls=[{"name": "interview_booking_tool", "args": match.groupdict(), "id": "booking"}])
+        else:
+            message = AIMessage(content="", tool_calls=[{"name": "document_search", "args": {"query": str(last.content)}, "id": "search"}])
+        output_tokens = len(str(message.content)) // 4 + 1
+        message.usage_metadata = {
+            "input_tokens": prompt_chars // 4,
+            "output_tokens": output_tokens,
+            "total_tokens": prompt_chars // 4 + output_tokens,
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic vectors plus the `client` interface the app expects from SentenceTransformer."""
+
+    @property
+    def client(self):
+        return _FakeSentenceTransformer(self)
+
+
+class _FakeSentenceTransformer:
+    def __init__(self, embeddings: FakeEmbeddings):
+        self.embeddings = embeddings
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.embeddings.size
+
+    def encode(self, texts, **kwargs):
+        return np.asarray(self.embeddings.embed_documents(list(texts)))
+
+
+class LockedQdrant:
+    """
+    The in-memory Qdrant client is not thread-safe: concurrent upserts of the
+    ingestion threads and searches of the API corrupt its arrays. One call at a time.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attribute(*args, **kwargs)
+        return call
+
+
+class ThreadedAsyncQdrant:
+    """
+    Async facade over the sync client. The async client of an in-memory Qdrant
+    is a separate instance, so the API would not see the ingested points.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return call
+
+
+class SmtpSink:
+    """Local SMTP server that accepts and counts every email."""
+
+    def __init__(self, port: int):
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError as e:
+            raise ImportError("The load test needs a local SMTP server: pip install aiosmtpd") from e
+        self.received = 0
+        self.controller = Controller(self, hostname="127.0.0.1", port=port)
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+# SATURATION
+class LoopMonitor:
+    """Measures how late a periodic timer fires on the API event loop: the time requests wait for the loop."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def reset(self) -> list[float]:
+        lags, self.lags = self.lags, []
+        return lags
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(loop.time() - start - self.interval, 0.0))
+
+
+class IngestionWorkers:
+    """Thread pool in place of the ingestion process pool, recording busy time and queue depth."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestion-worker")
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.busy_seconds = 0.0
+            self.queued = 0
+            self.max_queue_depth = 0
+
+    def submit(self, job_id: str, delay: float = 0):
+        if delay > 0:
+            # Retry backoff, like ingestion_worker.enqueue_job it doesn't occupy a worker
+            timer = threading.Timer(delay, self.submit, [job_id])
+            timer.daemon = True
+            timer.start()
+            return
+        with self._lock:
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        self.executor.submit(self._run, job_id)
+
+    def _run(self, job_id: str):
+        with self._lock:
+            self.queued -= 1
+        start = time.perf_counter()
+        try:
+            retry_after = ingestion_worker.run_ingestion_job(job_id)
+        finally:
+            with self._lock:
+                self.busy_seconds += time.perf_counter() - start
+        if retry_after is not None:
+            self.submit(job_id, retry_after)
+
+
+def install_stand_ins(args, app) -> tuple[LoopMonitor, IngestionWorkers, SmtpSink]:
+    try:
+        import fakeredis
+    except ImportError as e:
+        raise ImportError("The load test needs fakeredis: pip install \"fakeredis[lua]\"") from e
+    server = fakeredis.FakeServer()
+    chat_history._redis_clients[settings.REDIS_URL] = fakeredis.FakeRedis(server=server)
+    chat_history._async_redis_clients[settings.REDIS_URL] = fakeredis.FakeAsyncRedis(server=server)
+
+    if args.qdrant_url:
+        from qdrant_client import AsyncQdrantClient, QdrantClient
+        vector_db._qdrant_client = QdrantClient(url=args.qdrant_url)
+        vector_db._async_qdrant_client = AsyncQdrantClient(url=args.qdrant_url)
+    elif settings.QDRANT_LOCATION == ":memory:":
+        vector_db._qdrant_client = LockedQdrant(vector_db.get_qdrant_client())
+        vector_db._async_qdrant_client = ThreadedAsyncQdrant(vector_db._qdrant_client)
+    client = vector_db.get_qdrant_client()
+    if client.collection_exists(settings.QDRANT_COLLECTION_NAME):
+        client.delete_collection(settings.QDRANT_COLLECTION_NAME)
+
+    if args.embeddings == "fake":
+        vector_db._embedding_function = FakeEmbeddings(size=384)
+    agent_service._llm = FakeChatModel(latency_ms=args.llm_latency_ms)
+
+    workers = IngestionWorkers(settings.INGEST_MAX_WORKERS)
+    ingestion_worker.enqueue_job = workers.submit
+
+    sink = SmtpSink(free_port())
+    settings.SMTP_SERVER, settings.SMTP_PORT = "127.0.0.1", sink.controller.port
+
+    # The loop monitor runs on the server's event loop, around the app's own lifespan
+    monitor = LoopMonitor()
+    app_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        monitor.start()
+        async with app_lifespan(app) as state:
+            yield state
+        await monitor.stop()
+
+    app.router.lifespan_context = lifespan
+    return monitor, workers, sink
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    deadline = time.time() + 60
+    while not server.started:
+        if not thread.is_alive() or time.time() > deadline:
+            raise RuntimeError("The API server did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+# TRAFFIC
+class Traffic:
+    """Builds the request of each operation from a seeded RNG, so every run sends the same requests."""
+
+    def __init__(self, seed: int, upload_paragraphs: int):
+        self.rng = random.Random(seed)
+        self.upload_paragraphs = upload_paragraphs
+        self.words = [word for words in TOPICS.values() for word in words.split()]
+        self.uploads = 0
+        self.bookings = 0
+        self.confirmed_bookings = 0 # accepted booking requests, each sends one email
+
+    def question(self) -> str:
+        return self.rng.choice(QUESTIONS).format(word=self.rng.choice(self.words))
+
+    def booking(self) -> str:
+        self.bookings += 1
+        n = self.bookings
+        day, hour = 1 + n % 28, 9 + n % 8
+        return f"Please book an interview for Load User {n}, email user{n}@example.com, on 2026-11-{day:02d} at {hour}:30."
+
+    def upload(self) -> tuple[str, bytes]:
+        self.uploads += 1
+        return f"load_{self.uploads}.txt", synthetic_text(self.rng, self.upload_paragraphs).encode("utf-8")
+
+
+async def send(client: httpx.AsyncClient, traffic: Traffic, operation: str, session_id: str) -> tuple[str, str | None]:
+    """Sends one request. Returns its outcome ("ok", "rejected" or "error") and the job ID of an upload."""
+    if operation == "upload":
+        file_name, content = traffic.upload()
+        response = await client.post("/api/ingest/upload", files={"file": (file_name, content, "text/plain")})
+        job_id = response.json()["job_id"] if response.is_success else None
+        return _outcome(response, response.is_success), job_id
+    query = traffic.booking() if operation == "booking" else traffic.question()
+    response = await client.post("/api/agent/chat", json={"session_id": session_id, "query": query})
+    ok = response.is_success and not response.json().get("response", "").startswith("Error")
+    return _outcome(response, ok), None
+
+
+def _outcome(response: httpx.Response, ok: bool) -> str:
+    # Admission control answers overload with 429 (retry later) and missed deadlines with 504
+    if response.status_code in (429, 504):
+        return "rejected"
+    return "ok" if ok else "error"
+
+
+async def run_level(client, traffic: Traffic, args, concurrency: int, monitor: LoopMonitor, workers: IngestionWorkers) -> dict:
+    results = {operation: {"latencies": [], "errors": 0, "rejected": 0} for operation in OPERATIONS}
+    operations, weights = zip(*args.mix.items())
+    plan = traffic.rng.choices(operations, weights, k=args.requests)
+    job_ids = []
+    next_request = 0
+
+    async def user(n: int):
+        nonlocal next_request
+        session_id = f"load-{concurrency}-{n}"
+        while next_request < len(plan):
+            operation = plan[next_request]
+            next_request += 1
+            start = time.perf_counter()
+            try:
+                outcome, job_id = await send(client, traffic, operation, session_id)
+            except httpx.HTTPError:
+                outcome, job_id = "error", None
+            results[operation]["latencies"].append(time.perf_counter() - start)
+            if operation == "booking" and outcome == "ok":
+                traffic.confirmed_bookings += 1
+            if outcome == "error":
+                results[operation]["errors"] += 1
+            elif outcome == "rejected":
+                results[operation]["rejected"] += 1
+            if job_id:
+                job_ids.append(job_id)
+
+    monitor.reset()
+    workers.reset()
+    cpu_start, wall_start = _cpu_seconds(), time.perf_counter()
+    await asyncio.gather(*(user(n) for n in range(concurrency)))
+    seconds = time.perf_counter() - wall_start
+    lags = monitor.reset()
+    cpu = _cpu_seconds() - cpu_start
+
+    ingestion = await wait_for_jobs(client, job_ids, args.job_timeout)
+    ingestion["worker_utilization"] = round(workers.busy_seconds / (workers.workers * (time.perf_counter() - wall_start)), 3)
+    ingestion["max_queue_depth"] = workers.max_queue_depth
+
+    all_latencies = [latency for result in results.values() for latency in result["latencies"]]
+    errors = sum(result["errors"] for result in results.values())
+    rejected = sum(result["rejected"] for result in results.values())
+    return {
+        "concurrency": concurrency,
+        "requests": len(all_latencies),
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(len(all_latencies) / seconds, 2),
+        # Successful requests only: rejections are fast, they don't count as served
+        "goodput_rps": round((len(all_latencies) - errors - rejected) / seconds, 2),
+        "errors": errors,
+        "error_rate": round(errors / len(all_latencies), 4) if all_latencies else 0.0,
+        "rejected": rejected,
+        "rejection_rate": round(rejected / len(all_latencies), 4) if all_latencies else 0.0,
+        **(latency_summary(all_latencies) if all_latencies else {}),
+        "operations": {
+            operation: {
+                "requests": len(result["latencies"]),
+                "throughput_rps": round(len(result["latencies"]) / seconds, 2),
+                "errors": result["errors"],
+                "error_rate": round(result["errors"] / len(result["latencies"]), 4),
+                "rejected": result["rejected"],
+                "rejection_rate": round(result["rejected"] / len(result["latencies"]), 4),
+                **latency_summary(result["latencies"]),
+            }
+            for operation, result in results.items() if result["latencies"]
+        },
+        "ingestion": ingestion,
+        "saturation": {
+            "event_loop_lag": latency_summary(lags) if lags else {},
+            "event_loop_lag_max_ms": round(max(lags, default=0.0) * 1000, 3),
+            # Includes the ingestion threads, 1.0 is one core fully busy
+            "api_process_cpu": round(cpu / seconds, 3),
+        },
+    }
+
+
+async def wait_for_jobs(client: httpx.AsyncClient, job_ids: list[str], timeout: float) -> dict:
+    """Polls the uploaded jobs until they finish and returns their end-to-end ingestion times."""
+    pending, statuses, durations = set(job_ids), {}, []
+    deadline = time.perf_counter() + timeout
+    while pending and time.perf_counter() < deadline:
+        for job_id in list(pending):
+            job = (await client.get(f"/api/ingest/jobs/{job_id}")).json()
+            if job["status"] in ("completed", "failed"):
+                pending.discard(job_id)
+                statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+                if job.get("created_at") and job.get("finished_at"):
+                    durations.append(_timestamp(job["finished_at"]) - _timestamp(job["created_at"]))
+        if pending:
+            await asyncio.sleep(0.2)
+    return {
+        "jobs": len(job_ids),
+        "completed": statuses.get("completed", 0),
+        "failed": statuses.get("failed", 0),
+        "unfinished": len(pending),
+        "end_to_end": latency_summary(durations) if durations else {},
+    }
+
+
+async def wait_for_emails(sink: SmtpSink, expected: int, timeout: float) -> dict:
+    deadline = time.perf_counter() + timeout
+    while sink.received < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.2)
+    return {"bookings": expected, "received_by_smtp": sink.received}
+
+
+async def seed_corpus(client: httpx.AsyncClient, traffic: Traffic, files: int, timeout: float):
+    job_ids = []
+    for _ in range(files):
+        file_name, content = traffic.upload()
+        response = await client.post("/api/ingest/upload", files={"file": (file_name, content, "text/plain")})
+        response.raise_for_status()
+        job_ids.append(response.json()["job_id"])
+    result = await wait_for_jobs(client, job_ids, timeout)
+    print(f"Seeded {result['completed']} of {files} files")
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Regressions of p95 latency, throughput or error rate against a baseline report, per level and operation."""
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in report["levels"]:
+        base_level = baseline_levels.get(level["concurrency"])
+        if base_level is None:
+            continue
+        for operation, current in level["operations"].items():
+            base = base_level["operations"].get(operation)
+            if base is None:
+                continue
+            name = f"c={level['concurrency']} {operation}"
+            if current["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+                regressions.append(f"{name}: p95 {current['p95_ms']:.1f}ms vs {base['p95_ms']:.1f}ms")
+            if current["throughput_rps"] < base["throughput_rps"] * (1 - max_regression):
+                regressions.append(f"{name}: throughput {current['throughput_rps']} vs {base['throughput_rps']} req/s")
+            if current["error_rate"] > base["error_rate"] + 0.01:
+                regressions.append(f"{name}: error rate {current['error_rate']:.2%} vs {base['error_rate']:.2%}")
+    return regressions
+
+
+async def drive(args, sink: SmtpSink, monitor: LoopMonitor, workers: IngestionWorkers, port: int) -> dict:
+    traffic = Traffic(args.seed, args.upload_paragraphs)
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout, limits=limits) as client:
+        await seed_corpus(client, traffic, args.seed_files, args.job_timeout)
+        levels = []
+        for concurrency in args.concurrency:
+            level = await run_level(client, traffic, args, concurrency, monitor, workers)
+            levels.append(level)
+            breakdown = ", ".join(
+                f"{operation} p95 {stats['p95_ms']:.0f}ms ({stats['error_rate']:.1%} errors, {stats['rejection_rate']:.1%} rejected)"
+                for operation, stats in level["operations"].items()
+            )
+            print(
+                f"[concurrency={concurrency}] {level['throughput_rps']} req/s, p50 {level['p50_ms']:.0f}ms,"
+                f" p99 {level['p99_ms']:.0f}ms, loop lag max {level['saturation']['event_loop_lag_max_ms']:.0f}ms ({breakdown})"
+            )
+        emails = await wait_for_emails(sink, traffic.confirmed_bookings, args.job_timeout)
+    return {"levels": levels, "emails": emails}
+
+
+def run(args) -> dict:
+    from main import app
+
+    monitor, workers, sink = install_stand_ins(args, app)
+    sink.controller.start()
+    port = free_port()
+    server, thread = start_server(app, port)
+    try:
+        results = asyncio.run(drive(args, sink, monitor, workers, port))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=30)
+        sink.controller.stop()
+        workers.executor.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(SQLITE_PATH):
+            os.remove(SQLITE_PATH)
+
+    return {
+        "benchmark": "load",
+        "environment": environment(),
+        "config": {
+            **{k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            "database": metadata_db.engine.url.get_backend_name(),
+            "qdrant": args.qdrant_url or settings.QDRANT_LOCATION,
+            "ingest_max_workers": settings.INGEST_MAX_WORKERS,
+        },
+        **results,
+    }
+
+
+def _cpu_seconds() -> float:
+    times = os.times()
+    return times.user + times.system
+
+
+def _timestamp(value: str) -> float:
+    from datetime import datetime
+    return datetime.fromisoformat(value).timestamp()
+
+
+def mix(value: str) -> dict[str, float]:
+    weights = {}
+    for part in value.split(","):
+        operation, weight = part.split("=")
+        if operation.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation: {operation}. Available: {', '.join(OPERATIONS)}")
+        weights[operation.strip()] = float(weight)
+    return weights
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the chat and ingestion APIs against local stand-ins.")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32], help="Concurrent virtual users per level")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--mix", type=mix, default=mix("chat=0.7,booking=0.1,upload=0.2"), help="Operation weights")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Latency of each fake chat model call")
+    parser.add_argument("--upload-paragraphs", type=int, default=20, help="Paragraphs per uploaded file")
+    parser.add_argument("--seed-files", type=int, default=10, help="Files ingested before the first level")
+    parser.add_argument("--embeddings", choices=["model", "fake"], default="fake")
+    parser.add_argument("--qdrant-url", help="Use a Qdrant server instead of the in-memory stand-in")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Request timeout in seconds")
+    parser.add_argument("--job-timeout", type=float, default=300.0, help="Seconds to wait for ingestion jobs and emails")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Tolerated relative regression, 0.2 = 20%%")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Result file. Defaults to benchmarks/results/load_<time>.json")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.max_regression)
+    write_results("load", report, args.output)
+    if report.get("regressions"):
+        print("Performance regressions against the baseline:")
+        for regression in report["regressions"]:
+            print(f"  {regression}")
+        sys.exit(1)
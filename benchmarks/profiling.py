@@ -0,0 +1,83 @@
+"""
+Profilers for the benchmarks, both writing output that flame graph tools read.
+
+- "cprofile" writes a pstats file (snakeviz, flameprof, `python -m pstats`).
+- "sample" takes a stack snapshot of every thread at a fixed interval and
+  writes collapsed stacks ("frame;frame;frame count" per line), the input
+  format of flamegraph.pl, speedscope and inferno.
+"""
+import cProfile
+import collections
+import contextlib
+import os
+import sys
+import threading
+
+# Helper threads of the benchmarks themselves, left out of the samples
+IGNORED_THREADS = {"stack-sampler", "rss-sampler"}
+
+
+class StackSampler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or names.get(thread_id) in IGNORED_THREADS:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def write_collapsed(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextlib.contextmanager
+def profile(mode: str | None, output_prefix: str):
+    """Profiles the block with `mode` (None, "cprofile" or "sample") and writes the result next to `output_prefix`."""
+    if mode is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(output_prefix) or ".", exist_ok=True)
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output_prefix + ".prof")
+            print(f"Profile written to {output_prefix}.prof")
+    elif mode == "sample":
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            sampler.write_collapsed(output_prefix + ".collapsed")
+            print(f"Collapsed stacks written to {output_prefix}.collapsed")
+    else:
+        raise ValueError(f"Unsupported profiler: {mode}")
@@ -0,0 +1,237 @@
+"""
+Retrieval benchmark: recall@k against latency and throughput for different
+corpus sizes and index settings.
+
+For every corpus size a clustered synthetic corpus is generated (or loaded from
+a .npy file) and exact nearest neighbours are computed with NumPy as ground
+truth. Every build configuration (HNSW m / ef_construct, quantization) gets its
+own collection, which is then searched with every search-time ef and limit.
+
+    python -m benchmarks.retrieval --sizes 1000,10000,100000 --ef 32,64,128,256
+    python -m benchmarks.retrieval --url http://localhost:6333 --sizes 1000000
+
+Local mode (the default) always does an exact scan, so the HNSW and
+quantization settings only change the results when running against a Qdrant
+server with --url. Memory is the RSS of this process and is therefore only
+meaningful in local mode.
+"""
+import argparse
+import dataclasses
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from app.db.index_profiles import IndexProfile
+from benchmarks.common import (
+    current_rss_mb, environment, int_list, latency_summary, peak_rss_mb, str_list, write_results,
+)
+
+COLLECTION_PREFIX = "benchmark_retrieval"
+UPLOAD_BATCH_SIZE = 1024
+GROUND_TRUTH_BLOCK = 100_000
+
+
+def generate_corpus(size: int, dim: int, seed: int, clusters: int = 256, spread: float = 0.35) -> np.ndarray:
+    """Normalized vectors around random centroids, which resembles real embeddings more than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, GROUND_TRUTH_BLOCK):
+        end = min(start + GROUND_TRUTH_BLOCK, size)
+        assignment = rng.integers(0, clusters, end - start)
+        vectors[start:end] = centroids[assignment] + spread * rng.standard_normal((end - start, dim), dtype=np.float32)
+    return _normalize(vectors)
+
+
+def generate_queries(corpus: np.ndarray, count: int, seed: int, noise: float = 0.1) -> np.ndarray:
+    """Perturbed copies of random corpus vectors, so every query has close neighbours."""
+    rng = np.random.default_rng(seed + 1)
+    picked = corpus[rng.integers(0, len(corpus), count)]
+    return _normalize(picked + noise * rng.standard_normal(picked.shape, dtype=np.float32))
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Top-k ids by cosine similarity, computed block by block to bound memory."""
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(corpus), GROUND_TRUTH_BLOCK):
+        scores = queries @ corpus[start:start + GROUND_TRUTH_BLOCK].T
+        ids = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_ids, order, axis=1)
+
+
+def build_collection(client: QdrantClient, name: str, profile: IndexProfile, corpus: np.ndarray) -> dict:
+    if client.collection_exists(name):
+        client.delete_collection(name)
+
+    rss_before = current_rss_mb()
+    start_time = time.perf_counter()
+    client.create_collection(
+        collection_name=name,
+        vectors_config=profile.vectors_config(corpus.shape[1]),
+        hnsw_config=profile.hnsw_config(),
+        quantization_config=profile.quantization_config(),
+        # Build the HNSW graph right away, even for small corpora
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1),
+    )
+    client.upload_collection(
+        collection_name=name,
+        vectors=corpus,
+        ids=range(len(corpus)),
+        batch_size=UPLOAD_BATCH_SIZE,
+        wait=True,
+    )
+    upload_seconds = time.perf_counter() - start_time
+    _wait_until_indexed(client, name)
+    return {
+        "upload_seconds": round(upload_seconds, 3),
+        "build_seconds": round(time.perf_counter() - start_time, 3),
+        "rss_delta_mb": round(current_rss_mb() - rss_before, 1),
+    }
+
+
+def _wait_until_indexed(client: QdrantClient, name: str, timeout: float = 3600.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if client.get_collection(name).status == models.CollectionStatus.GREEN:
+            return
+        time.sleep(0.5)
+    raise TimeoutError(f"Collection '{name}' was not indexed within {timeout:.0f}s")
+
+
+def search(client: QdrantClient, name: str, query: np.ndarray, limit: int, params: models.SearchParams | None):
+    return client.query_points(
+        collection_name=name, query=query.tolist(), limit=limit, search_params=params, with_payload=False
+    ).points
+
+
+def measure_search(
+    client: QdrantClient,
+    name: str,
+    queries: np.ndarray,
+    truth: np.ndarray,
+    limit: int,
+    params: models.SearchParams | None,
+    concurrency_levels: list[int],
+) -> dict:
+    # Warm-up, so lazy loading doesn't end up in the percentiles
+    for query in queries[:10]:
+        search(client, name, query, limit, params)
+
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start_time = time.perf_counter()
+        points = search(client, name, query, limit, params)
+        latencies.append(time.perf_counter() - start_time)
+        recalls.append(len({p.id for p in points} & set(expected[:limit].tolist())) / limit)
+
+    throughput = {}
+    for concurrency in concurrency_levels:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            start_time = time.perf_counter()
+            list(pool.map(lambda q: search(client, name, q, limit, params), queries))
+            throughput[str(concurrency)] = round(len(queries) / (time.perf_counter() - start_time), 1)
+
+    return {
+        f"recall@{limit}": round(float(np.mean(recalls)), 4),
+        **latency_summary(latencies),
+        "qps_by_concurrency": throughput,
+    }
+
+
+def run(args) -> dict:
+    client = QdrantClient(url=args.url) if args.url else QdrantClient(path=args.path) if args.path else QdrantClient(":memory:")
+    mode = "server" if args.url else "local"
+    if mode == "local":
+        print("Local mode does an exact scan: HNSW and quantization settings are recorded but have no effect.")
+
+    loaded = np.load(args.corpus).astype(np.float32) if args.corpus else None
+    quantizations = [None if q == "none" else q for q in args.quantization]
+    runs = []
+    for size in args.sizes:
+        if loaded is not None:
+            if size > len(loaded):
+                print(f"Skipping size {size}: the corpus file has only {len(loaded)} vectors.")
+                continue
+            corpus = _normalize(loaded[:size])
+        else:
+            corpus = generate_corpus(size, args.dim, args.seed)
+        queries = generate_queries(corpus, args.queries, args.seed)
+
+        start_time = time.perf_counter()
+        truth = exact_neighbours(corpus, queries, max(args.limit))
+        print(f"[{size} vectors] Ground truth computed in {time.perf_counter() - start_time:.1f}s.")
+
+        for m, ef_construct, quantization in itertools.product(args.m, args.ef_construct, quantizations):
+            profile = IndexProfile(
+                "benchmark", hnsw_m=m, hnsw_ef_construct=ef_construct,
+                quantization=quantization, oversampling=args.oversampling,
+                on_disk_vectors=args.on_disk,
+            )
+            name = f"{COLLECTION_PREFIX}_{size}_{m}_{ef_construct}_{quantization or 'none'}"
+            build = build_collection(client, name, profile, corpus)
+            print(f"[{size} vectors] m={m} ef_construct={ef_construct} quantization={quantization}: built in {build['build_seconds']}s")
+
+            for ef, limit in itertools.product(args.ef, args.limit):
+                params = dataclasses.replace(profile, search_ef=ef).search_params()
+                result = measure_search(client, name, queries, truth, limit, params, args.concurrency)
+                runs.append({
+                    "size": size, "dim": corpus.shape[1], "m": m, "ef_construct": ef_construct,
+                    "quantization": quantization, "oversampling": args.oversampling,
+                    "on_disk": args.on_disk, "ef": ef, "limit": limit,
+                    **build, **result,
+                })
+                print(f"    ef={ef} limit={limit}: recall@{limit}={result[f'recall@{limit}']} p95={result['p95_ms']}ms")
+
+            if not args.keep_collections:
+                client.delete_collection(name)
+
+    return {
+        "benchmark": "retrieval",
+        "environment": environment(),
+        "qdrant_mode": mode,
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "runs": runs,
+    }
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark recall@k against latency for Qdrant index settings.")
+    parser.add_argument("--sizes", type=int_list, default=[1000, 10000], help="Comma-separated corpus sizes")
+    parser.add_argument("--dim", type=int, default=384, help="Vector size (all-MiniLM-L6-v2 produces 384)")
+    parser.add_argument("--corpus", help="Optional .npy file with real embeddings instead of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--m", type=int_list, default=[16])
+    parser.add_argument("--ef-construct", type=int_list, default=[100])
+    parser.add_argument("--ef", type=int_list, default=[32, 64, 128, 256], help="Search-time ef values")
+    parser.add_argument("--quantization", type=str_list, default=["none"], help="Any of none,scalar,binary")
+    parser.add_argument("--oversampling", type=float, default=2.0)
+    parser.add_argument("--on-disk", action="store_true", help="Store the original vectors on disk")
+    parser.add_argument("--limit", type=int_list, default=[5, 10])
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8])
+    parser.add_argument("--url", help="Qdrant server URL. Without it an in-process local Qdrant is used")
+    parser.add_argument("--path", help="Directory for an on-disk local Qdrant instead of :memory:")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep-collections", action="store_true")
+    parser.add_argument("--output", help="Result file. Defaults to benchmarks/results/retrieval_<time>.json")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    write_results("retrieval", run(args), args.output)
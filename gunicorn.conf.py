@@ -0,0 +1,30 @@
+# Production server: gunicorn -c gunicorn.conf.py main:app
+#
+# The app and the embedding model are loaded once in the master process and the
+# workers are forked from it, so every worker shares the same model weights
+# (copy-on-write) instead of loading its own copy.
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 120
+
+# Import main:app in the master before forking
+preload_app = True
+
+
+def on_starting(server):
+    from app.core import startup
+    from app.core.config import settings
+
+    if settings.PRELOAD_EMBEDDING_MODEL:
+        startup.preload_embedding_model()
+
+
+def when_ready(server):
+    # Move everything loaded so far to a permanent GC generation. The collector
+    # then never writes to those objects, which would copy their pages in each worker.
+    gc.freeze()
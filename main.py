@@ -1,25 +1,56 @@
-from fastapi import FastAPI
+import time
+_import_start = time.perf_counter()
+
+from fastapi import FastAPI, Response
 from contextlib import asynccontextmanager
+from app.core import admission, metrics, startup
+from app.core.config import settings
 from app.db import vector_db, metadata_db
 from app.api.router import api_router
+from app.services import email_outbox, ingestion_worker
+
+startup.record("imports", time.perf_counter() - _import_start)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # This runs on startup
     print("Initializing databases...")
-    metadata_db.init_db()
-    vector_db.init_db()
+    with startup.timed("init_databases"):
+        metadata_db.init_db()
+        vector_db.init_db()
     print("Databases initialized.")
+    if settings.EMBEDDING_WARMUP:
+        startup.warm_up_embedding_model()
+    ingestion_worker.resume_pending_jobs()
+    email_outbox.start()
+    startup.report()
     
     yield 
 
     print("Application is shutting down.")
+    await email_outbox.stop()
+    ingestion_worker.shutdown()
+    await metadata_db.dispose_async_engine()
 
 # Pass the lifespan manager to the FastAPI app instance
 app = FastAPI(title="Palm Mind Technology Assessment", lifespan=lifespan)
 
+# Uploads take their admission slot and are size-checked before their body is read
+app.add_middleware(
+    admission.UploadAdmission,
+    limiter=admission.upload_limiter,
+    max_bytes=settings.INGEST_MAX_REQUEST_BYTES,
+    path_prefix="/api/ingest/",
+)
+
 app.include_router(api_router, prefix="/api") 
 
 @app.get("/")
 def read_root():
-    return {"message": "Welcome to the RAG Agent API"}
\ No newline at end of file
+    return {"message": "Welcome to the RAG Agent API"}
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    # Prometheus scrape endpoint: per-stage latency histograms for ingestion and chat
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
\ No newline at end of file
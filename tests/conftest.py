@@ -0,0 +1,63 @@
+import os
+import tempfile
+
+import pytest
+
+# The settings are read when app.core.config is imported: point them at a throwaway SQLite
+# database and in-memory Qdrant before any test module imports the app.
+_data_dir = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_data_dir}/test.db",
+    QDRANT_LOCATION=":memory:",
+    QDRANT_HOST="localhost",
+    QDRANT_PORT="6333",
+    QDRANT_COLLECTION_NAME="test",
+    REDIS_URL="redis://localhost:6379/15",
+    GOOGLE_API_KEY="test",
+    SMTP_SERVER="localhost",
+    SMTP_PORT="25",
+    SMTP_SENDER_EMAIL="test@example.com",
+    SMTP_SENDER_PASSWORD="",
+    INGEST_SPOOL_DIR=os.path.join(_data_dir, "uploads"),
+)
+
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables."""
+    from app.db import metadata_db
+    from app.db.models import Base
+
+    Base.metadata.drop_all(bind=metadata_db.engine)
+    metadata_db.init_db()
+    session = metadata_db.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_job(db):
+    """Inserts an ingestion job, queued unless given other column values."""
+    import uuid
+    from app.db.models import IngestionJob
+
+    def make(**columns):
+        job = IngestionJob(**{
+            "id": str(uuid.uuid4()),
+            "file_name": "report.txt",
+            "file_type": "text/plain",
+            "file_path": "/nonexistent/report.txt",
+            "chunking_strategy": "recursive",
+            "status": "queued",
+            "stage": "queued",
+            "stage_progress": {},
+            "attempts": 0,
+            **columns,
+        })
+        db.add(job)
+        db.commit()
+        return job
+
+    return make
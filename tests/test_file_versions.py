@@ -0,0 +1,84 @@
+import pytest
+
+from app.db import metadata_db, vector_db
+from app.db.models import Chunk, FileMetadata
+from app.services import ingestion_worker
+
+
+@pytest.fixture
+def ready_file(db):
+    db_file = metadata_db.save_file_metadata(
+        db, "report.txt", "recursive", vector_db.EMBEDDING_MODEL_ID, document_key="reports/report.txt"
+    )
+    metadata_db.complete_file_version(db, db_file, 1, chunks_added=2, chunks_removed=0, content_hash="a" * 64)
+    return db_file
+
+
+def _add_chunks(db, file_id: int, version: int, point_ids: list[str]):
+    metadata_db.bulk_insert_chunks(db, [
+        {
+            "file_id": file_id,
+            "version": version,
+            "chunk_index": index,
+            "point_id": point_id,
+            "content_hash": point_id,
+            "char_count": 10,
+        }
+        for index, point_id in enumerate(point_ids)
+    ])
+
+
+def _chunk_versions(db, file_id: int) -> list[int]:
+    return sorted(version for (version,) in db.query(Chunk.version).filter(Chunk.file_id == file_id))
+
+
+def test_same_content_is_unchanged(ready_file, make_job):
+    job = make_job(chunking_strategy="recursive")
+
+    assert ingestion_worker._is_unchanged(ready_file, job, "a" * 64)
+
+
+@pytest.mark.parametrize("change", [
+    {"content_hash": "b" * 64},
+    {"chunking_strategy": "semantic"},
+    {"embedding_model": "another-model"},
+    {"status": "processing"},
+])
+def test_any_change_is_reingested(db, ready_file, make_job, change):
+    job = make_job(chunking_strategy=change.pop("chunking_strategy", "recursive"))
+    for key, value in change.items():
+        setattr(ready_file, key, value)
+
+    assert not ingestion_worker._is_unchanged(ready_file, job, "a" * 64)
+
+
+def test_stale_points_are_the_ones_the_new_version_dropped(db, ready_file):
+    _add_chunks(db, ready_file.id, 1, ["p1", "p2", "p3"])
+    _add_chunks(db, ready_file.id, 2, ["p1", "p3", "p4"])
+
+    assert metadata_db.stale_point_ids(db, ready_file.id, 2) == ["p2"]
+
+
+def test_discarding_a_new_version_keeps_the_previous_one(db, ready_file, make_job):
+    _add_chunks(db, ready_file.id, 1, ["p1", "p2"])
+    _add_chunks(db, ready_file.id, 2, ["p1", "p3"])
+    job = make_job(file_id=ready_file.id)
+
+    ingestion_worker._discard_version(db, job, ready_file, 2)
+
+    assert _chunk_versions(db, ready_file.id) == [1, 1]
+    assert db.get(FileMetadata, ready_file.id).status == "ready"
+    assert job.file_id == ready_file.id
+
+
+def test_discarding_a_first_version_removes_the_file(db, make_job):
+    db_file = metadata_db.save_file_metadata(db, "report.txt", "recursive", vector_db.EMBEDDING_MODEL_ID)
+    _add_chunks(db, db_file.id, 1, ["p1"])
+    job = make_job(file_id=db_file.id)
+
+    ingestion_worker._discard_version(db, job, db_file, 1)
+
+    assert db.get(FileMetadata, db_file.id) is None
+    assert _chunk_versions(db, db_file.id) == []
+    db.expire_all()
+    assert job.file_id is None
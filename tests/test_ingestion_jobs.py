@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.config import settings
+from app.db import metadata_db
+from app.services import ingestion_worker
+
+
+def _in(seconds: float) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+
+def test_claim_leases_the_job(db, make_job):
+    job = make_job()
+
+    claimed = metadata_db.claim_ingestion_job(db, job.id, "host:1", lease_seconds=60)
+
+    assert claimed.status == "running"
+    assert claimed.attempts == 1
+    assert claimed.claimed_by == "host:1"
+    assert metadata_db.claim_ingestion_job(db, job.id, "host:2", lease_seconds=60) is None
+
+
+def test_claim_waits_for_the_retry_backoff(db, make_job):
+    job = make_job(not_before=_in(60))
+
+    assert metadata_db.claim_ingestion_job(db, job.id, "host:1", lease_seconds=60) is None
+    assert metadata_db.seconds_until_due(job) > 50
+
+
+def test_only_the_lease_holder_renews(db, make_job):
+    job = make_job()
+    metadata_db.claim_ingestion_job(db, job.id, "host:1", lease_seconds=60)
+
+    assert metadata_db.renew_job_lease(db, job.id, "host:1", lease_seconds=60)
+    assert not metadata_db.renew_job_lease(db, job.id, "host:2", lease_seconds=60)
+
+
+def test_reclaims_only_expired_leases(db, make_job):
+    live = make_job(status="running", attempts=1, claimed_by="host:1", lease_expires_at=_in(60))
+    expired = make_job(status="running", attempts=1, claimed_by="host:2", lease_expires_at=_in(-1))
+
+    assert metadata_db.reclaim_expired_jobs(db, stale_after_seconds=600) == [expired.id]
+    # Reclaimed once: a second reaper finds nothing
+    assert metadata_db.reclaim_expired_jobs(db, stale_after_seconds=600) == []
+
+    db.expire_all()
+    assert live.status == "running"
+    assert expired.status == "queued"
+    assert expired.claimed_by is None
+
+
+def test_reclaims_running_jobs_without_a_lease_once_stale(db, make_job):
+    stale = make_job(status="running", attempts=1, updated_at=datetime.now(timezone.utc) - timedelta(hours=1))
+    recent = make_job(status="running", attempts=1)
+
+    assert metadata_db.reclaim_expired_jobs(db, stale_after_seconds=600) == [stale.id]
+    db.expire_all()
+    assert recent.status == "running"
+
+
+@pytest.fixture
+def failing_job(monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "INGEST_RETRY_BACKOFF_SECONDS", 30.0)
+
+    def fail(db, job):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(ingestion_worker, "_process_job", fail)
+
+
+def test_failed_attempt_is_requeued_with_a_backoff(db, make_job, failing_job):
+    job = make_job()
+
+    retry_after = ingestion_worker.run_ingestion_job(job.id)
+
+    assert retry_after == 30.0
+    db.expire_all()
+    assert job.status == "queued"
+    assert job.error == "boom"
+    assert job.claimed_by is None and job.lease_expires_at is None
+    assert 0 < metadata_db.seconds_until_due(job) <= 30
+    # Handed over again too early: nothing runs, the remaining backoff is returned
+    assert ingestion_worker.run_ingestion_job(job.id) > 0
+    db.expire_all()
+    assert job.attempts == 1
+
+
+def test_job_fails_after_the_last_retry(db, make_job, failing_job):
+    job = make_job(attempts=1)
+
+    assert ingestion_worker.run_ingestion_job(job.id) is None
+    db.expire_all()
+    assert job.status == "failed"
+    assert job.attempts == 2
+    assert job.finished_at is not None
+
+
+def test_crashed_worker_counts_as_a_failed_attempt(db, make_job, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_MAX_RETRIES", 3)
+    job = make_job(status="running", attempts=1, claimed_by="host:1", lease_expires_at=_in(60))
+    monkeypatch.setattr(ingestion_worker, "_worker_is_alive", lambda worker_id: False)
+    monkeypatch.setattr(ingestion_worker, "_replace_broken_executor", lambda broken: None)
+    enqueued = []
+    monkeypatch.setattr(ingestion_worker, "enqueue_job", lambda job_id, delay=0: enqueued.append((job_id, delay)))
+    monkeypatch.setattr(ingestion_worker, "_executor", object())
+
+    ingestion_worker._recover_job(job.id, broken=None)
+
+    db.expire_all()
+    assert job.status == "queued"
+    assert job.error == "The worker process running the job died."
+    assert enqueued and enqueued[0][0] == job.id and enqueued[0][1] > 0
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from app.api.endpoints import ingestion
+from app.core.config import Settings, settings
+from app.db import metadata_db
+
+
+@pytest.fixture
+def pending_jobs(monkeypatch):
+    """Sets how many jobs the queue holds, without a database."""
+    monkeypatch.setattr(settings, "INGEST_MAX_PENDING_JOBS", 100)
+    monkeypatch.setattr(settings, "INGEST_BULK_MAX_FILES", 20)
+
+    def set_count(count: int):
+        async def acount_pending_jobs(db):
+            return count
+
+        monkeypatch.setattr(metadata_db, "acount_pending_jobs", acount_pending_jobs)
+
+    return set_count
+
+
+def test_bulk_limit_cannot_exceed_the_pending_job_limit():
+    with pytest.raises(ValidationError, match="INGEST_BULK_MAX_FILES"):
+        Settings(INGEST_BULK_MAX_FILES=501, INGEST_MAX_PENDING_JOBS=500)
+
+
+def test_pending_jobs_up_to_the_limit_are_accepted(pending_jobs):
+    pending_jobs(90)
+
+    asyncio.run(ingestion._check_pending_jobs(None, 10))
+
+
+def test_pending_jobs_over_the_limit_get_429(pending_jobs):
+    pending_jobs(91)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(ingestion._check_pending_jobs(None, 10))
+    assert error.value.status_code == 429
+    assert "Retry-After" in error.value.headers
+
+
+def test_bulk_upload_is_capped_by_its_own_limit(pending_jobs):
+    pending_jobs(0)
+
+    limit, reason = asyncio.run(ingestion._bulk_capacity(None))
+
+    assert limit == 20
+    assert reason == "over the limit of 20 files per upload"
+
+
+def test_bulk_upload_is_capped_by_the_room_left_in_the_queue(pending_jobs):
+    pending_jobs(95)
+
+    assert asyncio.run(ingestion._bulk_capacity(None)) == (5, "the ingestion queue is full")
+
+
+def test_bulk_upload_into_a_full_queue_gets_429(pending_jobs):
+    pending_jobs(100)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(ingestion._bulk_capacity(None))
+    assert error.value.status_code == 429
+
+
+def test_archive_members_past_the_limit_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_SPOOL_DIR", str(tmp_path / "spool"))
+    os.makedirs(settings.INGEST_SPOOL_DIR)
+    archive_path = tmp_path / "docs.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        for name in ("a.txt", "b.txt", "c.txt", "image.png"):
+            archive.writestr(name, "some text")
+    queued, skipped = [], []
+
+    ingestion._spool_archive_members(str(archive_path), "docs.zip", queued, skipped, 2, "the ingestion queue is full")
+
+    assert [member_name for _, member_name, _, _ in queued] == ["a.txt", "b.txt"]
+    assert sorted(skipped) == ["docs.zip/c.txt (the ingestion queue is full)", "docs.zip/image.png"]
+    assert len(os.listdir(settings.INGEST_SPOOL_DIR)) == 2
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app.core.admission import AdmissionLimiter, UploadAdmission
+
+
+async def _echo_size(request: Request):
+    body = await request.body()
+    return JSONResponse({"received": len(body)})
+
+
+_app = Starlette(routes=[
+    Route("/ingestion/upload", _echo_size, methods=["POST"]),
+    Route("/chat", _echo_size, methods=["POST"]),
+])
+
+
+def _admission(limiter: AdmissionLimiter | None = None) -> UploadAdmission:
+    limiter = limiter or AdmissionLimiter("ingestion", 1, 0, 0.1)
+    return UploadAdmission(_app, limiter, max_bytes=10, path_prefix="/ingestion")
+
+
+def _post(middleware: UploadAdmission, path: str, chunks: list[bytes], content_length: int | None = None):
+    """Sends the body in `chunks` through the middleware, returns the status and JSON body of the response."""
+    headers = [(b"content-type", b"application/octet-stream")]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": headers, "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    starts = [message for message in sent if message["type"] == "http.response.start"]
+    assert len(starts) == 1
+    body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    return starts[0]["status"], json.loads(body)
+
+
+def test_small_upload_passes():
+    middleware = _admission()
+
+    assert _post(middleware, "/ingestion/upload", [b"12345", b"67890"]) == (200, {"received": 10})
+    assert middleware.limiter.active == 0
+
+
+def test_content_length_over_the_limit_is_rejected_before_reading():
+    middleware = _admission()
+
+    status, body = _post(middleware, "/ingestion/upload", [b"x" * 11], content_length=11)
+
+    assert status == 413
+    assert body["detail"] == "The request is larger than 10 bytes."
+
+
+def test_body_without_content_length_is_cut_off_at_the_limit():
+    middleware = _admission()
+
+    status, _ = _post(middleware, "/ingestion/upload", [b"123456", b"789012", b"345"])
+
+    assert status == 413
+    assert middleware.limiter.active == 0
+
+
+def test_understated_content_length_is_cut_off_at_the_limit():
+    middleware = _admission()
+
+    status, _ = _post(middleware, "/ingestion/upload", [b"123456", b"789012"], content_length=5)
+
+    assert status == 413
+
+
+def test_other_paths_are_not_limited():
+    assert _post(_admission(), "/chat", [b"x" * 50]) == (200, {"received": 50})
+
+
+def test_upload_without_a_free_slot_gets_429():
+    limiter = AdmissionLimiter("ingestion", 1, 0, 0.1)
+
+    async def with_slot_taken():
+        await limiter.acquire()
+
+    asyncio.run(with_slot_taken())
+    status, _ = _post(_admission(limiter), "/ingestion/upload", [b"123"])
+
+    assert status == 429